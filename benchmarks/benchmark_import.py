@@ -0,0 +1,49 @@
+#
+# LSST Data Management System
+# Copyright 2016 LSST Corporation.
+#
+# This product includes software developed by the
+# LSST Project (http://www.lsst.org/).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the LSST License Statement and
+# the GNU General Public License along with this program.  If not,
+# see <http://www.lsstcorp.org/LegalNotices/>.
+#
+"""Time to import parts of the package, each in a fresh interpreter
+
+Run with asv from the package root, having set up obs_monocam:
+
+    $ asv run --python=same --bench Import
+"""
+
+
+class ImportSuite:
+    """Import the package and its modules from a cold interpreter"""
+
+    def timeraw_importPackage(self):
+        return "import lsst.obs.monocam"
+
+    def timeraw_importCamera(self):
+        return "import lsst.obs.monocam.monocam"
+
+    def timeraw_importIngest(self):
+        return "import lsst.obs.monocam.ingest"
+
+    def timeraw_importFitsHeader(self):
+        return "import lsst.obs.monocam.fitsHeader"
+
+    def timeraw_importMapper(self):
+        return "from lsst.obs.monocam import MonocamMapper"
+
+    def timeraw_importIsrTask(self):
+        return "from lsst.obs.monocam import MonocamIsrTask"
@@ -0,0 +1,174 @@
+#
+# LSST Data Management System
+# Copyright 2016 LSST Corporation.
+#
+# This product includes software developed by the
+# LSST Project (http://www.lsst.org/).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the LSST License Statement and
+# the GNU General Public License along with this program.  If not,
+# see <http://www.lsstcorp.org/LegalNotices/>.
+#
+"""Speed of the mapper, raw reads, ISR, ingest and suckMetadata, on
+full-size synthetic data (see lsst.obs.monocam.synthetic)
+
+The synthetic repository is written and ingested, and sidecars written for
+its calibrations, once per run (by setup_cache), which takes a minute or
+so.  Run with asv from the package root, having set up obs_monocam:
+
+    $ asv run --python=same --bench benchmark_pipeline
+"""
+import importlib.util
+import itertools
+import os
+import shutil
+import tempfile
+
+import lsst.daf.persistence as dafPersist
+from lsst.utils import getPackageDir
+from lsst.obs.monocam import MonocamMapper, MonocamIsrTask
+from lsst.obs.monocam.ingest import MonocamIngestTask
+from lsst.obs.monocam.synthetic import makeSyntheticData, ingestSyntheticData
+
+NUM_VISITS = 4
+FILTERS = ("SDSSG", "SDSSR")
+
+
+def runIngest(TaskClass, name, args):
+    """Run an ingest task with command-line arguments"""
+    parser = TaskClass.ArgumentParser(name=name)
+    args = parser.parse_args(TaskClass.ConfigClass(), args=args)
+    TaskClass(config=args.config).run(args)
+
+
+def loadScript(name):
+    """Import a script from bin.src as a module"""
+    filename = os.path.join(os.path.dirname(__file__), os.pardir, "bin.src", name + ".py")
+    spec = importlib.util.spec_from_file_location(name, filename)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def setup_cache():
+    """Write and ingest the synthetic repository shared by the benchmarks"""
+    root = os.path.abspath("synthetic")
+    data = makeSyntheticData(root, numVisits=NUM_VISITS, filters=FILTERS, shutter=True)
+    ingestSyntheticData(root, data, sidecars=True)
+    return root, data
+
+
+setup_cache.timeout = 900
+
+
+class MapperSuite:
+    """Construct the mapper and butler"""
+
+    def time_makeMapper(self, cache):
+        root, data = cache
+        MonocamMapper(root=root)
+
+    def time_makeButler(self, cache):
+        root, data = cache
+        dafPersist.Butler(root)
+
+
+class RawReadSuite:
+    """Read raw data through the butler"""
+
+    def setup(self, cache):
+        root, data = cache
+        self.butler = dafPersist.Butler(root)
+
+    def time_rawAmp(self, cache):
+        self.butler.get("raw_amp", visit=1, channel=1)
+
+    def time_rawAmps(self, cache):
+        self.butler.get("raw_amps", visit=1)
+
+    def time_raw(self, cache):
+        self.butler.get("raw", visit=1)
+
+
+class IsrSuite:
+    """Run ISR on a full-size exposure, with bias, dark and flat"""
+    timeout = 300
+
+    def setup(self, cache):
+        root, data = cache
+        config = MonocamIsrTask.ConfigClass()
+        config.load(os.path.join(getPackageDir("obs_monocam"), "config", "isr.py"))
+        config.doWrite = False
+        self.task = MonocamIsrTask(config=config)
+        self.dataRef = dafPersist.Butler(root).dataRef("raw", visit=1)
+
+    def time_runDataRef(self, cache):
+        self.task.runDataRef(self.dataRef)
+
+    def peakmem_runDataRef(self, cache):
+        self.task.runDataRef(self.dataRef)
+
+
+class IngestSuite:
+    """Ingest the raw data into a new repository"""
+    params = [1, 4]
+    param_names = ["numProcesses"]
+    timeout = 300
+
+    def setup(self, cache, numProcesses):
+        self.directory = tempfile.mkdtemp(dir=os.path.dirname(cache[0]))
+        self.counter = itertools.count()
+
+    def teardown(self, cache, numProcesses):
+        shutil.rmtree(self.directory)
+
+    def time_ingest(self, cache, numProcesses):
+        root, data = cache
+        # Each repetition needs a new repository
+        repo = os.path.join(self.directory, str(next(self.counter)))
+        os.mkdir(repo)
+        with open(os.path.join(repo, "_mapper"), "w") as fd:
+            fd.write("lsst.obs.monocam.MonocamMapper\n")
+        runIngest(MonocamIngestTask, "ingest",
+                  [repo] + data.raws + ["--mode", "link", "--config", "numProcesses=%d" % (numProcesses,)])
+
+
+class SuckMetadataSuite:
+    """Read the camera and shutter headers, and match them"""
+
+    def setup(self, cache):
+        root, data = cache
+        self.suckMetadata = loadScript("suckMetadata")
+        self.directory = tempfile.mkdtemp(dir=os.path.dirname(root))
+        self.suckMetadata.createDatabase(self.directory)
+        self.suck("camera", data.raws)
+        self.suck("shutter", data.shutters)
+
+    def teardown(self, cache):
+        shutil.rmtree(self.directory)
+
+    def suck(self, table, filenames):
+        """Read headers into a table, replacing any rows already there"""
+        self.suckMetadata.suckMetadata(self.directory, table, self.suckMetadata.TABLES[table], filenames,
+                                       force=True)
+
+    def time_suckCamera(self, cache):
+        root, data = cache
+        self.suck("camera", data.raws)
+
+    def time_suckShutter(self, cache):
+        root, data = cache
+        self.suck("shutter", data.shutters)
+
+    def time_match(self, cache):
+        self.suckMetadata.matchCameraShutter(self.directory)
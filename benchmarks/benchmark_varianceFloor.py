@@ -0,0 +1,63 @@
+#
+# LSST Data Management System
+# Copyright 2016 LSST Corporation.
+#
+# This product includes software developed by the
+# LSST Project (http://www.lsst.org/).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the LSST License Statement and
+# the GNU General Public License along with this program.  If not,
+# see <http://www.lsstcorp.org/LegalNotices/>.
+#
+"""Speed and accuracy of the estimators of the variance floor
+
+Run with asv from the package root, having set up obs_monocam:
+
+    $ asv run --python=same --bench VarianceFloor
+"""
+import numpy
+
+import lsst.pex.config as pexConfig
+from lsst.obs.monocam.isrFunctions import varianceFloorEstimators
+
+SIGMA = 10.0  # Noise in the synthetic image
+
+
+class EstimatorConfig(pexConfig.Config):
+    varianceFloorStride = pexConfig.Field(dtype=int, default=8, doc="Subsampling stride")
+    varianceFloorBinWidth = pexConfig.Field(dtype=float, default=1.0, doc="Histogram bin width")
+
+
+class VarianceFloorSuite:
+    """Estimate the noise in a full-frame Monocam CCD image"""
+    params = sorted(varianceFloorEstimators)
+    param_names = ["estimator"]
+
+    def setup(self, estimator):
+        rng = numpy.random.RandomState(12345)
+        # Bias-subtracted data: integer-like, with some bright sources
+        self.image = numpy.round(rng.normal(0.0, SIGMA, (4004, 4096))).astype(numpy.float32)
+        for y, x in rng.randint(0, 4000, (300, 2)):
+            self.image[y:y + 5, x:x + 5] += 30000.0
+        self.estimator = varianceFloorEstimators[estimator]
+        self.config = EstimatorConfig()
+
+    def time_estimate(self, estimator):
+        self.estimator(self.image, self.config)
+
+    def peakmem_estimate(self, estimator):
+        self.estimator(self.image, self.config)
+
+    def track_fractionalError(self, estimator):
+        return abs(self.estimator(self.image, self.config)/SIGMA - 1.0)
+    track_fractionalError.unit = "fraction"
@@ -0,0 +1,16 @@
+#!/usr/bin/env python
+
+"""
+Ingest Monocam raw data, parsing the file headers with a pool of processes
+and optionally skipping files ingested by a previous run, e.g.:
+
+    $ ingestMonocam.py DATA raw/*.fits --mode=link \
+          --config numProcesses=8 incremental=True
+
+The arguments are the same as those of ingestImages.py.
+"""
+from lsst.obs.monocam.ingest import MonocamIngestTask
+
+
+if __name__ == "__main__":
+    MonocamIngestTask.parseAndRun()
@@ -0,0 +1,17 @@
+#!/usr/bin/env python
+
+"""
+Ingest Monocam calibrations, parsing the file headers with a pool of
+processes.  Directories are searched for calibrations, so a whole tree can
+be registered at once, e.g.:
+
+    $ ingestMonocamCalibs.py DATA --calib CALIB CALIB --mode=skip \
+          --validity 30 --config numProcesses=8
+
+The arguments are otherwise the same as those of ingestCalibs.py.
+"""
+from lsst.obs.monocam.ingest import MonocamIngestCalibsTask
+
+
+if __name__ == "__main__":
+    MonocamIngestCalibsTask.parseAndRun()
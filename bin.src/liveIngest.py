@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+
+"""
+Ingest Monocam raw data as it arrives during observing. The raw directory
+tree is watched for new files, which are registered within about a second
+of landing on disk, e.g.:
+
+    $ liveIngest.py DATA /data/monocam/raw --mode=link \\
+          --on-visit "runIsr.py DATA --id visit={visit}"
+
+The --on-visit command is run (without waiting for it) for each new visit
+once it has been registered, e.g., to queue it for ISR.
+"""
+import os
+import shlex
+import subprocess
+from argparse import ArgumentParser
+
+from lsst.utils import getPackageDir
+from lsst.obs.monocam.liveIngest import LiveIngestTask
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("root", help="Data repo root")
+    parser.add_argument("directory", help="Root of raw directory tree to watch")
+    parser.add_argument("--mode", choices=("move", "copy", "link", "skip"), default="link",
+                        help="how to put files in the repository")
+    parser.add_argument("--create", action="store_true", help="create the registry")
+    parser.add_argument("--existing", action="store_true", help="ingest files that already exist")
+    parser.add_argument("--on-visit", help="command to run for each new visit; {visit} is replaced")
+    parser.add_argument("--poll", type=float, help="time (sec) between polls of the raw directories")
+    parser.add_argument("--settle", type=float,
+                        help="minimum time (sec) since a file's last modification before it is ingested")
+    parser.add_argument("--batch-size", type=int,
+                        help="maximum number of files to register in a transaction")
+    args = parser.parse_args()
+
+    config = LiveIngestTask.ConfigClass()
+    config.load(os.path.join(getPackageDir("obs_monocam"), "config", "ingest.py"))
+    config.ingestExisting = args.existing
+    for name, value in (("pollInterval", args.poll), ("settleTime", args.settle),
+                        ("batchSize", args.batch_size)):
+        if value is not None:
+            setattr(config, name, value)
+    config.validate()
+
+    def runCommand(dataId):
+        subprocess.Popen(shlex.split(args.on_visit.format(**dataId)))
+    onVisit = runCommand if args.on_visit is not None else None
+
+    task = LiveIngestTask(config=config)
+    task.watch(args.root, args.directory, mode=args.mode, create=args.create, onVisit=onVisit)
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+
+"""
+Write a repository of synthetic, full-size Monocam raw images and
+calibrations, for benchmarking, e.g.:
+
+    $ makeSyntheticMonocam.py SYNTH --visits 16 --filters SDSSG SDSSR
+    $ ingestMonocam.py SYNTH SYNTH/incoming/*.fits --mode=link
+    $ ingestMonocamCalibs.py SYNTH --calib SYNTH \
+          SYNTH/bias SYNTH/dark SYNTH/flat --mode=skip --validity 30
+
+The raw images are written to the "incoming" directory, and the
+calibrations where the mapper expects them.
+"""
+from argparse import ArgumentParser
+import datetime
+
+from lsst.obs.monocam.synthetic import makeSyntheticData
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("root", help="Root of repository to write")
+    parser.add_argument("--visits", type=int, default=4, help="Number of visits")
+    parser.add_argument("--filters", nargs="+", default=["SDSSG"], help="Filters, used in turn")
+    parser.add_argument("--exptime", type=float, default=30.0, help="Exposure time (sec)")
+    parser.add_argument("--start", default="2016-05-04T03:00:00",
+                        help="Start of first exposure (UTC, ISO format)")
+    parser.add_argument("--shutter", action="store_true", help="Also write shutter header files")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for random number generators")
+    args = parser.parse_args()
+
+    data = makeSyntheticData(args.root, numVisits=args.visits, filters=args.filters, expTime=args.exptime,
+                             start=datetime.datetime.strptime(args.start, "%Y-%m-%dT%H:%M:%S"),
+                             shutter=args.shutter, seed=args.seed)
+    print("Wrote %d raw images, %d calibrations and %d shutter header files" %
+          (len(data.raws), len(data.calibs), len(data.shutters)))
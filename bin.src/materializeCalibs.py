@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+
+"""
+The Monocam calibrations (bias, dark and flat) are stored gzipped, so
+every read decompresses a full-frame float image. This script writes an
+uncompressed, memory-mappable copy (a "sidecar") alongside each
+calibration, which the mapper uses in preference to the gzipped file
+when it is present and up to date, e.g.:
+
+    $ materializeCalibs.py DATA/CALIB
+
+Sidecars that are up to date are not rewritten, so the script may be
+re-run after ingesting new calibrations.
+"""
+from argparse import ArgumentParser
+
+from lsst.daf.persistence import Policy
+from lsst.log import Log
+from lsst.obs.monocam.calibSidecar import materializeCalibs
+
+DATASETS = ("bias", "dark", "flat")
+
+
+def getTemplates(datasets):
+    """Return the calibration filename templates from the mapper policy"""
+    policy = Policy(Policy.defaultPolicyFile("obs_monocam", "monocamMapper.yaml", "policy"))
+    return {name: policy["calibrations"][name]["template"] for name in datasets}
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("root", help="Calibration repo root")
+    parser.add_argument("--datasets", nargs="+", default=DATASETS, choices=DATASETS,
+                        help="Calibration dataset types to materialize")
+    parser.add_argument("--force", action="store_true", help="Rewrite sidecars that are up to date")
+    args = parser.parse_args()
+
+    log = Log.getLogger("materializeCalibs")
+    num = materializeCalibs(args.root, getTemplates(args.datasets), force=args.force, log=log)
+    log.info("Wrote %d sidecars" % (num,))
@@ -36,12 +36,31 @@ and the camera files:
 Doing the camera files is not necessary for ingesting and processing
 Monocam data, but it allows you to play around with techniques for
 joining the two tables.
+
+Having done both, you can join them, matching each camera file to the
+shutter file nearest in time (within a tolerance) with a consistent
+exposure time, one-to-one:
+
+    $ suckMetadata.py --root DATA match --tolerance 5 --offset 0
+
+The result is written to the "match" table.
+
+Headers may be read by a pool of processes (--processes). Files that are
+already in the database are skipped, so an interrupted run can simply be
+repeated (use --force to read them again). Files whose headers can't be
+parsed are recorded in the "errors" table.
 """
+import datetime
+import itertools
+import multiprocessing
 import os
 from glob import glob
 import sqlite3
 from argparse import ArgumentParser
-from lsst.afw.image import readMetadata
+
+import numpy
+
+from lsst.obs.monocam.fitsHeader import readPrimaryHeader
 
 
 def extractor(keyword, valueType=str):
@@ -77,47 +96,260 @@ CAMERA = {
 }
 
 
+TABLES = {"shutter": SHUTTER, "camera": CAMERA}
+
+MIN_SQLITE_VERSION = (3, 24, 0)  # For upserts (INSERT ... ON CONFLICT DO UPDATE)
+
+
 def getDatabase(root):
-    return sqlite3.connect(os.path.join(root, "monocam.sqlite"))
+    conn = sqlite3.connect(os.path.join(root, "monocam.sqlite"))
+    # Write-ahead logging allows reading while we write, and is faster
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def checkSqliteVersion():
+    """Check that the SQLite library supports the upserts in writeRows"""
+    if sqlite3.sqlite_version_info < MIN_SQLITE_VERSION:
+        raise RuntimeError("SQLite %s is too old: version %s or later is required" %
+                           (sqlite3.sqlite_version, ".".join(str(vv) for vv in MIN_SQLITE_VERSION)))
 
 
 def createTable(conn, table, columns):
-    cmd = "CREATE TABLE %s (id INTEGER PRIMARY KEY AUTOINCREMENT, filename TEXT, " % table
+    cmd = "CREATE TABLE IF NOT EXISTS %s (id INTEGER PRIMARY KEY AUTOINCREMENT, filename TEXT, " % table
     cmd += ", ".join([("%s %s" % (col, colData[0])) for col, colData in columns.items()])
     cmd += ")"
     conn.execute(cmd)
+    createIndexes(conn, table)
+
+
+def createIndexes(conn, table):
+    """Create the indexes for a table, if they don't already exist
+
+    Databases written before filenames were unique may have several rows
+    for a file; all but the latest (greatest id) are removed, as otherwise
+    the unique index can't be created.
+    """
+    name = "%s_filename" % (table,)
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (name,)).fetchone():
+        return
+    with conn:
+        numDeleted = conn.execute("DELETE FROM %s WHERE filename IS NOT NULL AND id NOT IN "
+                                  "(SELECT MAX(id) FROM %s GROUP BY filename)" % (table, table)).rowcount
+        if numDeleted > 0:
+            print("Removed %d duplicate rows from %s" % (numDeleted, table))
+        conn.execute("CREATE UNIQUE INDEX %s ON %s (filename)" % (name, table))
+
+
+def createErrorTable(conn):
+    """Create the table of files with unparseable headers"""
+    conn.execute("CREATE TABLE IF NOT EXISTS errors (filename TEXT PRIMARY KEY, tableName TEXT, "
+                 "message TEXT)")
+
+
+def createMatchTable(conn):
+    """Create the join table between camera and shutter files"""
+    conn.execute("CREATE TABLE IF NOT EXISTS match (camera INTEGER PRIMARY KEY, shutter INTEGER UNIQUE, "
+                 "dt DOUBLE, expTimeDiff DOUBLE)")
 
 
 def createDatabase(root):
     conn = getDatabase(root)
     createTable(conn, "shutter", SHUTTER)
     createTable(conn, "camera", CAMERA)
-
-    # Join table
-    # conn.execute("CREATE TABLE match (camera INTEGER PRIMARY KEY,
-    #                                   shutter INTEGER PRIMARY KEY)")
-
+    createErrorTable(conn)
+    createMatchTable(conn)
     conn.commit()
     conn.close()
 
 
-def suckMetadata(root, table, columns, filenames):
+def readHeader(filename):
+    """Read the primary header of a file"""
+    try:
+        return readPrimaryHeader(filename)
+    except ValueError:
+        from lsst.afw.fits import readMetadata
+        return readMetadata(filename, 0)  # 0 = PHU (afw HDUs are 0-indexed)
+
+
+def extractRow(table, filename):
+    """Extract the values for a table from the header of a file
+
+    This runs in the worker processes, so the columns are identified by
+    table name rather than passed in.
+
+    @param table  Name of table
+    @param filename  Name of file
+    @return tuple of filename, values (None on error) and error message
+    """
+    columns = TABLES[table]
+    try:
+        md = readHeader(filename)
+        return filename, [colData[1](md) for colData in columns.values()], None
+    except Exception as e:
+        return filename, None, "%s: %s" % (type(e).__name__, e)
+
+
+def writeRows(conn, table, columns, rows, errors):
+    """Write rows and errors in a single transaction
+
+    Rows are upserted, so re-reading a file updates its row in place
+    (keeping its id).
+    """
+    sql = "INSERT INTO %s (filename, %s) VALUES (?%s) " % (table, ", ".join(columns), ", ?"*len(columns))
+    sql += "ON CONFLICT(filename) DO UPDATE SET "
+    sql += ", ".join("%s=excluded.%s" % (col, col) for col in columns)
+    with conn:
+        conn.executemany(sql, rows)
+        conn.executemany("DELETE FROM errors WHERE filename = ?", [(row[0],) for row in rows])
+        conn.executemany("INSERT OR REPLACE INTO errors VALUES (?, ?, ?)",
+                         [(filename, table, message) for filename, message in errors])
+
+
+def suckMetadata(root, table, columns, filenames, processes=1, batchSize=1000, force=False):
+    checkSqliteVersion()
     conn = getDatabase(root)
-    for fn in sum([glob(fn) for fn in filenames], []):
-        md = readMetadata(fn, 1)
+    createTable(conn, table, columns)
+    createErrorTable(conn)
+
+    filenames = [os.path.abspath(fn) for fn in itertools.chain.from_iterable(glob(fn) for fn in filenames)]
+    if not force:
+        done = set(fn for fn, in conn.execute("SELECT filename FROM %s" % (table,)))
+        numDone = len(filenames)
+        filenames = [fn for fn in filenames if fn not in done]
+        numDone -= len(filenames)
+        if numDone > 0:
+            print("Skipping %d files already in the database" % (numDone,))
+
+    pool = multiprocessing.Pool(processes) if processes > 1 else None
+    try:
+        if pool is None:
+            results = (extractRow(table, fn) for fn in filenames)
+        else:
+            results = pool.imap_unordered(_extractRow, [(table, fn) for fn in filenames], chunksize=16)
+        numRows = 0
+        numErrors = 0
+        rows, errors = [], []
+        for fn, values, message in results:
+            if values is None:
+                print("WARNING: Unable to parse headers from %s: %s" % (fn, message))
+                errors.append((fn, message))
+            else:
+                rows.append([fn] + values)
+            if len(rows) + len(errors) >= batchSize:
+                writeRows(conn, table, columns, rows, errors)
+                numRows += len(rows)
+                numErrors += len(errors)
+                rows, errors = [], []
+        writeRows(conn, table, columns, rows, errors)
+        numRows += len(rows)
+        numErrors += len(errors)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    conn.close()
+    print("Wrote %d rows to %s; %d files with errors" % (numRows, table, numErrors))
+
+
+def _extractRow(args):
+    """Unpack arguments for extractRow, for use with Pool.imap"""
+    return extractRow(*args)
+
+
+def parseDate(date):
+    """Convert an ISO date (e.g., 2016-05-05T03:17:08.93) to seconds
+
+    @param date  Date and time, in ISO format
+    @return seconds since 0001-01-01
+    """
+    day, _, time = date.rstrip("Z").partition("T")
+    hours, minutes, seconds = time.split(":") if time else (0, 0, 0)
+    days = datetime.datetime.strptime(day, "%Y-%m-%d").toordinal()
+    return days*86400.0 + int(hours)*3600.0 + int(minutes)*60.0 + float(seconds)
+
+
+def readTimes(conn, table):
+    """Read the ids, times and exposure times from a table
+
+    Rows with unparseable dates are ignored.
+
+    @return arrays of id, time and exposure time, sorted by time
+    """
+    ids, times, expTimes = [], [], []
+    for ident, date, expTime in conn.execute("SELECT id, date, expTime FROM %s" % (table,)):
         try:
-            data = {col: colData[1](md) for col, colData in columns.items()}
+            times.append(parseDate(date))
         except Exception as e:
-            print("WARNING: Unable to parse headers from %s: %s" % (fn, e))
-            import pdb
-            pdb.set_trace()
+            print("WARNING: Unable to parse date for %s %d: %s" % (table, ident, e))
             continue
-        sql = "INSERT INTO %s VALUES (NULL, ?" % table
-        sql += ", ?" * len(columns)
-        sql += ")"
-        values = [os.path.abspath(fn)] + [data[col] for col in columns]
-        conn.execute(sql, values)
-    conn.commit()
+        ids.append(ident)
+        expTimes.append(expTime if expTime is not None else numpy.nan)
+    ids = numpy.array(ids, dtype=numpy.int64)
+    times = numpy.array(times, dtype=float)
+    expTimes = numpy.array(expTimes, dtype=float)
+    order = numpy.argsort(times, kind="mergesort")
+    return ids[order], times[order], expTimes[order]
+
+
+def matchCameraShutter(root, tolerance=5.0, offset=0.0, expTimeTolerance=0.5):
+    """Match camera files to shutter files, by nearest time
+
+    Camera files are matched one-to-one to shutter files within the
+    tolerance in time (after correcting the camera time by the offset) whose
+    exposure times agree (where both are known).  The candidate pairs are
+    assigned in order of increasing time difference, so each camera file gets
+    the nearest shutter file that isn't a better match for another camera
+    file; ties go to the earlier file.  The candidates are found with a binary
+    search of the sorted shutter times.
+
+    @param root  Data repo root
+    @param tolerance  Maximum time difference (sec)
+    @param offset  Offset (sec) to subtract from camera times
+    @param expTimeTolerance  Maximum exposure time difference (sec)
+    """
+    conn = getDatabase(root)
+    createMatchTable(conn)
+    cameraIds, cameraTimes, cameraExpTimes = readTimes(conn, "camera")
+    shutterIds, shutterTimes, shutterExpTimes = readTimes(conn, "shutter")
+    matches = []
+    if len(cameraIds) > 0 and len(shutterIds) > 0:
+        times = cameraTimes - offset
+        # All shutter files within the tolerance of each camera file, as
+        # pairs of indices (in order of camera time, then shutter time)
+        start = numpy.searchsorted(shutterTimes, times - tolerance, side="left")
+        stop = numpy.searchsorted(shutterTimes, times + tolerance, side="right")
+        numCandidates = stop - start
+        camera = numpy.repeat(numpy.arange(len(times)), numCandidates)
+        shutter = (numpy.repeat(start, numCandidates) + numpy.arange(numCandidates.sum()) -
+                   numpy.repeat(numpy.cumsum(numCandidates) - numCandidates, numCandidates))
+        dt = times[camera] - shutterTimes[shutter]
+        expTimeDiff = cameraExpTimes[camera] - shutterExpTimes[shutter]
+        expTimeOk = ~(numpy.abs(expTimeDiff) > expTimeTolerance)  # NaN: can't check, so accept
+        candidates = numpy.flatnonzero(expTimeOk)
+
+        usedCamera = numpy.zeros(len(cameraIds), dtype=bool)
+        usedShutter = numpy.zeros(len(shutterIds), dtype=bool)
+        for index in candidates[numpy.argsort(numpy.abs(dt[candidates]), kind="mergesort")]:
+            if usedCamera[camera[index]] or usedShutter[shutter[index]]:
+                continue
+            usedCamera[camera[index]] = True
+            usedShutter[shutter[index]] = True
+            matches.append((int(cameraIds[camera[index]]), int(shutterIds[shutter[index]]),
+                            float(dt[index]), float(expTimeDiff[index])))
+
+        inTime = numCandidates > 0
+        consistent = numpy.zeros(len(cameraIds), dtype=bool)
+        consistent[camera[candidates]] = True
+        print("%d camera files: %d matched, %d with no shutter file within %g sec, "
+              "%d with inconsistent exposure time, %d whose shutter files were all taken" %
+              (len(cameraIds), len(matches), (~inTime).sum(), tolerance, (inTime & ~consistent).sum(),
+               (consistent & ~usedCamera).sum()))
+
+    with conn:
+        conn.execute("DELETE FROM match")
+        conn.executemany("INSERT INTO match VALUES (?, ?, ?, ?)", matches)
     conn.close()
 
 
@@ -130,13 +362,28 @@ if __name__ == "__main__":
         func=lambda args: createDatabase(args.root)
     )
 
-    cameraParser = sub.add_parser("camera", help="suck camera metadata")
-    cameraParser.add_argument("files", nargs="+", help="filenames from which to suck metadata")
-    cameraParser.set_defaults(func=lambda args: suckMetadata(args.root, "camera", CAMERA, args.files))
-
-    shutterParser = sub.add_parser("shutter", help="suck shutter metadata")
-    shutterParser.add_argument("files", nargs="+", help="filenames from which to suck metadata")
-    shutterParser.set_defaults(func=lambda args: suckMetadata(args.root, "shutter", SHUTTER, args.files))
+    for table, columns in TABLES.items():
+        tableParser = sub.add_parser(table, help="suck %s metadata" % (table,))
+        tableParser.add_argument("files", nargs="+", help="filenames from which to suck metadata")
+        tableParser.add_argument("--processes", type=int, default=1,
+                                 help="number of processes for reading headers")
+        tableParser.add_argument("--batch-size", type=int, default=1000,
+                                 help="number of rows to write in each transaction")
+        tableParser.add_argument("--force", action="store_true",
+                                 help="read files that are already in the database")
+        tableParser.set_defaults(func=lambda args, table=table, columns=columns: suckMetadata(
+            args.root, table, columns, args.files, processes=args.processes, batchSize=args.batch_size,
+            force=args.force))
+
+    matchParser = sub.add_parser("match", help="match camera and shutter files by time")
+    matchParser.add_argument("--tolerance", type=float, default=5.0,
+                             help="maximum time difference (sec)")
+    matchParser.add_argument("--offset", type=float, default=0.0,
+                             help="offset (sec) to subtract from camera times")
+    matchParser.add_argument("--exptime-tolerance", type=float, default=0.5,
+                             help="maximum exposure time difference (sec)")
+    matchParser.set_defaults(func=lambda args: matchCameraShutter(
+        args.root, tolerance=args.tolerance, offset=args.offset, expTimeTolerance=args.exptime_tolerance))
 
     args = parser.parse_args()
     args.func(args)
@@ -0,0 +1,23 @@
+#!/usr/bin/env python
+
+"""
+Constructing the Monocam camera geometry takes a noticeable time, which
+short-lived processes pay each time they construct a mapper. This script
+persists the camera in a data repository, e.g.:
+
+    $ writeCamera.py DATA
+
+after which mappers for that repository read the camera instead of
+constructing it. The file name includes the version of the geometry, so
+a persisted camera is ignored once the geometry in the code changes.
+"""
+from argparse import ArgumentParser
+
+from lsst.obs.monocam.monocam import writeCamera
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("root", help="Data repo root")
+    args = parser.parse_args()
+    print("Wrote %s" % (writeCamera(args.root),))
@@ -14,7 +14,7 @@ config.parse.translators = {
 config.parse.defaults = {
     'object': "UNKNOWN",
 }
-config.parse.hdu = 1
+config.parse.hdu = 0  # The PHU, which holds the raw header (afw HDUs are 0-indexed)
 
 config.register.columns = {
     'visit': 'int',
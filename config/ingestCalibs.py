@@ -1,5 +1,6 @@
-from lsst.obs.monocam.ingest import MonocamCalibsParseTask
+from lsst.obs.monocam.ingest import MonocamCalibsParseTask, MonocamCalibsRegisterTask
 config.parse.retarget(MonocamCalibsParseTask)
+config.register.retarget(MonocamCalibsRegisterTask)
 
 config.register.columns = {'filter': 'text',
                            'ccd': 'int',
@@ -19,6 +19,36 @@
 # the GNU General Public License along with this program.  If not,
 # see <http://www.lsstcorp.org/LegalNotices/>.
 #
+"""Monocam camera support
+
+The mapper and ISR task pull in most of the stack (afw, ip_isr, pipe_base,
+obs_base), so they are imported on first use rather than with the package;
+tools that need only the ingest parsers or the camera geometry import
+those modules directly without paying for the rest.
+"""
+import importlib
+
+from . import version
 from .version import *
-from .monocamMapper import *
-from .monocamIsrTask import *
+
+# Public attributes provided by submodules imported on first use: name: module
+_lazyAttributes = {
+    "MonocamMapper": "monocamMapper",
+    "MonocamIsrConfig": "monocamIsrTask",
+    "MonocamIsrTask": "monocamIsrTask",
+}
+
+__all__ = list(getattr(version, "__all__", ())) + list(_lazyAttributes)
+
+
+def __getattr__(name):
+    moduleName = _lazyAttributes.get(name)
+    if moduleName is None:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    value = getattr(importlib.import_module("." + moduleName, __name__), name)
+    globals()[name] = value  # Subsequent lookups don't come through here
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazyAttributes))
@@ -0,0 +1,89 @@
+#
+# LSST Data Management System
+# Copyright 2016 LSST Corporation.
+#
+# This product includes software developed by the
+# LSST Project (http://www.lsst.org/).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the LSST License Statement and
+# the GNU General Public License along with this program.  If not,
+# see <http://www.lsstcorp.org/LegalNotices/>.
+#
+import collections
+import threading
+
+__all__ = ["LruCache"]
+
+
+class LruCache:
+    """A bounded cache, discarding the least-recently used entries
+
+    The cache is safe to use from multiple threads.  It counts the hits and
+    misses of ``get``, to allow monitoring its effectiveness.
+
+    Parameters
+    ----------
+    maxSize : `int`
+        Maximum number of entries; zero disables the cache.
+    """
+
+    def __init__(self, maxSize):
+        if maxSize < 0:
+            raise ValueError("Cache size must not be negative: %d" % (maxSize,))
+        self.maxSize = maxSize
+        self.hits = 0
+        self.misses = 0
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        """Return the value for a key, or ``default`` if it is not cached"""
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Cache a value, discarding the least-recently used entries if
+        necessary"""
+        if self.maxSize == 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxSize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """Remove an entry, returning its value (or ``default`` if it was
+        not cached)"""
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        """Remove all entries and reset the counters"""
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
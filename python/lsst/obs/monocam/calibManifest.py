@@ -0,0 +1,100 @@
+#
+# LSST Data Management System
+# Copyright 2016 LSST Corporation.
+#
+# This product includes software developed by the
+# LSST Project (http://www.lsst.org/).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the LSST License Statement and
+# the GNU General Public License along with this program.  If not,
+# see <http://www.lsstcorp.org/LegalNotices/>.
+#
+#
+"""
+Precomputed lookup of the calibrations to use for each night
+
+Finding the calibration for a visit normally takes a range query on
+validStart and validEnd in the calibration registry, for every calibration
+of every visit.  Instead, the calibration registry can hold a manifest
+table mapping each night (and filter and ccd) to the calibDate of the
+calibration valid then; it is rebuilt whenever the validity ranges are
+updated by ingestCalibs, and is small enough to be read into memory once.
+"""
+import datetime
+import sqlite3
+
+__all__ = ["MANIFEST_TABLE", "createCalibIndexes", "writeCalibManifest", "readCalibManifest"]
+
+MANIFEST_TABLE = "calibManifest"
+
+
+def createCalibIndexes(conn, table):
+    """Create the indexes for a calibration table, if they don't exist
+
+    @param conn  Connection to calibration registry
+    @param table  Name of calibration table
+    """
+    conn.execute("CREATE INDEX IF NOT EXISTS %s_validity ON %s (filter, ccd, validStart, validEnd)" %
+                 (table, table))
+    conn.execute("CREATE INDEX IF NOT EXISTS %s_calibDate ON %s (calibDate, filter, ccd)" % (table, table))
+
+
+def _parseDate(date):
+    return datetime.datetime.strptime(date[:10], "%Y-%m-%d").date()
+
+
+def writeCalibManifest(conn, tables):
+    """Rebuild the manifest of calibrations for each night
+
+    Where the validity ranges of several calibrations include a night, the
+    one with the nearest calibDate is used.
+
+    @param conn  Connection to calibration registry
+    @param tables  Names of calibration tables
+    """
+    conn.execute("CREATE TABLE IF NOT EXISTS %s (tableName TEXT, date TEXT, filter TEXT, ccd INT, "
+                 "calibDate TEXT, PRIMARY KEY (tableName, date, filter, ccd))" % (MANIFEST_TABLE,))
+    rows = []
+    for table in tables:
+        best = {}  # (date, filter, ccd): (distance, calibDate)
+        sql = "SELECT filter, ccd, calibDate, validStart, validEnd FROM %s" % (table,)
+        for filterName, ccd, calibDate, validStart, validEnd in conn.execute(sql):
+            if validStart is None or validEnd is None:
+                continue
+            calib = _parseDate(calibDate)
+            night = _parseDate(validStart)
+            end = _parseDate(validEnd)
+            while night <= end:
+                key = (night.isoformat(), filterName, ccd)
+                distance = abs((night - calib).days)
+                if key not in best or distance < best[key][0]:
+                    best[key] = (distance, calibDate)
+                night += datetime.timedelta(days=1)
+        rows.extend((table,) + key + (calibDate,) for key, (_, calibDate) in best.items())
+    conn.execute("DELETE FROM %s" % (MANIFEST_TABLE,))
+    conn.executemany("INSERT INTO %s VALUES (?, ?, ?, ?, ?)" % (MANIFEST_TABLE,), rows)
+
+
+def readCalibManifest(conn):
+    """Read the manifest of calibrations for each night
+
+    @param conn  Connection to calibration registry
+    @return dict of calibDate, indexed by table name, date, filter and ccd;
+            or None if the registry has no manifest
+    """
+    try:
+        rows = conn.execute("SELECT tableName, date, filter, ccd, calibDate FROM %s" %
+                            (MANIFEST_TABLE,)).fetchall()
+    except sqlite3.OperationalError:  # No such table
+        return None
+    return {(table, date, filterName, ccd): calibDate for table, date, filterName, ccd, calibDate in rows}
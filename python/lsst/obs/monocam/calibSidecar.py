@@ -0,0 +1,148 @@
+#
+# LSST Data Management System
+# Copyright 2016 LSST Corporation.
+#
+# This product includes software developed by the
+# LSST Project (http://www.lsst.org/).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the LSST License Statement and
+# the GNU General Public License along with this program.  If not,
+# see <http://www.lsstcorp.org/LegalNotices/>.
+#
+"""
+Uncompressed, memory-mappable copies ("sidecars") of calibration images
+
+The calibrations are stored gzipped, so every read decompresses a
+full-frame float image.  A sidecar holds the same pixels as an aligned,
+native-endian .npy file that can be memory-mapped, together with the
+header in a small header-only FITS file.  Sidecars are written alongside
+the calibration by materializeCalibs.py, and are used by the mapper when
+they are present and newer than the calibration.
+"""
+import os
+import re
+from glob import glob
+
+import numpy
+
+import lsst.afw.image as afwImage
+import lsst.afw.fits as afwFits
+from lsst.afw.fits import readMetadata
+from .sharedCalibs import mapArray
+
+__all__ = ["getSidecarNames", "hasSidecar", "readCalibImage", "writeCalibSidecar", "materializeCalibs"]
+
+
+def getSidecarNames(filename):
+    """Return the names of the sidecar files for a calibration
+
+    @param filename  Name of calibration file (e.g., bias-2016-05-05.fits.gz)
+    @return dict with names of the "image" and "metadata" sidecar files
+    """
+    base = re.sub(r"\.fits(\.gz|\.fz)?$", "", filename)
+    return dict(image=base + ".image.npy", metadata=base + ".md.fits")
+
+
+def hasSidecar(filename):
+    """Is there an up-to-date sidecar for a calibration?
+
+    @param filename  Name of calibration file
+    @return True if the sidecar exists and is newer than the calibration
+    """
+    names = getSidecarNames(filename)
+    try:
+        mtime = os.stat(filename).st_mtime
+        return all(os.stat(name).st_mtime >= mtime for name in names.values())
+    except OSError:
+        return False
+
+
+def readCalibImage(filename, useSidecar=True):
+    """Read a calibration image
+
+    The image is memory-mapped from the sidecar if one is available;
+    otherwise, the calibration file itself is read (with the header of the
+    HDU holding the image, as the butler would read it).
+
+    @param filename  Name of calibration file
+    @param useSidecar  Use the sidecar, if available?
+    @return lsst.afw.image.DecoratedImageF
+    """
+    if useSidecar and hasSidecar(filename):
+        names = getSidecarNames(filename)
+        item = afwImage.DecoratedImageF(afwImage.ImageF(mapArray(names["image"]), deep=False))
+        item.setMetadata(readMetadata(names["metadata"], 0))
+        return item
+    return afwImage.DecoratedImageF(filename)
+
+
+def _replace(writer, filename):
+    """Write a file atomically, via a temporary file"""
+    temp = filename + ".tmp%d" % os.getpid()
+    try:
+        writer(temp)
+        os.rename(temp, filename)
+    finally:
+        if os.path.exists(temp):
+            os.unlink(temp)
+
+
+def writeCalibSidecar(filename):
+    """Write the sidecar for a calibration
+
+    @param filename  Name of calibration file
+    """
+    item = readCalibImage(filename, useSidecar=False)
+    names = getSidecarNames(filename)
+    array = numpy.ascontiguousarray(item.getImage().getArray(), dtype=numpy.float32)
+
+    def writeMetadata(name):
+        fitsFile = afwFits.Fits(name, "w")
+        try:
+            fitsFile.createEmpty()
+            fitsFile.writeMetadata(item.getMetadata())
+        finally:
+            fitsFile.closeFile()
+
+    def writeArray(name):
+        # numpy.save writes the array in native byte order, aligned within
+        # the file, so it can be memory-mapped directly.
+        with open(name, "wb") as fd:
+            numpy.save(fd, array)
+
+    _replace(writeArray, names["image"])
+    # Written last, so the sidecar is not used until it is complete
+    _replace(writeMetadata, names["metadata"])
+
+
+def materializeCalibs(root, templates, force=False, log=None):
+    """Write sidecars for all calibrations in a calibration repository
+
+    @param root  Root directory of calibration repository
+    @param templates  dict of filename template (from the mapper policy),
+                      indexed by dataset type
+    @param force  Rewrite sidecars that are up to date?
+    @param log  Log for reporting progress, or None
+    @return number of sidecars written
+    """
+    num = 0
+    for datasetType, template in templates.items():
+        pattern = os.path.join(root, re.sub(r"%\(\w+\)\w", "*", template))
+        for filename in sorted(glob(pattern)):
+            if not force and hasSidecar(filename):
+                continue
+            if log is not None:
+                log.info("Materializing %s %s" % (datasetType, filename))
+            writeCalibSidecar(filename)
+            num += 1
+    return num
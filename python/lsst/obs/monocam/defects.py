@@ -0,0 +1,163 @@
+#
+# LSST Data Management System
+# Copyright 2016 LSST Corporation.
+#
+# This product includes software developed by the
+# LSST Project (http://www.lsst.org/).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the LSST License Statement and
+# the GNU General Public License along with this program.  If not,
+# see <http://www.lsstcorp.org/LegalNotices/>.
+#
+"""
+Defects stored as a run-length index of bad pixels
+
+The defects file is a versioned text file with one run of bad pixels per
+line: the detector name, the row, and the first and last (inclusive)
+columns of the run.  Lines starting with "#" are comments, except for the
+first line, which gives the version of the format, e.g.:
+
+    # version: 1
+    # detector y x0 x1
+    0 666 3801 3805
+"""
+import threading
+
+import numpy
+
+import lsst.geom as geom
+import lsst.afw.image as afwImage
+
+__all__ = ["DefectMap", "readDefectMaps", "writeDefectMaps"]
+
+FORMAT_VERSION = 1
+
+
+class DefectMap:
+    """Bad pixels of a detector, as a run-length index
+
+    The bad pixels are applied to a mask with a single vectorized operation
+    (see maskPixels), so large numbers of defects (e.g., hot pixels) carry
+    no per-defect overhead.  The object is also a sequence of
+    lsst.afw.image.DefectBase (one per run), for code that expects a list
+    of defects.
+
+    @param runs  Array of runs of bad pixels, with columns of row, first
+                 column and last (inclusive) column
+    """
+
+    def __init__(self, runs):
+        self.runs = numpy.array(runs, dtype=numpy.int64).reshape(-1, 3)
+        self._indices = {}  # Flat pixel indices, indexed by mask geometry
+        self._lock = threading.Lock()
+
+    @classmethod
+    def fromBoxes(cls, boxes):
+        """Construct from a list of boxes of bad pixels
+
+        @param boxes  iterable of lsst.geom.Box2I
+        @return DefectMap
+        """
+        runs = [(yy, box.getMinX(), box.getMaxX()) for box in boxes for
+                yy in range(box.getMinY(), box.getMaxY() + 1)]
+        return cls(runs)
+
+    def __len__(self):
+        return len(self.runs)
+
+    def __iter__(self):
+        for yy, x0, x1 in self.runs:
+            yield afwImage.DefectBase(geom.Box2I(geom.Point2I(int(x0), int(yy)),
+                                                 geom.Point2I(int(x1), int(yy))))
+
+    def getIndices(self, bbox):
+        """Return the indices of the bad pixels in the flattened array of an
+        image
+
+        The indices are computed once for each image geometry.
+
+        @param bbox  Bounding box of the image (lsst.geom.Box2I)
+        @return numpy array of indices
+        """
+        key = (bbox.getMinX(), bbox.getMinY(), bbox.getWidth(), bbox.getHeight())
+        with self._lock:
+            if key not in self._indices:
+                self._indices[key] = self._computeIndices(bbox)
+            return self._indices[key]
+
+    def _computeIndices(self, bbox):
+        """Compute the indices of the bad pixels, clipped to the image"""
+        x0, y0 = bbox.getMinX(), bbox.getMinY()
+        width, height = bbox.getWidth(), bbox.getHeight()
+        rows = self.runs[:, 0] - y0
+        starts = numpy.clip(self.runs[:, 1] - x0, 0, width)
+        stops = numpy.clip(self.runs[:, 2] - x0 + 1, 0, width)
+        keep = (rows >= 0) & (rows < height) & (stops > starts)
+        rows, starts, stops = rows[keep], starts[keep], stops[keep]
+        lengths = stops - starts
+        if lengths.sum() == 0:
+            return numpy.zeros(0, dtype=numpy.int64)
+        # Expand each run into consecutive indices, without a Python loop
+        runStarts = rows*width + starts
+        offsets = numpy.arange(lengths.sum()) - numpy.repeat(numpy.cumsum(lengths) - lengths, lengths)
+        return numpy.repeat(runStarts, lengths) + offsets
+
+    def maskPixels(self, mask, maskName="BAD"):
+        """Set a mask plane for the bad pixels
+
+        @param[in,out] mask  Mask to modify (lsst.afw.image.Mask)
+        @param[in] maskName  Name of mask plane to set
+        """
+        bitMask = mask.getPlaneBitMask(maskName)
+        array = mask.getArray()
+        indices = self.getIndices(mask.getBBox())
+        if array.flags.c_contiguous:
+            array.reshape(-1)[indices] |= bitMask  # reshape gives a view of a contiguous array
+        else:
+            # e.g., a subimage, for which reshape would give a copy
+            array[numpy.unravel_index(indices, array.shape)] |= bitMask
+
+
+def readDefectMaps(filename):
+    """Read a defects file
+
+    @param filename  Name of defects file
+    @return dict of DefectMap, indexed by detector name
+    """
+    with open(filename) as fd:
+        header = fd.readline()
+        version = header.lstrip("#").strip()
+        if not version.startswith("version:") or int(version.split(":")[1]) != FORMAT_VERSION:
+            raise RuntimeError("Unsupported defects file format in %s: %s" % (filename, header.strip()))
+        runs = {}
+        for line in fd:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            detector, yy, x0, x1 = line.split()
+            runs.setdefault(detector, []).append((int(yy), int(x0), int(x1)))
+    return {detector: DefectMap(detectorRuns) for detector, detectorRuns in runs.items()}
+
+
+def writeDefectMaps(filename, defectMaps):
+    """Write a defects file
+
+    @param filename  Name of defects file
+    @param defectMaps  dict of DefectMap, indexed by detector name
+    """
+    with open(filename, "w") as fd:
+        fd.write("# version: %d\n" % (FORMAT_VERSION,))
+        fd.write("# detector y x0 x1\n")
+        for detector in sorted(defectMaps):
+            for yy, x0, x1 in defectMaps[detector].runs:
+                fd.write("%s %d %d %d\n" % (detector, yy, x0, x1))
@@ -0,0 +1,162 @@
+#
+# LSST Data Management System
+# Copyright 2016 LSST Corporation.
+#
+# This product includes software developed by the
+# LSST Project (http://www.lsst.org/).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the LSST License Statement and
+# the GNU General Public License along with this program.  If not,
+# see <http://www.lsstcorp.org/LegalNotices/>.
+#
+#
+"""
+Lightweight reader of FITS primary headers
+
+Reading metadata through the afw FITS machinery opens the file with
+cfitsio and converts every card; when all that is needed is the primary
+header (as for raw_md), it is much cheaper to read the 2880-byte header
+blocks of the PHU directly and stop at the END card.
+"""
+import gzip
+import re
+
+import lsst.daf.base as dafBase
+
+__all__ = ["readPrimaryHeader", "stripExtension"]
+
+BLOCK_SIZE = 2880
+CARD_SIZE = 80
+
+_GZIP_MAGIC = b"\x1f\x8b"
+_INT_RE = re.compile(r"^[+-]?\d+$")
+_EXTENSION_RE = re.compile(r"\[[^\]/]*\]$")
+
+
+def stripExtension(filename):
+    """Strip a cfitsio extension specification (e.g., "[1]") from a filename
+
+    @param filename  Filename, possibly with extension specification
+    @return filename of the file on disk
+    """
+    return _EXTENSION_RE.sub("", filename)
+
+
+def _parseString(text):
+    """Parse a quoted FITS string value
+
+    @param text  Value field, starting with the opening quote
+    @return tuple of the string and the remainder of the field (the comment)
+    """
+    chars = []
+    index = 1
+    while index < len(text):
+        char = text[index]
+        if char == "'":
+            if text[index + 1:index + 2] == "'":  # Escaped quote
+                chars.append("'")
+                index += 2
+                continue
+            break
+        chars.append(char)
+        index += 1
+    return "".join(chars).rstrip(), text[index + 1:]
+
+
+def _parseComment(text):
+    """Extract the comment from the remainder of a value field"""
+    slash = text.find("/")
+    return text[slash + 1:].strip() if slash >= 0 else ""
+
+
+def _parseValue(text):
+    """Parse the value field of a card
+
+    @param text  Value field (the part of the card following "= ")
+    @return tuple of value (None if undefined) and comment
+    """
+    text = text.lstrip()
+    if text.startswith("'"):
+        value, rest = _parseString(text)
+        return value, _parseComment(rest)
+    slash = text.find("/")
+    token = (text[:slash] if slash >= 0 else text).strip()
+    comment = text[slash + 1:].strip() if slash >= 0 else ""
+    if not token:
+        return None, comment
+    if token == "T":
+        return True, comment
+    if token == "F":
+        return False, comment
+    if _INT_RE.match(token):
+        return int(token), comment
+    try:
+        return float(token.replace("D", "E").replace("d", "e")), comment
+    except ValueError:
+        raise ValueError("Unable to parse FITS value: %r" % (token,))
+
+
+def _openRaw(filename):
+    """Open a (possibly gzipped) FITS file for binary reading"""
+    with open(filename, "rb") as fd:
+        magic = fd.read(2)
+    if magic == _GZIP_MAGIC:
+        return gzip.open(filename, "rb")
+    return open(filename, "rb")
+
+
+def readPrimaryHeader(filename):
+    """Read the primary header of a FITS file
+
+    Only the header blocks of the PHU are read.  Long strings continued with
+    CONTINUE cards are joined, COMMENT and HISTORY cards are accumulated, and
+    cards with undefined values are skipped.
+
+    @param filename  Name of FITS file (an extension specification, like
+                     "[1]", is ignored)
+    @return lsst.daf.base.PropertyList
+    """
+    filename = stripExtension(filename)
+    md = dafBase.PropertyList()
+    lastString = None  # Name of last string keyword, for CONTINUE
+    with _openRaw(filename) as fd:
+        while True:
+            block = fd.read(BLOCK_SIZE)
+            if len(block) < BLOCK_SIZE:
+                raise ValueError("No END card in primary header of %s" % (filename,))
+            block = block.decode("ascii", "replace")
+            for start in range(0, BLOCK_SIZE, CARD_SIZE):
+                card = block[start:start + CARD_SIZE]
+                keyword = card[:8].rstrip()
+                if keyword == "END":
+                    return md
+                if keyword in ("COMMENT", "HISTORY"):
+                    md.add(keyword, card[8:].rstrip())
+                    continue
+                if keyword == "CONTINUE" and lastString is not None:
+                    value, comment = _parseString(card[8:].lstrip())
+                    previous = md.getScalar(lastString)
+                    if previous.endswith("&"):
+                        md.set(lastString, previous[:-1] + value)
+                    continue
+                if keyword == "HIERARCH" and "=" in card:
+                    keyword, text = card[9:].split("=", 1)
+                    keyword = keyword.strip()
+                elif card[8:10] == "= ":
+                    text = card[10:]
+                else:
+                    continue  # Blank or commentary card
+                value, comment = _parseValue(text)
+                lastString = keyword if isinstance(value, str) else None
+                if value is not None:
+                    md.set(keyword, value, comment)
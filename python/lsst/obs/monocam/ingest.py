@@ -1,16 +1,63 @@
+import copy
+import functools
+import glob
+import multiprocessing
 import os
-import re
-from lsst.pipe.tasks.ingest import ParseTask
-from lsst.pipe.tasks.ingestCalibs import CalibsParseTask
+from lsst.afw.fits import readMetadata
+from lsst.pex.config import Field
+from lsst.pipe.tasks.ingest import IngestConfig, IngestTask, ParseTask
+from lsst.pipe.tasks.ingestCalibs import (CalibsParseTask, CalibsRegisterTask, IngestCalibsConfig,
+                                          IngestCalibsTask)
+from .calibManifest import createCalibIndexes, writeCalibManifest
+from .ingestIndex import IngestIndex, getFileStat
 
 
 EXTENSIONS = ["fits", "gz", "fz"]  # Filename extensions to strip off
 
 
-class MonocamParseTask(ParseTask):
+class PrefetchParseMixin:
+    """Mixin for parse tasks, to parse the headers of files in parallel
+
+    Classes using the mixin define parseFile(filename), which parses a file
+    (in the worker processes, when prefetching) and returns a picklable
+    result, and get its results with _parseFile.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._prefetched = {}  # Results of parseFile, indexed by filename
+
+    def prefetchInfo(self, filenames, numProcesses):
+        """Parse the headers of files in parallel, ahead of getInfo
+
+        The results (or the exceptions raised) are held until getInfo is
+        called for each file.
+
+        @param filenames  Names of files to parse
+        @param numProcesses  Number of worker processes
+        """
+        with multiprocessing.Pool(numProcesses, initializer=_initParseWorker,
+                                  initargs=(type(self), self.config)) as pool:
+            for filename, result in pool.imap_unordered(_runParseWorker, filenames, chunksize=16):
+                self._prefetched[filename] = result
+
+    def _parseFile(self, filename):
+        """Return the prefetched results of parseFile, or parse the file now"""
+        result = self._prefetched.pop(filename, None)
+        if result is None:
+            return self.parseFile(filename)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+class MonocamParseTask(PrefetchParseMixin, ParseTask):
     """Parser suitable for lab data"""
 
     def getInfo(self, filename):
+        return self._parseFile(filename)
+
+    def parseFile(self, filename):
         # Grab the basename
         phuInfo, infoList = ParseTask.getInfo(self, filename)
         basename = os.path.basename(filename)
@@ -23,14 +70,81 @@ class MonocamParseTask(ParseTask):
         return 0  # There's only one
 
 
-class MonocamCalibsParseTask(CalibsParseTask):
-    """Parser for calibs"""
+@functools.lru_cache(maxsize=1024)
+def parseCalibId(calibId):
+    """Parse the CALIB_ID header written by constructCalibs
+
+    The CALIB_ID is a space-separated list of key=value pairs, e.g.,
+    "calibDate=2016-05-05 filter=NONE ccd=0".  Results are cached, so a
+    header is parsed only once for all the translators that use it.
+
+    @param calibId  Value of the CALIB_ID header
+    @return dict of values (as strings), indexed by key; not to be modified
+    """
+    values = {}
+    for item in calibId.split():
+        key, sep, value = item.partition("=")
+        if sep:
+            values[key] = value
+    return values
+
+
+class MonocamCalibsParseTask(PrefetchParseMixin, CalibsParseTask):
+    """Parser for calibs
+
+    The header is read once, and both the calibration type and the other
+    header values are taken from it, so the header needn't be read again
+    for getCalibType.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._calibTypes = {}  # Calibration types from parseFile, indexed by filename
+
+    def getInfo(self, filename):
+        info, calibType = self._parseFile(filename)
+        self._calibTypes[filename] = calibType
+        return info
+
+    def getCalibType(self, filename):
+        calibType = self._calibTypes.pop(filename, None)
+        if calibType is None:
+            calibType = self.getCalibTypeFromMetadata(readMetadata(filename, self.config.hdu), filename)
+        return calibType
+
+    def parseFile(self, filename):
+        md = readMetadata(filename, self.config.hdu)
+        calibType = self.getCalibTypeFromMetadata(md, filename)
+        if self.config.extnames:
+            # The extensions have to be read anyway
+            return CalibsParseTask.getInfo(self, filename), calibType
+        phuInfo = self.getInfoFromMetadata(md)
+        return (phuInfo, [phuInfo]), calibType
+
+    @staticmethod
+    def getCalibTypeFromMetadata(md, filename):
+        """Return the calibration type given by a header, as
+        CalibsParseTask.getCalibType does
+
+        @param md  Header (lsst.daf.base.PropertyList)
+        @param filename  Name of file, for error messages
+        @return calibration type (e.g., "bias")
+        """
+        if not md.exists("OBSTYPE"):
+            raise RuntimeError("Unable to find the required header keyword OBSTYPE in %s" % (filename,))
+        obstype = md.getScalar("OBSTYPE").strip().lower()
+        for calibType, names in (("flat", ("flat",)), ("bias", ("zero", "bias")), ("dark", ("dark",)),
+                                 ("fringe", ("fringe",)), ("sky", ("sky",))):
+            if any(name in obstype for name in names):
+                return calibType
+        return obstype
 
     def _translateFromCalibId(self, field, md):
         """Get a value from the CALIB_ID written by constructCalibs"""
-        data = md.getScalar("CALIB_ID")
-        match = re.search(r".*%s=(\S+)" % field, data)
-        return match.groups()[0]
+        values = parseCalibId(md.getScalar("CALIB_ID"))
+        if field not in values:
+            raise RuntimeError("No %s in CALIB_ID: %s" % (field, md.getScalar("CALIB_ID")))
+        return values[field]
 
     def translate_ccd(self, md):
         return self._translateFromCalibId("ccd", md)
@@ -40,3 +154,190 @@ class MonocamCalibsParseTask(CalibsParseTask):
 
     def translate_calibDate(self, md):
         return self._translateFromCalibId("calibDate", md)
+
+
+class MonocamCalibsRegisterTask(CalibsRegisterTask):
+    """Register calibrations, with indexes and a manifest for fast lookups
+
+    Each calibration table gets composite indexes for the validity range and
+    calibDate lookups, and the manifest of the calibrations to use for each
+    night (see calibManifest) is rebuilt whenever the validity ranges are
+    updated.
+    """
+
+    def createTable(self, conn, *args, **kwargs):
+        CalibsRegisterTask.createTable(self, conn, *args, **kwargs)
+        for table in self.config.tables:
+            createCalibIndexes(conn, table)
+
+    def updateValidityRanges(self, conn, *args, **kwargs):
+        CalibsRegisterTask.updateValidityRanges(self, conn, *args, **kwargs)
+        tables = [table for table in self.config.tables if
+                  conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?",
+                               (table,)).fetchone() is not None]
+        writeCalibManifest(conn, tables)
+
+
+_parseTask = None  # Parser in each ingest worker process
+
+
+def _initParseWorker(ParseTaskClass, config):
+    """Set up an ingest worker process"""
+    global _parseTask
+    _parseTask = ParseTaskClass(config=config)
+
+
+def _runParseWorker(filename):
+    """Parse a file in an ingest worker process
+
+    Exceptions are returned rather than raised, so they are raised for the
+    file in question by PrefetchParseMixin._parseFile.
+    """
+    try:
+        return filename, _parseTask.parseFile(filename)
+    except Exception as exc:
+        return filename, RuntimeError("Error parsing %s: %s" % (filename, exc))
+
+
+class MonocamIngestConfig(IngestConfig):
+    numProcesses = Field(
+        dtype=int,
+        default=1,
+        doc="Number of processes used to parse the file headers; 1 means parse them serially as they "
+            "are ingested",
+    )
+    incremental = Field(
+        dtype=bool,
+        default=False,
+        doc="Skip files that have already been ingested and haven't changed since (by size and "
+            "modification time), without opening them?",
+    )
+    indexName = Field(
+        dtype=str,
+        default="ingestIndex.sqlite3",
+        doc="Name of the index of ingested files used for incremental ingest, in the repository root",
+    )
+
+    def validate(self):
+        IngestConfig.validate(self)
+        if self.numProcesses < 1:
+            raise ValueError("numProcesses must be positive: %d" % (self.numProcesses,))
+
+
+class MonocamIngestTask(IngestTask):
+    """Ingest task that parses file headers with a pool of processes, and
+    can skip files that have already been ingested
+
+    With config.numProcesses > 1, all the headers are parsed in parallel
+    before ingest starts; the files are then moved or linked and registered
+    serially, as before, in a single registry transaction.  The parser must
+    be a MonocamParseTask.
+
+    With config.incremental, files are compared with an index of the files
+    ingested by previous runs, and only new and changed files are ingested.
+    The new, changed and missing files are reported.
+    """
+    ConfigClass = MonocamIngestConfig
+
+    def __init__(self, *args, **kwargs):
+        IngestTask.__init__(self, *args, **kwargs)
+        self._ingested = set()  # Files ingested by the current run
+
+    def run(self, args):
+        filenames = [filename for filename in self.expandFiles(args.files) if
+                     not self.isBadFile(filename, args.badFile)]
+        index = None
+        if self.config.incremental:
+            index = IngestIndex(os.path.join(args.input, self.config.indexName))
+            diff = index.diff(filenames)
+            self.log.info("%d new, %d changed, %d unchanged and %d missing files" %
+                          (len(diff.new), len(diff.changed), len(diff.unchanged), len(diff.missing)))
+            for label, names in (("Changed", diff.changed), ("Missing", diff.missing)):
+                for filename in names:
+                    self.log.info("%s: %s" % (label, filename))
+            filenames = diff.new + diff.changed
+            args = copy.copy(args)
+            args.files = [glob.escape(filename) for filename in filenames]
+            # Obtained before ingest, which may move the files
+            stats = {filename: getFileStat(filename) for filename in filenames}
+
+        if self.config.numProcesses > 1 and filenames:
+            self.log.info("Parsing %d files with %d processes" % (len(filenames), self.config.numProcesses))
+            self.parse.prefetchInfo(filenames, self.config.numProcesses)
+
+        self._ingested = set()
+        try:
+            if filenames:
+                IngestTask.run(self, args)
+            if index is not None and not args.dryrun:
+                index.update({filename: stats[filename] for filename in filenames if
+                              filename in self._ingested})
+        finally:
+            if index is not None:
+                index.close()
+
+    def runFile(self, infile, registry, args):
+        hduInfoList = IngestTask.runFile(self, infile, registry, args)
+        if hduInfoList is not None:
+            self._ingested.add(infile)
+        return hduInfoList
+
+
+def findCalibFiles(directory):
+    """Find the calibration images in a directory tree
+
+    @param directory  Root of the directory tree
+    @return sorted list of names of files with FITS extensions
+    """
+    filenames = []
+    for dirpath, dirnames, names in os.walk(directory):
+        dirnames.sort()
+        filenames.extend(os.path.join(dirpath, name) for name in sorted(names) if
+                         any(name.endswith("." + ext) for ext in EXTENSIONS))
+    return filenames
+
+
+class MonocamIngestCalibsConfig(IngestCalibsConfig):
+    numProcesses = Field(
+        dtype=int,
+        default=1,
+        doc="Number of processes used to parse the file headers; 1 means parse them serially as they "
+            "are ingested",
+    )
+
+    def validate(self):
+        IngestCalibsConfig.validate(self)
+        if self.numProcesses < 1:
+            raise ValueError("numProcesses must be positive: %d" % (self.numProcesses,))
+
+
+class MonocamIngestCalibsTask(IngestCalibsTask):
+    """Ingest task for calibrations, for registering whole trees at once
+
+    Directories given in place of files are searched recursively for
+    calibration images, so a whole calibration tree (every date and filter,
+    e.g., as regenerated after each run) can be registered by one command;
+    as with IngestCalibsTask, all files are registered and the validity
+    ranges updated in a single registry transaction.  With
+    config.numProcesses > 1, all the headers are parsed in parallel first.
+    The parser must be a MonocamCalibsParseTask.
+    """
+    ConfigClass = MonocamIngestCalibsConfig
+
+    def expandFiles(self, fileNameList):
+        filenames = []
+        for filename in IngestCalibsTask.expandFiles(self, fileNameList):
+            if os.path.isdir(filename):
+                filenames.extend(findCalibFiles(filename))
+            else:
+                filenames.append(filename)
+        return filenames
+
+    def run(self, args):
+        filenames = self.expandFiles(args.files)
+        args = copy.copy(args)
+        args.files = [glob.escape(filename) for filename in filenames]
+        if self.config.numProcesses > 1 and filenames:
+            self.log.info("Parsing %d files with %d processes" % (len(filenames), self.config.numProcesses))
+            self.parse.prefetchInfo(filenames, self.config.numProcesses)
+        IngestCalibsTask.run(self, args)
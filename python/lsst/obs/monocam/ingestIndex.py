@@ -0,0 +1,119 @@
+#
+# LSST Data Management System
+# Copyright 2016 LSST Corporation.
+#
+# This product includes software developed by the
+# LSST Project (http://www.lsst.org/).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the LSST License Statement and
+# the GNU General Public License along with this program.  If not,
+# see <http://www.lsstcorp.org/LegalNotices/>.
+#
+#
+"""
+Index of ingested files, for incremental ingest
+
+The index records the basename, directory, size and modification time of
+each file that has been ingested, so that re-running ingest on a growing
+directory can skip the files that haven't changed without opening them.
+"""
+import collections
+import os
+import sqlite3
+
+__all__ = ["IngestIndex", "IngestDiff", "getFileStat"]
+
+IngestDiff = collections.namedtuple("IngestDiff", ["new", "changed", "unchanged", "missing"])
+IngestDiff.__doc__ = """Comparison of files with the ingest index
+
+Each field is a sorted list of filenames; "missing" lists indexed files in
+the directories of the files compared that no longer exist.
+"""
+
+
+def getFileStat(filename):
+    """Return the size and modification time (ns) of a file"""
+    stat = os.stat(filename)
+    return stat.st_size, stat.st_mtime_ns
+
+
+class IngestIndex:
+    """Index of ingested files, stored in an sqlite database
+
+    Files are identified by basename, as ingest does.
+
+    @param filename  Name of sqlite file (created if necessary)
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.conn = sqlite3.connect(filename)
+        with self.conn:
+            self.conn.execute("CREATE TABLE IF NOT EXISTS files (basename TEXT PRIMARY KEY, "
+                              "directory TEXT, size INTEGER, mtime INTEGER)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS files_directory ON files (directory)")
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def diff(self, filenames):
+        """Compare files with the index
+
+        @param filenames  Names of files
+        @return IngestDiff
+        """
+        new, changed, unchanged = [], [], []
+        directories = set()
+        present = set()
+        cursor = self.conn.cursor()
+        for filename in filenames:
+            directory, basename = os.path.split(os.path.abspath(filename))
+            directories.add(directory)
+            present.add(basename)
+            row = cursor.execute("SELECT size, mtime FROM files WHERE basename = ?", (basename,)).fetchone()
+            if row is None:
+                new.append(filename)
+            elif tuple(row) != getFileStat(filename):
+                changed.append(filename)
+            else:
+                unchanged.append(filename)
+
+        missing = []
+        for directory in sorted(directories):
+            for basename, in cursor.execute("SELECT basename FROM files WHERE directory = ?", (directory,)):
+                if basename not in present and not os.path.exists(os.path.join(directory, basename)):
+                    missing.append(os.path.join(directory, basename))
+        return IngestDiff(sorted(new), sorted(changed), sorted(unchanged), sorted(missing))
+
+    def update(self, stats):
+        """Record files as ingested, in a single transaction
+
+        The size and modification time are provided by the caller, as they
+        must be obtained before ingest (which may move the file).
+
+        @param stats  dict of (size, mtime) from getFileStat, indexed by
+                      filename
+        """
+        rows = []
+        for filename, stat in stats.items():
+            directory, basename = os.path.split(os.path.abspath(filename))
+            rows.append((basename, directory) + tuple(stat))
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO files (basename, directory, size, mtime) "
+                                  "VALUES (?, ?, ?, ?)", rows)
@@ -0,0 +1,317 @@
+#
+# LSST Data Management System
+# Copyright 2016 LSST Corporation.
+#
+# This product includes software developed by the
+# LSST Project (http://www.lsst.org/).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the LSST License Statement and
+# the GNU General Public License along with this program.  If not,
+# see <http://www.lsstcorp.org/LegalNotices/>.
+#
+"""
+Array-level ISR kernels for Monocam
+
+These operate in place on the image, mask and variance arrays of a
+MaskedImage, processing a band of rows at a time so that each pixel is
+read and written once while the band is in cache, rather than making a
+separate full-frame pass (with full-frame temporaries) for each step.
+
+Also here are the robust estimators of the noise in an image that set the
+floor for the variance, and the mapping of bands of CCD rows to the rows
+of the raw amplifiers, for processing a CCD a band at a time.
+"""
+import math
+
+import numpy
+
+__all__ = ["fusedBiasDarkCorrection", "fusedFlatCorrection", "applyVarianceFloor",
+           "percentileStdev", "subsampleStdev", "histogramStdev", "QuartileHistogram",
+           "varianceFloorEstimators", "getAmpBandRows"]
+
+DEFAULT_ROWS_PER_CHUNK = 128
+
+
+def _iterRows(numRows, rowsPerChunk):
+    """Iterate over slices covering the rows in bands of rowsPerChunk"""
+    for start in range(0, numRows, rowsPerChunk):
+        yield slice(start, min(start + rowsPerChunk, numRows))
+
+
+def fusedBiasDarkCorrection(image, mask, variance, bias=None, dark=None, darkScale=1.0,
+                            rowsPerChunk=DEFAULT_ROWS_PER_CHUNK):
+    """Subtract the bias and the scaled dark in a single pass
+
+    Equivalent to ``maskedImage -= bias`` followed by
+    ``maskedImage.scaledMinus(darkScale, dark)``: the image is corrected,
+    the calibration masks are OR-ed into the mask and the calibration
+    variances are added to the variance.
+
+    @param[in,out] image  Image array to correct
+    @param[in,out] mask  Mask array
+    @param[in,out] variance  Variance array
+    @param[in] bias  tuple of image, mask and variance arrays of the bias, or
+                     None
+    @param[in] dark  tuple of image, mask and variance arrays of the dark, or
+                     None
+    @param[in] darkScale  Factor by which to scale the dark
+    @param[in] rowsPerChunk  Number of rows to process at a time
+    """
+    temp = numpy.empty((min(rowsPerChunk, image.shape[0]), image.shape[1]), dtype=image.dtype)
+    for rows in _iterRows(image.shape[0], rowsPerChunk):
+        img = image[rows]
+        msk = mask[rows]
+        var = variance[rows]
+        tmp = temp[:img.shape[0]]
+        if bias is not None:
+            biasImage, biasMask, biasVariance = bias
+            numpy.subtract(img, biasImage[rows], out=img)
+            numpy.bitwise_or(msk, biasMask[rows], out=msk)
+            numpy.add(var, biasVariance[rows], out=var)
+        if dark is not None:
+            darkImage, darkMask, darkVariance = dark
+            numpy.multiply(darkImage[rows], darkScale, out=tmp)
+            numpy.subtract(img, tmp, out=img)
+            numpy.bitwise_or(msk, darkMask[rows], out=msk)
+            numpy.multiply(darkVariance[rows], darkScale**2, out=tmp)
+            numpy.add(var, tmp, out=var)
+
+
+def fusedFlatCorrection(image, mask, variance, flat, flatScale=1.0, varianceFloor=None,
+                        rowsPerChunk=DEFAULT_ROWS_PER_CHUNK):
+    """Apply a variance floor and divide by the flat in a single pass
+
+    Equivalent to replacing non-positive (and NaN) variances with
+    ``varianceFloor`` followed by
+    ``maskedImage.scaledDivides(1.0/flatScale, flat)``: the image is
+    divided by the scaled flat, the variance is propagated, and the flat's
+    mask is OR-ed into the mask.
+
+    @param[in,out] image  Image array to correct
+    @param[in,out] mask  Mask array
+    @param[in,out] variance  Variance array
+    @param[in] flat  tuple of image, mask and variance arrays of the flat
+    @param[in] flatScale  Scale of the flat (e.g., its mean)
+    @param[in] varianceFloor  Value for non-positive variances, or None to
+                              leave them unchanged
+    @param[in] rowsPerChunk  Number of rows to process at a time
+    """
+    flatImage, flatMask, flatVariance = flat
+    scale = 1.0/flatScale
+    shape = (min(rowsPerChunk, image.shape[0]), image.shape[1])
+    divisorTemp = numpy.empty(shape, dtype=image.dtype)
+    temp = numpy.empty(shape, dtype=image.dtype)
+    badTemp = numpy.empty(shape, dtype=bool)
+    for rows in _iterRows(image.shape[0], rowsPerChunk):
+        img = image[rows]
+        msk = mask[rows]
+        var = variance[rows]
+        numRows = img.shape[0]
+        divisor = divisorTemp[:numRows]
+        tmp = temp[:numRows]
+
+        if varianceFloor is not None:
+            bad = badTemp[:numRows]
+            numpy.greater(var, 0, out=bad)
+            numpy.logical_not(bad, out=bad)
+            numpy.copyto(var, varianceFloor, where=bad)
+
+        if scale == 1.0:
+            divisor = flatImage[rows]
+        else:
+            numpy.multiply(flatImage[rows], scale, out=divisor)
+        numpy.divide(img, divisor, out=img)
+
+        # For a = b/c: var(a) = (var(b) + a^2 var(c))/c^2
+        fv = flatVariance[rows]
+        if fv.any():
+            numpy.multiply(img, img, out=tmp)
+            numpy.multiply(tmp, fv, out=tmp)
+            if scale != 1.0:
+                numpy.multiply(tmp, scale**2, out=tmp)
+            numpy.add(var, tmp, out=var)
+        numpy.multiply(divisor, divisor, out=tmp)
+        numpy.divide(var, tmp, out=var)
+
+        numpy.bitwise_or(msk, flatMask[rows], out=msk)
+
+
+def applyVarianceFloor(variance, floor):
+    """Replace non-positive (and NaN) variances with a floor, in place
+
+    Equivalent to ``variance[:] = numpy.where(variance > 0, variance, floor)``
+    without the full-frame float temporary.
+
+    @param[in,out] variance  Variance array
+    @param[in] floor  Value for non-positive variances
+    """
+    bad = numpy.greater(variance, 0)
+    numpy.logical_not(bad, out=bad)
+    numpy.copyto(variance, floor, where=bad)
+
+
+def _quartilesToStdev(lower, upper):
+    """Convert the interquartile range to a standard deviation"""
+    return 0.74*(upper - lower)
+
+
+def percentileStdev(array):
+    """Robust standard deviation from the exact quartiles of all the pixels
+
+    @param array  Image array
+    @return standard deviation
+    """
+    return _quartilesToStdev(*numpy.percentile(array, [25.0, 75.0]))
+
+
+def subsampleStdev(array, stride=8):
+    """Robust standard deviation from the quartiles of a regular subsample of
+    the pixels
+
+    @param array  Image array
+    @param stride  Take every stride-th pixel in each dimension
+    @return standard deviation
+    """
+    return percentileStdev(array[::stride, ::stride])
+
+
+class QuartileHistogram:
+    """Accumulate a histogram of pixel values, from which to estimate the
+    quartiles
+
+    The histogram covers a fixed range with bins of a fixed width; values
+    outside the range are counted but not binned.  This is well suited to
+    data that are close to integers (like bias-subtracted ADUs), where bins
+    of one unit lose little precision.  Values may be accumulated in several
+    calls (e.g., a band of rows at a time).
+
+    @param lower  Lower end of the range of the histogram
+    @param upper  Upper end of the range of the histogram
+    @param binWidth  Width of the histogram bins
+    """
+
+    def __init__(self, lower, upper, binWidth=1.0):
+        self.lower = lower
+        self.binWidth = binWidth
+        self.numBins = max(1, int(math.ceil((upper - lower)/binWidth)))
+        self.counts = numpy.zeros(self.numBins, dtype=numpy.int64)
+        self.numBelow = 0
+        self.numAbove = 0
+
+    def add(self, array, rowsPerChunk=DEFAULT_ROWS_PER_CHUNK):
+        """Add values to the histogram; non-finite values are ignored
+
+        @param array  Array of values
+        @param rowsPerChunk  Number of rows to process at a time
+        """
+        array = numpy.atleast_2d(array)
+        for rows in _iterRows(array.shape[0], rowsPerChunk):
+            index = (array[rows] - self.lower)/self.binWidth
+            index = index[numpy.isfinite(index)]
+            below = index < 0
+            above = index >= self.numBins
+            self.numBelow += int(below.sum())
+            self.numAbove += int(above.sum())
+            index = index[~(below | above)].astype(numpy.int64)
+            self.counts += numpy.bincount(index, minlength=self.numBins)
+
+    def getQuantile(self, fraction):
+        """Return a quantile of the values added
+
+        @param fraction  Quantile of interest (e.g., 0.25 for lower quartile)
+        @return value of the quantile, or None if it falls outside the range
+                of the histogram
+        """
+        total = self.numBelow + int(self.counts.sum()) + self.numAbove
+        if total == 0:
+            return None
+        target = fraction*total - self.numBelow
+        if target < 0:
+            return None
+        cumulative = numpy.cumsum(self.counts)
+        index = int(numpy.searchsorted(cumulative, target, side="left"))
+        if index >= self.numBins:
+            return None
+        previous = cumulative[index - 1] if index > 0 else 0
+        within = (target - previous)/self.counts[index] if self.counts[index] > 0 else 0.5
+        return self.lower + (index + within)*self.binWidth
+
+    def getStdev(self):
+        """Return the robust standard deviation from the quartiles, or None
+        if they fall outside the range of the histogram"""
+        lower = self.getQuantile(0.25)
+        upper = self.getQuantile(0.75)
+        if lower is None or upper is None:
+            return None
+        return _quartilesToStdev(lower, upper)
+
+
+def histogramStdev(array, binWidth=1.0, stride=8):
+    """Robust standard deviation from the quartiles of a histogram of the
+    pixels
+
+    The range of the histogram is set from a subsample of the pixels.  If
+    the quartiles fall outside that range, the exact quartiles are used
+    instead.
+
+    @param array  Image array
+    @param binWidth  Width of the histogram bins
+    @param stride  Stride of the subsample used to set the histogram range
+    @return standard deviation
+    """
+    sample = array[::stride, ::stride]
+    sample = sample[numpy.isfinite(sample)]
+    if sample.size == 0:
+        return percentileStdev(array)
+    lower, upper = numpy.percentile(sample, [5.0, 95.0])
+    margin = 0.1*(upper - lower) + binWidth
+    # Center the bins on multiples of the bin width, so integer-like data
+    # don't fall on the bin edges
+    lower = binWidth*(math.floor((lower - margin)/binWidth) - 0.5)
+    histogram = QuartileHistogram(lower, upper + margin, binWidth)
+    histogram.add(array)
+    stdev = histogram.getStdev()
+    return stdev if stdev is not None else percentileStdev(array)
+
+
+# Estimators of the noise in an image, for setting the variance floor
+varianceFloorEstimators = {
+    "PERCENTILE": lambda array, config: percentileStdev(array),
+    "SUBSAMPLE": lambda array, config: subsampleStdev(array, stride=config.varianceFloorStride),
+    "HISTOGRAM": lambda array, config: histogramStdev(array, binWidth=config.varianceFloorBinWidth,
+                                                      stride=config.varianceFloorStride),
+}
+
+
+def getAmpBandRows(band, ampStart, ampStop, dataStart, flip):
+    """Return the rows of a raw amplifier that cover a band of CCD rows
+
+    @param band  slice of CCD rows (with explicit start and stop)
+    @param ampStart  First CCD row covered by the amplifier
+    @param ampStop  CCD row after the last covered by the amplifier
+    @param dataStart  First row of the data in the raw amplifier
+    @param flip  Is the raw amplifier flipped in y relative to the CCD?
+    @return tuple of the slice of CCD rows in both the band and the
+            amplifier, and the slice of raw rows holding them (in raw order,
+            so reversed relative to the CCD if flip); or None if the band
+            and amplifier don't overlap
+    """
+    start = max(band.start, ampStart)
+    stop = min(band.stop, ampStop)
+    if start >= stop:
+        return None
+    if flip:
+        raw = slice(dataStart + ampStop - stop, dataStart + ampStop - start)
+    else:
+        raw = slice(dataStart + start - ampStart, dataStart + stop - ampStart)
+    return slice(start, stop), raw
@@ -0,0 +1,251 @@
+#
+# LSST Data Management System
+# Copyright 2016 LSST Corporation.
+#
+# This product includes software developed by the
+# LSST Project (http://www.lsst.org/).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the LSST License Statement and
+# the GNU General Public License along with this program.  If not,
+# see <http://www.lsstcorp.org/LegalNotices/>.
+#
+#
+"""
+Ingest of raw data as it arrives during observing
+
+A DirectoryWatcher polls the raw directory tree for new files, and
+LiveIngestTask parses and registers them in small transactions, so they
+are available for processing shortly after they land on disk.
+"""
+import fnmatch
+import os
+import sqlite3
+import time
+
+import lsst.daf.persistence as dafPersist
+from lsst.pex.config import Field
+from .ingest import MonocamIngestConfig, MonocamIngestTask
+
+__all__ = ["DirectoryWatcher", "LiveIngestConfig", "LiveIngestTask"]
+
+RECENT_NS = 2*10**9  # Directories modified within this time (ns) are always listed
+REGISTRY_NAME = "registry.sqlite3"  # Name of the registry, in the repository root
+
+
+class DirectoryWatcher:
+    """Poll a directory tree for new files
+
+    Directories are only listed when their modification time changes (as
+    it does when a file is created in them), so a poll of an unchanged tree
+    costs one stat per directory.  New files are held back until they have
+    not been modified for ``settleTime`` seconds, so files are not returned
+    while they are still being written.
+
+    @param root  Root of directory tree to watch
+    @param pattern  Glob pattern for the names of files of interest
+    @param settleTime  Minimum time (sec) since a file's last modification
+    @param existing  Return files that exist on the first poll?  Otherwise,
+                     only files created later are returned.
+    """
+
+    def __init__(self, root, pattern="*.fits*", settleTime=1.0, existing=False):
+        self.root = root
+        self.pattern = pattern
+        self.settleTime = settleTime
+        self._dirMtimes = {}  # Modification times of directories, at last listing
+        self._subdirs = {}  # Subdirectories of directories, at last listing
+        self._seen = set()  # Files returned (or ignored)
+        self._pending = set()  # Files seen, but not yet settled
+        if not existing:
+            self._seen.update(self._scan())
+            self._pending.clear()
+
+    def _scan(self):
+        """List changed directories, returning new files"""
+        newFiles = []
+        directories = [self.root]
+        now = time.time_ns()
+        while directories:
+            directory = directories.pop()
+            try:
+                mtime = os.stat(directory).st_mtime_ns
+            except OSError:  # Removed
+                self._dirMtimes.pop(directory, None)
+                self._subdirs.pop(directory, None)
+                continue
+            # A directory modified recently is listed again, in case a file
+            # was created within the resolution of the modification time
+            if self._dirMtimes.get(directory) != mtime or now - mtime < RECENT_NS:
+                self._dirMtimes[directory] = mtime
+                subdirs = []
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.is_dir():
+                            subdirs.append(entry.path)
+                        elif fnmatch.fnmatch(entry.name, self.pattern) and entry.path not in self._seen:
+                            newFiles.append(entry.path)
+                self._subdirs[directory] = subdirs
+            directories.extend(self._subdirs[directory])
+        self._pending.update(newFiles)
+        return newFiles
+
+    def poll(self):
+        """Return the files that have appeared and settled since the last
+        poll
+
+        @return list of filenames, in order of modification time
+        """
+        self._scan()
+        now = time.time()
+        ready = []
+        for filename in self._pending:
+            try:
+                mtime = os.stat(filename).st_mtime
+            except OSError:  # Removed before it settled
+                ready.append((None, filename))
+                continue
+            if now - mtime >= self.settleTime:
+                ready.append((mtime, filename))
+        for _, filename in ready:
+            self._pending.discard(filename)
+            self._seen.add(filename)
+        return [filename for mtime, filename in sorted(ready, key=lambda item: item[0] or 0) if
+                mtime is not None]
+
+
+class LiveIngestConfig(MonocamIngestConfig):
+    pattern = Field(dtype=str, default="*.fits*", doc="Glob pattern for the names of raw files")
+    pollInterval = Field(dtype=float, default=0.2, doc="Time (sec) between polls of the raw directories")
+    settleTime = Field(
+        dtype=float,
+        default=0.5,
+        doc="Minimum time (sec) since a file's last modification before it is ingested",
+    )
+    batchSize = Field(dtype=int, default=16, doc="Maximum number of files to register in a transaction")
+    ingestExisting = Field(dtype=bool, default=False, doc="Ingest files that exist when watching starts?")
+
+    def validate(self):
+        MonocamIngestConfig.validate(self)
+        if self.batchSize < 1:
+            raise ValueError("batchSize must be positive: %d" % (self.batchSize,))
+
+
+class LiveIngestTask(MonocamIngestTask):
+    """Ingest raw files as they arrive
+
+    Files are parsed, moved or linked into the repository, and registered
+    in transactions of up to config.batchSize files, each committed to the
+    registry as soon as it is complete.  Files that are already registered
+    are skipped.
+    """
+    ConfigClass = LiveIngestConfig
+    _DefaultName = "ingest"
+
+    def openRegistry(self, root, create=False):
+        """Open the registry for updating in place
+
+        Unlike register.openRegistry, which updates a copy of the registry
+        and replaces the registry with it when closed, the registry is
+        updated directly, with write-ahead logging so that it can be read
+        (e.g., by Butlers processing the new visits) while it is written.
+
+        @param root  Root of data repository
+        @param create  Create the registry (replacing any existing one)?
+        @return sqlite3.Connection
+        """
+        filename = os.path.join(root, REGISTRY_NAME)
+        if create and os.path.exists(filename):
+            os.unlink(filename)
+        exists = os.path.exists(filename)
+        registry = sqlite3.connect(filename)
+        registry.execute("PRAGMA journal_mode=WAL")
+        if not exists:
+            self.register.createTable(registry)
+            registry.commit()
+            os.chmod(filename, self.register.config.permissions)
+        return registry
+
+    def watch(self, root, directory, mode="link", create=False, onVisit=None, maxPolls=None):
+        """Watch a directory tree, ingesting new raw files
+
+        @param root  Root of data repository
+        @param directory  Root of directory tree to watch
+        @param mode  How to put files in the repository: "move", "copy",
+                     "link" or "skip"
+        @param create  Create the registry?
+        @param onVisit  Callable, called with the data identifier of each new
+                        visit once it has been registered (e.g., to queue it
+                        for processing), or None
+        @param maxPolls  Maximum number of polls, or None to run forever
+        """
+        butler = dafPersist.Butler(root=root)
+        watcher = DirectoryWatcher(directory, pattern=self.config.pattern, settleTime=self.config.settleTime,
+                                   existing=self.config.ingestExisting)
+        visits = set()
+        numPolls = 0
+        registry = self.openRegistry(root, create=create)
+        try:
+            while maxPolls is None or numPolls < maxPolls:
+                start = time.time()
+                filenames = watcher.poll()
+                for index in range(0, len(filenames), self.config.batchSize):
+                    batch = filenames[index:index + self.config.batchSize]
+                    newVisits = self.ingestBatch(batch, registry, butler, mode)
+                    for dataId in newVisits:
+                        key = tuple(sorted(dataId.items()))
+                        if key in visits:
+                            continue
+                        visits.add(key)
+                        if onVisit is not None:
+                            onVisit(dataId)
+                numPolls += 1
+                time.sleep(max(0.0, self.config.pollInterval - (time.time() - start)))
+        finally:
+            registry.close()
+
+    def ingestBatch(self, filenames, registry, butler, mode):
+        """Ingest and register files in a single transaction
+
+        The transaction is committed when the batch is complete, so the batch
+        is visible to readers of the registry as soon as this returns, and an
+        interrupted batch leaves the registry as it was.
+
+        @param filenames  Names of files to ingest
+        @param registry  Registry connection, from openRegistry
+        @param butler  Butler for the repository
+        @param mode  How to put files in the repository
+        @return list of data identifiers (with visit) of the files
+                registered
+        """
+        dataIds = []
+        with registry:  # Commits, or rolls back on an exception
+            for infile in filenames:
+                try:
+                    fileInfo, hduInfoList = self.parse.getInfo(infile)
+                    if self.register.check(registry, fileInfo):
+                        self.log.info("Skipping %s: already ingested" % (infile,))
+                        continue
+                    outfile = self.parse.getDestination(butler, fileInfo, infile)
+                    if not self.ingest(infile, outfile, mode=mode):
+                        continue
+                    for info in hduInfoList:
+                        self.register.addRow(registry, info, dryrun=False, create=False)
+                except Exception as exc:
+                    self.log.warn("Failed to ingest %s: %s" % (infile, exc))
+                    continue
+                if "visit" in fileInfo:
+                    dataIds.append(dict(visit=fileInfo["visit"]))
+                self.log.info("Ingested %s" % (infile,))
+            if dataIds:
+                self.register.addVisits(registry, dryrun=False)
+        return dataIds
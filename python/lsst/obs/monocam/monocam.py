@@ -19,6 +19,8 @@
 # the GNU General Public License along with this program.  If not,
 # see <http://www.lsstcorp.org/LegalNotices/>.
 #
+import os
+import threading
 import warnings
 
 import numpy
@@ -30,7 +32,7 @@ from lsst.afw.coord import Observatory
 from lsst.geom import SpherePoint, degrees
 
 
-__all__ = ["Monocam"]
+__all__ = ["Monocam", "getMonocamCamera", "getCameraFilename", "writeCamera"]
 
 
 class Monocam(cameraGeom.Camera):
@@ -45,6 +47,10 @@ class Monocam(cameraGeom.Camera):
     ccd: ccd name: always 0
     visit: exposure number; this will be provided by the DAQ
     """
+    # Increment when the geometry below changes, so that persisted cameras
+    # (see writeCamera) are not used for the wrong geometry.
+    geometryVersion = 1
+
     # Taken from fit4_20160413-154303.pdf
     gain = {(0, 0): 3.707220,
             (1, 0): 3.724264,
@@ -241,6 +247,57 @@ class Monocam(cameraGeom.Camera):
         return ampCatalog
 
 
+_cameraCache = {}  # Cameras already constructed or read, indexed by source
+_cameraLock = threading.Lock()
+
+
+def getCameraFilename(root):
+    """Return the name of the file holding the persisted camera in a repo
+
+    @param root  Root directory of data repository
+    @return filename
+    """
+    return os.path.join(root, "monocamCamera-v%d.fits" % (Monocam.geometryVersion,))
+
+
+def getMonocamCamera(root=None):
+    """Return the Monocam camera, constructing it only once per process
+
+    Constructing the camera from scratch builds the detector and all of the
+    amplifiers, so the result is memoized.  If the camera has been persisted
+    in the repository (with writeCamera), it is read from there instead of
+    being constructed.
+
+    @param root  Root directory of data repository, or None
+    @return lsst.afw.cameraGeom.Camera
+    """
+    filename = getCameraFilename(root) if root else None
+    if filename is not None and os.path.exists(filename):
+        key = (filename, os.stat(filename).st_mtime)
+        with _cameraLock:
+            if key not in _cameraCache:
+                _cameraCache[key] = cameraGeom.Camera.readFits(filename)
+            return _cameraCache[key]
+    with _cameraLock:
+        if None not in _cameraCache:
+            _cameraCache[None] = Monocam()
+        return _cameraCache[None]
+
+
+def writeCamera(root):
+    """Persist the Monocam camera in a data repository
+
+    Mappers for the repository will read the camera rather than constructing
+    it.
+
+    @param root  Root directory of data repository
+    @return name of file written
+    """
+    filename = getCameraFilename(root)
+    getMonocamCamera().writeFits(filename)
+    return filename
+
+
 class MakeMonocamRawVisitInfo(MakeRawVisitInfo):
     """Make a VisitInfo from the FITS header of a raw Monocam image"""
     observatory = Observatory(-111.740278*degrees, 35.184167*degrees, 2273)  # long, lat, elev
@@ -20,15 +20,153 @@
 # see <http://www.lsstcorp.org/LegalNotices/>.
 #
 
+import contextlib
+import math
+import multiprocessing
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy
 
 import lsst.afw.image
+import lsst.afw.math as afwMath
+import lsst.geom as geom
 import lsst.ip.isr as ip_isr
+import lsst.pex.config as pexConfig
 import lsst.pipe.base as pipe_base
+from lsst.afw.fits import readMetadata
 from lsst.obs.base import MakeRawVisitInfo
+from . import isrFunctions
+from .calibSidecar import getSidecarNames, hasSidecar
+from .defects import DefectMap
+from .monocam import MakeMonocamRawVisitInfo
+from .prefetch import Prefetcher
+from .sharedCalibs import SharedCalibStore, mapArray
+from .stepTimer import StepTimer
+
+__all__ = ["MonocamIsrConfig", "MonocamIsrTask"]
+
+
+class MonocamIsrConfig(ip_isr.IsrConfig):
+    numThreads = pexConfig.Field(
+        dtype=int,
+        default=1,
+        doc="Number of threads used for the per-amplifier processing (conversion to float, saturation "
+            "detection and overscan correction) before CCD assembly; 1 means process the amps serially",
+    )
+    prefetchDepth = pexConfig.Field(
+        dtype=int,
+        default=1,
+        doc="Number of visits for which raw and calibration data are read ahead by runDataRefStream",
+    )
+    prefetchMaxMegabytes = pexConfig.Field(
+        dtype=float,
+        default=2048.0,
+        doc="Maximum size (MB) of the raw and calibration data read ahead by runDataRefStream; the data "
+            "for at least one visit is always read ahead",
+    )
+    doFusedCorrection = pexConfig.Field(
+        dtype=bool,
+        default=False,
+        doc="Apply the bias and dark corrections, and the variance floor and flat correction, as fused "
+            "in-place passes over the image? Not used with brighter-fatter correction, fringe correction "
+            "before flat-fielding, or calibrations that must be trimmed to fit",
+    )
+    fusedRowsPerChunk = pexConfig.Field(
+        dtype=int,
+        default=128,
+        doc="Number of rows processed at a time by the fused corrections",
+    )
+    varianceFloorEstimator = pexConfig.ChoiceField(
+        dtype=str,
+        default="PERCENTILE",
+        doc="Method for estimating the noise in the image, used as the floor for the variance",
+        allowed={
+            "PERCENTILE": "Exact quartiles of all the pixels",
+            "SUBSAMPLE": "Quartiles of every varianceFloorStride-th pixel in each dimension",
+            "HISTOGRAM": "Quartiles from a histogram with bins of varianceFloorBinWidth",
+        },
+    )
+    varianceFloorStride = pexConfig.Field(
+        dtype=int,
+        default=8,
+        doc="Stride for subsampling the image with varianceFloorEstimator SUBSAMPLE, and for setting the "
+            "range of the histogram with HISTOGRAM",
+    )
+    varianceFloorBinWidth = pexConfig.Field(
+        dtype=float,
+        default=1.0,
+        doc="Width of the histogram bins with varianceFloorEstimator HISTOGRAM",
+    )
+    sharedCalibDir = pexConfig.Field(
+        dtype=str,
+        default="",
+        doc="Directory in which runBatch places the calibration frames shared between its processes; "
+            "a RAM-backed filesystem such as /dev/shm is recommended. If empty, the system temporary "
+            "directory is used",
+    )
+
+    doStepTiming = pexConfig.Field(
+        dtype=bool,
+        default=False,
+        doc="Record the wall and CPU time of each step of ISR in the task metadata? Steps are timed for "
+            "sensors processed with runDataRef, runDataRefStream and runBatch",
+    )
+    doStepMemory = pexConfig.Field(
+        dtype=bool,
+        default=False,
+        doc="Also record the peak memory allocated by each step (with tracemalloc, which slows down "
+            "processing)? Requires doStepTiming",
+    )
+    bandRows = pexConfig.Field(
+        dtype=int,
+        default=0,
+        doc="If positive, runDataRef processes the CCD in bands of this many rows, reading the raw "
+            "amplifiers and calibrations a band at a time to bound the memory used (the output exposure "
+            "is still full-frame); calibrations are memory-mapped from their sidecars (see "
+            "materializeCalibs.py) where available. Requires a scalar overscanFitType (MEAN, MEDIAN or "
+            "MEANCLIP), a varianceFloorEstimator other than PERCENTILE, flatScalingType USER, trimmed "
+            "assembly, and no brighter-fatter or fringe correction",
+    )
+    stepTimingFile = pexConfig.Field(
+        dtype=str,
+        default="",
+        doc="File to which the step timings of each sensor are appended as a line of JSON, if "
+            "doStepTiming; empty for none",
+    )
+
+    def validate(self):
+        ip_isr.IsrConfig.validate(self)
+        if self.numThreads < 1:
+            raise ValueError("numThreads must be at least 1: %d" % (self.numThreads,))
+        if self.varianceFloorStride < 1:
+            raise ValueError("varianceFloorStride must be at least 1: %d" % (self.varianceFloorStride,))
+        if self.varianceFloorBinWidth <= 0:
+            raise ValueError("varianceFloorBinWidth must be positive: %f" % (self.varianceFloorBinWidth,))
+        if self.fusedRowsPerChunk < 1:
+            raise ValueError("fusedRowsPerChunk must be at least 1: %d" % (self.fusedRowsPerChunk,))
+        if self.prefetchDepth < 1:
+            raise ValueError("prefetchDepth must be at least 1: %d" % (self.prefetchDepth,))
+        if self.bandRows < 0:
+            raise ValueError("bandRows must not be negative: %d" % (self.bandRows,))
+        if self.bandRows > 0:
+            if self.overscanFitType not in ("MEAN", "MEDIAN", "MEANCLIP"):
+                raise ValueError("bandRows requires a scalar overscanFitType: %s" % (self.overscanFitType,))
+            if self.varianceFloorEstimator == "PERCENTILE":
+                raise ValueError("bandRows requires a varianceFloorEstimator other than PERCENTILE")
+            if self.doFlat and self.flatScalingType != "USER":
+                raise ValueError("bandRows requires flatScalingType USER: %s" % (self.flatScalingType,))
+            if not self.assembleCcd.doTrim:
+                raise ValueError("bandRows requires assembleCcd.doTrim")
+            if self.doBrighterFatter or self.doFringe:
+                raise ValueError("bandRows does not support brighter-fatter or fringe correction")
 
 
 class MonocamIsrTask(ip_isr.IsrTask, MakeRawVisitInfo):
+    ConfigClass = MonocamIsrConfig
+    sharedCalibs = None  # SharedCalibStore of calibrations shared between processes, set by runBatch
+    _stepTimer = None  # StepTimer for the sensor being processed, if config.doStepTiming
 
     @pipe_base.timeMethod
     def run(self, ccdExposure, bias=None, dark=None, flat=None, defects=None, fringes=None, bfKernel=None,
@@ -44,7 +182,7 @@ class MonocamIsrTask(ip_isr.IsrTask, MakeRawVisitInfo):
         @param[in] bias -- exposure of bias frame
         @param[in] dark -- exposure of dark frame
         @param[in] flat -- exposure of flatfield
-        @param[in] defects -- list of detects
+        @param[in] defects -- DefectMap or list of defects
         @param[in] fringes -- a pipe_base.Struct with field fringes containing
                               exposure of fringe frame or list of fringe
                               exposure
@@ -73,49 +211,95 @@ class MonocamIsrTask(ip_isr.IsrTask, MakeRawVisitInfo):
 
         ccd = ccdExposure.getDetector()
 
-        if self.config.doBias:
-            self.biasCorrection(ccdExposure, bias)
-
-        if self.config.doBrighterFatter:
-            self.brighterFatterCorrection(ccdExposure, bfKernel,
-                                          self.config.brighterFatterMaxIter,
-                                          self.config.brighterFatterThreshold,
-                                          self.config.brighterFatterApplyGain,
-                                          )
-
-        if self.config.doDark:
-            self.darkCorrection(ccdExposure, dark)
-
-        for amp in ccd:
-            # if ccdExposure is one amp, check for coverage to prevent
-            # performing ops multiple times
-            if ccdExposure.getBBox().contains(amp.getBBox()):
-                ampExposure = ccdExposure.Factory(ccdExposure, amp.getBBox())
-                self.updateVariance(ampExposure, amp)
+        useBias = bias if self.config.doBias else None
+        useDark = dark if self.config.doDark else None
+        useFlat = flat if self.config.doFlat else None
+        fuseBiasDark = (self.config.doFusedCorrection and not self.config.doBrighterFatter and
+                        self._canFuse(ccdExposure, useBias, useDark))
+        fuseFlat = (self.config.doFusedCorrection and useFlat is not None and
+                    self.config.flatScalingType == "USER" and
+                    not (self.config.doFringe and not self.config.fringeAfterFlat) and
+                    self._canFuse(ccdExposure, useFlat))
+
+        if fuseBiasDark:
+            with self._step("fusedBiasDark"):
+                self.fusedBiasDarkCorrection(ccdExposure, useBias, useDark)
+        else:
+            if self.config.doBias:
+                with self._step("bias"):
+                    self.biasCorrection(ccdExposure, bias)
+
+            if self.config.doBrighterFatter:
+                with self._step("brighterFatter"):
+                    self.brighterFatterCorrection(ccdExposure, bfKernel,
+                                                  self.config.brighterFatterMaxIter,
+                                                  self.config.brighterFatterThreshold,
+                                                  self.config.brighterFatterApplyGain,
+                                                  )
+
+            if self.config.doDark:
+                with self._step("dark"):
+                    self.darkCorrection(ccdExposure, dark)
+
+        with self._step("variance"):
+            for amp in ccd:
+                # if ccdExposure is one amp, check for coverage to prevent
+                # performing ops multiple times
+                if ccdExposure.getBBox().contains(amp.getBBox()):
+                    ampExposure = ccdExposure.Factory(ccdExposure, amp.getBBox())
+                    self.updateVariance(ampExposure, amp)
 
         # Don't trust the variance not to be negative (over-subtraction of
         # dark?)
         # Where it's negative, set it to a robust measure of the variance on
         # the image.
         variance = ccdExposure.getMaskedImage().getVariance().getArray()
-        quartiles = numpy.percentile(ccdExposure.getMaskedImage().getImage().getArray(), [25.0, 75.0])
-        stdev = 0.74*(quartiles[1] - quartiles[0])
-        variance[:] = numpy.where(variance > 0, variance, stdev**2)
-
-        if self.config.doFringe and not self.config.fringeAfterFlat:
-            self.fringe.run(ccdExposure, **fringes.getDict())
-
-        if self.config.doFlat:
-            self.flatCorrection(ccdExposure, flat)
-
-        self.maskAndInterpDefect(ccdExposure, defects)
+        with self._step("varianceFloor"):
+            stdev = self.estimateStdev(ccdExposure)
+        if fuseFlat:
+            # The variance floor is applied in the same pass as the flat
+            with self._step("fusedFlat"):
+                self.fusedFlatCorrection(ccdExposure, useFlat, varianceFloor=stdev**2)
+        else:
+            with self._step("varianceFloor"):
+                isrFunctions.applyVarianceFloor(variance, stdev**2)
+
+            if self.config.doFringe and not self.config.fringeAfterFlat:
+                with self._step("fringe"):
+                    self.fringe.run(ccdExposure, **fringes.getDict())
+
+            if self.config.doFlat:
+                with self._step("flat"):
+                    self.flatCorrection(ccdExposure, flat)
+
+        return self.interpolateAndCalibrate(ccdExposure, defects, fringes)
+
+    def interpolateAndCalibrate(self, ccdExposure, defects, fringes):
+        """!Perform the instrument signature removal that follows the flat
+        correction
+
+        Interpolates over defects, saturated pixels and NaNs, applies the
+        fringe correction if config.fringeAfterFlat, and sets the PhotoCalib.
+
+        @param[in,out] ccdExposure -- exposure to process
+        @param[in] defects -- DefectMap or list of defects
+        @param[in] fringes -- a pipe_base.Struct with field fringes, as for
+                              run
+        @return a pipe_base.Struct with field:
+         - exposure
+        """
+        with self._step("defects"):
+            self.maskAndInterpDefect(ccdExposure, defects)
 
-        self.saturationInterpolation(ccdExposure)
+        with self._step("saturationInterpolation"):
+            self.saturationInterpolation(ccdExposure)
 
-        self.maskAndInterpNan(ccdExposure)
+        with self._step("nanInterpolation"):
+            self.maskAndInterpNan(ccdExposure)
 
         if self.config.doFringe and self.config.fringeAfterFlat:
-            self.fringe.run(ccdExposure, **fringes.getDict())
+            with self._step("fringe"):
+                self.fringe.run(ccdExposure, **fringes.getDict())
 
         ccdExposure.setPhotoCalib(lsst.afw.image.makePhotoCalibFromCalibZeroPoint(self.config.fluxMag0T1, 0))
 
@@ -123,6 +307,167 @@ class MonocamIsrTask(ip_isr.IsrTask, MakeRawVisitInfo):
             exposure=ccdExposure,
         )
 
+    @staticmethod
+    def _canFuse(ccdExposure, *calibs):
+        """Do the calibrations match the exposure, as required for the
+        fused corrections?"""
+        return all(calib is None or calib.getBBox() == ccdExposure.getBBox() for calib in calibs)
+
+    def _makeStepTimer(self):
+        """Return a StepTimer for a sensor, or None if config.doStepTiming
+        is False"""
+        if not self.config.doStepTiming:
+            return None
+        return StepTimer(traceMemory=self.config.doStepMemory)
+
+    def _step(self, name):
+        """Return a context manager timing a step of the processing of
+        the current sensor (a no-op if steps are not being timed)"""
+        timer = self._stepTimer
+        return _noStep if timer is None else timer.step(name)
+
+    def _finishSteps(self, dataId):
+        """Record the step timings for the current sensor in the task
+        metadata and config.stepTimingFile, and stop timing steps"""
+        timer = self._stepTimer
+        self._stepTimer = None
+        if timer is None:
+            return
+        timer.close()
+        timer.record(self.metadata)
+        if self.config.stepTimingFile:
+            timer.writeJson(self.config.stepTimingFile, dataId=dataId)
+
+    @staticmethod
+    def _getArrays(exposure):
+        """Return the image, mask and variance arrays of an exposure"""
+        maskedImage = exposure.getMaskedImage()
+        return (maskedImage.getImage().getArray(), maskedImage.getMask().getArray(),
+                maskedImage.getVariance().getArray())
+
+    def estimateStdev(self, exposure):
+        """!Return a robust estimate of the noise in an exposure, using the
+        estimator selected by config.varianceFloorEstimator
+
+        @param[in] exposure -- exposure of interest
+        @return standard deviation of the image
+        """
+        estimator = isrFunctions.varianceFloorEstimators[self.config.varianceFloorEstimator]
+        return estimator(exposure.getMaskedImage().getImage().getArray(), self.config)
+
+    def getDarkScale(self, exposure, darkExposure):
+        """!Return the factor by which to scale the dark for an exposure
+
+        @param[in] exposure -- exposure to be dark-corrected
+        @param[in] darkExposure -- dark exposure
+        @return ratio of the dark times of the exposure and the dark
+        """
+        return self._getDarkScale(exposure, darkExposure.getInfo().getVisitInfo())
+
+    def _getDarkScale(self, exposure, darkVisitInfo):
+        """Return the factor by which to scale the dark, given the
+        VisitInfo of the dark (which may be None)"""
+        expScale = exposure.getInfo().getVisitInfo().getDarkTime()
+        if math.isnan(expScale):
+            raise RuntimeError("Exposure darktime is NAN")
+        darkScale = darkVisitInfo.getDarkTime() if darkVisitInfo is not None else 1.0
+        if math.isnan(darkScale):
+            raise RuntimeError("Dark calib darktime is NAN")
+        return expScale/darkScale
+
+    def fusedBiasDarkCorrection(self, exposure, bias=None, dark=None):
+        """!Apply the bias and dark corrections in a single in-place pass
+
+        Equivalent to biasCorrection followed by darkCorrection.
+
+        @param[in,out] exposure -- exposure to correct
+        @param[in] bias -- bias exposure, or None
+        @param[in] dark -- dark exposure, or None
+        """
+        darkScale = self.getDarkScale(exposure, dark) if dark is not None else 1.0
+        isrFunctions.fusedBiasDarkCorrection(
+            *self._getArrays(exposure),
+            bias=self._getArrays(bias) if bias is not None else None,
+            dark=self._getArrays(dark) if dark is not None else None,
+            darkScale=darkScale,
+            rowsPerChunk=self.config.fusedRowsPerChunk,
+        )
+
+    def fusedFlatCorrection(self, exposure, flat, varianceFloor=None):
+        """!Apply the variance floor and flat correction in a single
+        in-place pass
+
+        Equivalent to replacing non-positive variances with varianceFloor
+        followed by flatCorrection (with config.flatScalingType "USER").
+
+        @param[in,out] exposure -- exposure to correct
+        @param[in] flat -- flat exposure
+        @param[in] varianceFloor -- value for non-positive variances, or None
+        """
+        isrFunctions.fusedFlatCorrection(
+            *self._getArrays(exposure),
+            flat=self._getArrays(flat),
+            flatScale=self.config.flatUserScale,
+            varianceFloor=varianceFloor,
+            rowsPerChunk=self.config.fusedRowsPerChunk,
+        )
+
+    def maskAndInterpDefect(self, ccdExposure, defectBaseList):
+        """!Mask defects and interpolate over them
+
+        A DefectMap (as provided by the mapper) is OR-ed into the BAD mask
+        plane in a single vectorized operation, rather than converting and
+        handling each defect separately.  The interpolation uses a separate
+        mask holding only the defects (so pixels that are BAD for other
+        reasons aren't interpolated, as with ip_isr.IsrTask), rather than a
+        temporary mask plane, as the mask planes are shared by all the masks
+        in the process (including those being made by other threads).
+        Other lists of defects are handled by ip_isr.IsrTask.
+
+        @param[in,out] ccdExposure -- exposure to process
+        @param[in] defectBaseList -- DefectMap, or list of defects
+        """
+        if not isinstance(defectBaseList, DefectMap):
+            return ip_isr.IsrTask.maskAndInterpDefect(self, ccdExposure, defectBaseList)
+        if len(defectBaseList) == 0:
+            return
+        maskedImage = ccdExposure.getMaskedImage()
+        mask = maskedImage.getMask()
+        defectBaseList.maskPixels(mask, maskName="BAD")
+
+        # The image and variance are shared, so are interpolated in place
+        defectMask = mask.Factory(mask.getBBox())
+        defectBaseList.maskPixels(defectMask, maskName="BAD")
+        defectImage = maskedImage.Factory(maskedImage.getImage(), defectMask, maskedImage.getVariance())
+        ip_isr.isrFunctions.interpolateFromMask(
+            maskedImage=defectImage,
+            fwhm=self.config.fwhm,
+            growSaturatedFootprints=0,
+            maskName="BAD",
+        )
+        mask.getArray()[:] |= defectMask.getArray() & defectMask.getPlaneBitMask("INTRP")
+
+    def processAmp(self, ampExposure, channel):
+        """!Perform the per-amplifier processing that precedes CCD assembly
+
+        Converts the raw amplifier image to floating point, then detects
+        saturation and applies the overscan correction.
+
+        @param[in] ampExposure -- raw amplifier exposure
+        @param[in] channel -- index of the amplifier in the detector
+        @return a tuple of the amplifier and the processed exposure
+        """
+        with self._step("convertIntToFloat"):
+            ampExposure = self.convertIntToFloat(ampExposure)
+        # assumes amps are in order of the channels
+        amp = ampExposure.getDetector()[channel]
+
+        with self._step("saturationDetection"):
+            self.saturationDetection(ampExposure, amp)
+        with self._step("overscan"):
+            self.overscanCorrection(ampExposure, amp)
+        return amp, ampExposure
+
     @pipe_base.timeMethod
     def runDataRef(self, sensorRef):
         """!Perform instrument signature removal on a ButlerDataRef of a Sensor
@@ -132,33 +477,434 @@ class MonocamIsrTask(ip_isr.IsrTask, MakeRawVisitInfo):
         - Persist the ISR-corrected exposure as "postISRCCD" if config.doWrite
           is True
 
+        If config.bandRows is positive, the CCD is processed a band of rows
+        at a time (see runDataRefBanded).
+
+        If config.doStepTiming, each step is timed (see writeResult).
+
         @param[in] sensorRef -- daf.persistence.butlerSubset.ButlerDataRef
                                 of the detector data to be processed
         @return a pipe_base.Struct with fields:
         - exposure: the exposure after application of ISR
         """
         self.log.info("Performing ISR on sensor %s" % (sensorRef.dataId))
-        # We should probably loop over this using the butler.
-        ampDict = {}
-        for channel in range(16):
-            sensorRef.dataId['channel'] = channel+1  # to get the correct channel
-            ampExposure = sensorRef.get('raw_amp', immediate=True)
-#            ampExposure = sensorRef.get('raw', immediate=True)
-            ampExposure = self.convertIntToFloat(ampExposure)
-            # assumes amps are in order of the channels
-            amp = ampExposure.getDetector()[channel]
+        self._stepTimer = self._makeStepTimer()
+        if self.config.bandRows > 0:
+            return self.writeResult(sensorRef, self.runDataRefBanded(sensorRef))
+        # Read all the amps with a single open of the raw file
+        with self._step("readRaw"):
+            ampExposures = sensorRef.get('raw_amps', immediate=True)
+        ccdExposure = self.assembleAmps(ampExposures)
 
-            self.saturationDetection(ampExposure, amp)
-            self.overscanCorrection(ampExposure, amp)
-            ampDict[amp.getName()] = ampExposure
+        with self._step("readCalibs"):
+            isrData = self.readIsrData(sensorRef, ccdExposure)
 
-        ccdExposure = self.assembleCcd.assembleCcd(ampDict)
+        return self.runAndWrite(sensorRef, ccdExposure, isrData)
 
-        isrData = self.readIsrData(sensorRef, ccdExposure)
+    def assembleAmps(self, ampExposures):
+        """!Process the raw amplifier exposures and assemble them into a CCD
 
-        result = self.run(ccdExposure, **isrData.getDict())
+        The per-amplifier processing is done on a thread pool if
+        config.numThreads > 1.
 
+        @param[in] ampExposures -- list of raw amplifier exposures, in
+                                   channel order
+        @return assembled CCD exposure
+        """
+        channels = range(len(ampExposures))
+        if self.config.numThreads > 1:
+            # The amps are independent and the heavy lifting releases the GIL;
+            # map() returns the results in channel order
+            with ThreadPoolExecutor(max_workers=self.config.numThreads) as executor:
+                processed = list(executor.map(self.processAmp, ampExposures, channels))
+        else:
+            processed = [self.processAmp(ampExposure, channel) for
+                         ampExposure, channel in zip(ampExposures, channels)]
+        ampDict = {amp.getName(): ampExposure for amp, ampExposure in processed}
+
+        with self._step("assembly"):
+            return self.assembleCcd.assembleCcd(ampDict)
+
+    def runAndWrite(self, sensorRef, ccdExposure, isrData):
+        """!Perform instrument signature removal on an assembled exposure
+        and persist the result as "postISRCCD" if config.doWrite is True
+
+        @param[in] sensorRef -- daf.persistence.butlerSubset.ButlerDataRef
+                                of the detector data being processed
+        @param[in] ccdExposure -- assembled CCD exposure
+        @param[in] isrData -- a pipe_base.Struct of the calibration data, as
+                              returned by readIsrData
+        @return a pipe_base.Struct with fields:
+        - exposure: the exposure after application of ISR
+        """
+        return self.writeResult(sensorRef, self.run(ccdExposure, **isrData.getDict()))
+
+    def writeResult(self, sensorRef, result):
+        """!Persist the result of instrument signature removal as
+        "postISRCCD" if config.doWrite is True
+
+        If steps are being timed (config.doStepTiming), the timings are
+        then recorded in the task metadata (see StepTimer.record), and
+        appended to config.stepTimingFile if set.
+
+        @param[in] sensorRef -- daf.persistence.butlerSubset.ButlerDataRef
+                                of the detector data processed
+        @param[in] result -- a pipe_base.Struct with field exposure, as
+                             returned by run
+        @return result
+        """
         if self.config.doWrite:
-            sensorRef.put(result.exposure, "postISRCCD")
+            with self._step("write"):
+                sensorRef.put(result.exposure, "postISRCCD")
 
+        self._finishSteps(sensorRef.dataId)
         return result
+
+    def runDataRefBanded(self, sensorRef):
+        """!Perform instrument signature removal on a sensor a band of rows
+        at a time, to bound the memory used
+
+        The output exposure is allocated in full, but rather than holding
+        all of the raw amplifiers (as integers and as floats), the assembled
+        CCD and the full-frame bias, dark and flat at once, the raw data and
+        calibrations are read a band of config.bandRows CCD rows at a time:
+        the raw data with partial reads of the raw file, and the
+        calibrations from their memory-mapped sidecars (calibrations without
+        sidecars are read in full).
+
+        The bands are processed in two passes.  The first assembles the
+        overscan-corrected amplifiers, detects saturation and applies the
+        bias and dark corrections and the variance; the second (once the
+        noise has been estimated from the whole frame, for the variance
+        floor) applies the variance floor and the flat.  Interpolation (and
+        the growth of saturated regions) is done over the whole frame, as in
+        run.
+
+        @param[in] sensorRef -- daf.persistence.butlerSubset.ButlerDataRef
+                                of the detector data to be processed
+        @return a pipe_base.Struct with field:
+         - exposure: the exposure after application of ISR
+        """
+        with self._step("readRaw"):
+            # A single amp provides the detector, Wcs, VisitInfo and metadata
+            ampExposure = sensorRef.get("raw_amp", channel=1, immediate=True)
+            rawFilename = sensorRef.get("raw_filename")[0]
+        detector = ampExposure.getDetector()
+        ccdExposure = lsst.afw.image.ExposureF(detector.getBBox())
+        ccdExposure.setDetector(detector)
+        self.assembleCcd.postprocessExposure(outExposure=ccdExposure, inExposure=ampExposure)
+        del ampExposure
+
+        with self._step("readCalibs"):
+            bias = (self._getBandCalib(sensorRef, self.config.biasDataProductName, ccdExposure) if
+                    self.config.doBias else None)
+            dark = (self._getBandCalib(sensorRef, self.config.darkDataProductName, ccdExposure) if
+                    self.config.doDark else None)
+            flat = self._getBandCalib(sensorRef, "flat", ccdExposure) if self.config.doFlat else None
+            defects = sensorRef.get("defects", immediate=True) if self.config.doDefect else []
+        darkScale = self._getDarkScale(ccdExposure, dark.visitInfo) if dark is not None else 1.0
+
+        with self._step("overscan"):
+            overscanLevels = [self._getOverscanLevel(rawFilename, hdu, amp) for
+                              hdu, amp in enumerate(detector, 1)]
+
+        image, mask, variance = self._getArrays(ccdExposure)
+        numRows, bandRows = image.shape[0], self.config.bandRows
+        bands = [slice(start, min(start + bandRows, numRows)) for start in range(0, numRows, bandRows)]
+        ccdExposure.getMask().addMaskPlane(self.config.saturatedMaskName)
+        saturatedBit = ccdExposure.getMask().getPlaneBitMask(self.config.saturatedMaskName)
+        # Calibrations read from images have no mask or variance
+        zeroMask = numpy.zeros((min(bandRows, numRows), image.shape[1]), dtype=mask.dtype)
+        zeroVariance = numpy.zeros(zeroMask.shape, dtype=variance.dtype)
+
+        def getBand(calib, rows):
+            """Return the image, mask and variance of a band of a
+            calibration"""
+            if calib is None:
+                return None
+            calibImage, calibMask, calibVariance = calib.arrays
+            numBandRows = rows.stop - rows.start
+            return (calibImage[rows],
+                    calibMask[rows] if calibMask is not None else zeroMask[:numBandRows],
+                    calibVariance[rows] if calibVariance is not None else zeroVariance[:numBandRows])
+
+        with self._step("bandedAssembly"):
+            for rows in bands:
+                for hdu, (amp, level) in enumerate(zip(detector, overscanLevels), 1):
+                    self._readAmpBand(rawFilename, hdu, amp, level, rows, image, mask, saturatedBit)
+                isrFunctions.fusedBiasDarkCorrection(image[rows], mask[rows], variance[rows],
+                                                     bias=getBand(bias, rows), dark=getBand(dark, rows),
+                                                     darkScale=darkScale,
+                                                     rowsPerChunk=self.config.fusedRowsPerChunk)
+                for amp in detector:
+                    bbox = amp.getBBox()
+                    start, stop = max(rows.start, bbox.getMinY()), min(rows.stop, bbox.getMaxY() + 1)
+                    if start < stop:
+                        columns = slice(bbox.getMinX(), bbox.getMaxX() + 1)
+                        self._updateVarianceArrays(image[start:stop, columns], variance[start:stop, columns],
+                                                   amp)
+
+        with self._step("varianceFloor"):
+            stdev = self.estimateStdev(ccdExposure)
+        with self._step("bandedFlat"):
+            for rows in bands:
+                if flat is not None:
+                    isrFunctions.fusedFlatCorrection(image[rows], mask[rows], variance[rows],
+                                                     flat=getBand(flat, rows),
+                                                     flatScale=self.config.flatUserScale,
+                                                     varianceFloor=stdev**2,
+                                                     rowsPerChunk=self.config.fusedRowsPerChunk)
+                else:
+                    isrFunctions.applyVarianceFloor(variance[rows], stdev**2)
+
+        return self.interpolateAndCalibrate(ccdExposure, defects, pipe_base.Struct(fringes=None))
+
+    def _getBandCalib(self, sensorRef, datasetType, exposure):
+        """Return a calibration for banded processing
+
+        The image is memory-mapped from the calibration's sidecar if there
+        is one; otherwise the calibration is read in full.
+
+        @param sensorRef  Data reference of the science exposure
+        @param datasetType  Type of calibration
+        @param exposure  Exposure to be corrected, for checking the size
+        @return pipe_base.Struct with fields:
+        - arrays: image, mask and variance arrays (the mask and variance
+                  are None if the calibration has none)
+        - visitInfo: VisitInfo of the calibration
+        """
+        filename = sensorRef.get(datasetType + "_filename")[0]
+        if hasSidecar(filename):
+            names = getSidecarNames(filename)
+            image = mapArray(names["image"])
+            if image.shape != (exposure.getHeight(), exposure.getWidth()):
+                raise RuntimeError("Shape of %s %s doesn't match exposure: %s" %
+                                   (datasetType, filename, image.shape))
+            visitInfo = MakeMonocamRawVisitInfo(log=self.log)(readMetadata(names["metadata"], 0), 0)
+            return pipe_base.Struct(arrays=(image, None, None), visitInfo=visitInfo)
+        self.log.warn("No sidecar for %s %s: reading it in full (see materializeCalibs.py)" %
+                      (datasetType, filename))
+        calib = self.getIsrExposure(sensorRef, datasetType)
+        if calib.getBBox() != exposure.getBBox():
+            raise RuntimeError("Bounding box of %s %s doesn't match exposure" % (datasetType, filename))
+        return pipe_base.Struct(arrays=self._getArrays(calib), visitInfo=calib.getInfo().getVisitInfo())
+
+    def _getOverscanLevel(self, rawFilename, hdu, amp):
+        """Return the overscan level of a raw amplifier
+
+        @param rawFilename  Name of raw file
+        @param hdu  HDU of the amplifier
+        @param amp  Amplifier
+        @return statistic of the overscan given by config.overscanFitType
+        """
+        overscan = lsst.afw.image.ImageU(rawFilename, hdu=hdu, bbox=amp.getRawHorizontalOverscanBBox(),
+                                         origin=lsst.afw.image.PARENT)
+        statControl = afwMath.StatisticsControl()
+        statControl.setNumSigmaClip(self.config.overscanNumSigmaClip)
+        overscan = lsst.afw.image.ImageF(overscan.getArray().astype(numpy.float32))
+        statistic = afwMath.stringToStatisticsProperty(self.config.overscanFitType)
+        return afwMath.makeStatistics(overscan, statistic, statControl).getValue()
+
+    def _readAmpBand(self, rawFilename, hdu, amp, overscanLevel, rows, image, mask, saturatedBit):
+        """Read the part of a raw amplifier in a band of CCD rows into the
+        CCD, subtracting the overscan and flagging saturated pixels
+
+        @param rawFilename  Name of raw file
+        @param hdu  HDU of the amplifier
+        @param amp  Amplifier
+        @param overscanLevel  Overscan level to subtract
+        @param rows  slice of CCD rows in the band
+        @param image  CCD image array, updated
+        @param mask  CCD mask array, updated
+        @param saturatedBit  Mask bit for saturated pixels
+        """
+        bbox = amp.getBBox()
+        dataBBox = amp.getRawDataBBox()
+        bandRows = isrFunctions.getAmpBandRows(rows, bbox.getMinY(), bbox.getMaxY() + 1, dataBBox.getMinY(),
+                                               amp.getRawFlipY())
+        if bandRows is None:
+            return
+        ccdRows, rawRows = bandRows
+        rawBBox = geom.Box2I(geom.Point2I(dataBBox.getMinX(), rawRows.start),
+                             geom.Extent2I(dataBBox.getWidth(), rawRows.stop - rawRows.start))
+        raw = lsst.afw.image.ImageU(rawFilename, hdu=hdu, bbox=rawBBox,
+                                    origin=lsst.afw.image.PARENT).getArray()
+        if amp.getRawFlipY():
+            raw = raw[::-1]
+        if amp.getRawFlipX():
+            raw = raw[:, ::-1]
+        columns = slice(bbox.getMinX(), bbox.getMaxX() + 1)
+        numpy.subtract(raw, numpy.float32(overscanLevel), out=image[ccdRows, columns])
+        saturation = amp.getSaturation()
+        if not math.isnan(saturation):
+            ampMask = mask[ccdRows, columns]
+            ampMask[raw >= saturation] |= saturatedBit
+
+    @staticmethod
+    def _updateVarianceArrays(image, variance, amp):
+        """Set the variance from the image, gain and read noise, as
+        ip_isr.isrFunctions.updateVariance does"""
+        gain = amp.getGain()
+        if math.isnan(gain):
+            gain = 1.0
+        numpy.divide(image, gain, out=variance)
+        variance += amp.getReadNoise()**2
+
+    def readDataRef(self, sensorRef):
+        """!Read the raw amplifiers and calibration data for a sensor
+
+        @param[in] sensorRef -- daf.persistence.butlerSubset.ButlerDataRef
+                                of the detector data to be processed
+        @return a pipe_base.Struct with fields:
+        - ampExposures: list of raw amplifier exposures
+        - isrData: a pipe_base.Struct of the calibration data, as returned
+                   by readIsrData
+        - stepTimer: StepTimer holding the timings of the reads, or None if
+                     config.doStepTiming is False
+        """
+        # This may run in a prefetch thread, while another sensor is
+        # processed, so the reads are timed separately
+        stepTimer = self._makeStepTimer()
+        with stepTimer.step("readRaw") if stepTimer is not None else _noStep:
+            ampExposures = sensorRef.get('raw_amps', immediate=True)
+        # The raw amps carry the detector and filter needed to look up the
+        # calibrations
+        with stepTimer.step("readCalibs") if stepTimer is not None else _noStep:
+            isrData = self.readIsrData(sensorRef, ampExposures[0])
+        return pipe_base.Struct(ampExposures=ampExposures, isrData=isrData, stepTimer=stepTimer)
+
+    def runDataRefStream(self, sensorRefs):
+        """!Perform instrument signature removal on a sequence of sensors,
+        reading the data for the following sensors while processing
+
+        The raw amplifiers and calibration data are read in a background
+        thread for up to config.prefetchDepth sensors (and
+        config.prefetchMaxMegabytes) ahead, so that I/O overlaps with the
+        processing of the current sensor.
+
+        @param[in] sensorRefs -- iterable of
+                                 daf.persistence.butlerSubset.ButlerDataRef
+                                 of the detector data to be processed
+        @return iterator over pipe_base.Structs with fields:
+        - exposure: the exposure after application of ISR
+        """
+        if self.config.bandRows > 0:
+            # Reading ahead would hold the data that banded processing avoids
+            for sensorRef in sensorRefs:
+                yield self.runDataRef(sensorRef)
+            return
+        prefetcher = Prefetcher(self.readDataRef, sensorRefs, depth=self.config.prefetchDepth,
+                                maxBytes=int(self.config.prefetchMaxMegabytes*1024**2),
+                                sizeFunc=self._getDataSize)
+        for sensorRef, data in prefetcher:
+            self.log.info("Performing ISR on sensor %s" % (sensorRef.dataId))
+            self._stepTimer = data.stepTimer
+            ccdExposure = self.assembleAmps(data.ampExposures)
+            yield self.runAndWrite(sensorRef, ccdExposure, data.isrData)
+
+    @staticmethod
+    def _getDataSize(data):
+        """Return the approximate size in bytes of the data read by
+        readDataRef"""
+        def exposureSize(exposure):
+            if hasattr(exposure, "getMaskedImage"):
+                exposure = exposure.getMaskedImage()
+            planes = [exposure.getImage(), exposure.getMask(), exposure.getVariance()]
+            return sum(plane.getArray().nbytes for plane in planes)
+
+        total = sum(exposureSize(exposure) for exposure in data.ampExposures)
+        for value in data.isrData.getDict().values():
+            if hasattr(value, "getMaskedImage"):
+                total += exposureSize(value)
+        return total
+
+    def getIsrExposure(self, dataRef, datasetType, immediate=True):
+        """!Retrieve a calibration exposure
+
+        Calibrations are taken from the shared calibration store if one has
+        been set (by runBatch), and from the butler otherwise.
+
+        @param[in] dataRef -- data reference of the science exposure
+        @param[in] datasetType -- type of calibration to read
+        @param[in] immediate -- if True, disable butler proxies
+        @return calibration exposure
+        """
+        if self.sharedCalibs is not None:
+            key = self.sharedCalibs.getKey(dataRef, datasetType)
+            if self.sharedCalibs.has(key):
+                return self.sharedCalibs.get(key, dataRef.get("camera"))
+        return ip_isr.IsrTask.getIsrExposure(self, dataRef, datasetType, immediate=immediate)
+
+    def runBatch(self, sensorRefs, numProcesses):
+        """!Perform instrument signature removal on many sensors with a pool
+        of processes
+
+        The bias, dark and flat needed by the sensors are each read once, in
+        this process, and written as uncompressed arrays into
+        config.sharedCalibDir.  The worker processes memory-map these, so
+        the calibrations are shared between the workers instead of each
+        worker reading and decompressing its own copy.
+
+        Errors processing a sensor are logged, and don't prevent processing
+        of the remaining sensors.  The results are persisted according to
+        config.doWrite, but not returned.
+
+        @param[in] sensorRefs -- iterable of
+                                 daf.persistence.butlerSubset.ButlerDataRef
+                                 of the detector data to be processed
+        @param[in] numProcesses -- number of worker processes
+        @return list of dataIds of the sensors that failed
+        """
+        sensorRefs = list(sensorRefs)
+        datasetTypes = [name for name, doIt in ((self.config.biasDataProductName, self.config.doBias),
+                                                (self.config.darkDataProductName, self.config.doDark),
+                                                ("flat", self.config.doFlat)) if doIt]
+        if self.config.bandRows > 0:
+            # Banded processing memory-maps the calibration sidecars, which
+            # the workers share through the page cache
+            datasetTypes = []
+        directory = tempfile.mkdtemp(prefix="monocamCalibs-", dir=self.config.sharedCalibDir or None)
+        try:
+            store = SharedCalibStore(directory)
+            for sensorRef in sensorRefs:
+                for datasetType in datasetTypes:
+                    key = store.getKey(sensorRef, datasetType)
+                    if not store.has(key):
+                        self.log.info("Sharing %s %s" % (datasetType, key[1]))
+                        store.put(key, ip_isr.IsrTask.getIsrExposure(self, sensorRef, datasetType))
+
+            with multiprocessing.Pool(numProcesses, initializer=_initBatchWorker,
+                                      initargs=(self.config, directory)) as pool:
+                failed = [dataId for dataId in pool.map(_runBatchWorker, sensorRefs, chunksize=1) if
+                          dataId is not None]
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+        for dataId in failed:
+            self.log.warn("ISR failed for sensor %s" % (dataId,))
+        return failed
+
+
+_noStep = contextlib.nullcontext()  # Context manager for steps that aren't timed
+
+_batchTask = None  # MonocamIsrTask used by a runBatch worker process
+
+
+def _initBatchWorker(config, directory):
+    """Construct the task for a runBatch worker process"""
+    global _batchTask
+    _batchTask = MonocamIsrTask(config=config)
+    _batchTask.sharedCalibs = SharedCalibStore(directory)
+
+
+def _runBatchWorker(sensorRef):
+    """Process a sensor in a runBatch worker process
+
+    @return the dataId if processing failed, otherwise None
+    """
+    try:
+        _batchTask.runDataRef(sensorRef)
+    except Exception as exc:
+        _batchTask.log.fatal("Failed on dataId=%s: %s" % (sensorRef.dataId, exc))
+        return sensorRef.dataId
+    return None
@@ -21,25 +21,64 @@
 #
 
 import os.path
+import numpy
 import lsst.afw.image.utils as afwImageUtils
-import lsst.geom as geom
 import lsst.afw.image as afwImage
+import lsst.afw.fits as afwFits
 from lsst.afw.fits import readMetadata
 from lsst.obs.base import CameraMapper
 from lsst.daf.persistence import Policy
-from .monocam import Monocam, MakeMonocamRawVisitInfo
+from .monocam import MakeMonocamRawVisitInfo, getMonocamCamera
+from .cache import LruCache
+from .calibManifest import readCalibManifest
+from .calibSidecar import getSidecarNames, hasSidecar, readCalibImage
+from .defects import DefectMap, readDefectMaps
+from .fitsHeader import readPrimaryHeader, stripExtension
+from .policyCache import readPolicy
+from .sharedCalibs import mapArray
+from .shutter import getShutterDatabase
 
 __all__ = ["MonocamMapper"]
 
+_UNREAD = object()  # Marker for data not yet read
+
 
 class MonocamMapper(CameraMapper):
     packageName = 'obs_monocam'
 
     MakeRawVisitInfoClass = MakeMonocamRawVisitInfo
 
-    def __init__(self, inputPolicy=None, **kwargs):
+    # Number of standardized calibration exposures (bias, dark and flat) to
+    # keep in memory; enough for the calibrations of one visit by default.
+    calibCacheSize = 3
+
+    # Number of raw primary headers to keep in memory
+    headerCacheSize = 256
+
+    # Number of visits for which to keep the Wcs and VisitInfo in memory
+    visitCacheSize = 16
+
+    # Name of the defects file, in the defects directory of the policy
+    defectsFile = "defects.txt"
+
+    # Name of the database of shutter headers (see suckMetadata.py), in the
+    # repository root; if present, the shutter headers matched to a raw file
+    # are applied to its header when it is read.  None disables this.
+    shutterDatabaseName = "monocam.sqlite"
+
+    def __init__(self, inputPolicy=None, calibCacheSize=None, **kwargs):
+        if calibCacheSize is None:
+            calibCacheSize = self.calibCacheSize
+        self.calibCache = LruCache(calibCacheSize)
+        self.defectCache = LruCache(1)
+        self.headerCache = LruCache(self.headerCacheSize)
+        self.visitCache = LruCache(self.visitCacheSize)
+        self._calibManifest = _UNREAD
+        self._calibManifestAnyFilter = {}
+        self._visitDates = None  # Date and filter of each visit
+
         policyFile = Policy.defaultPolicyFile(self.packageName, "monocamMapper.yaml", "policy")
-        policy = Policy(policyFile)
+        policy = readPolicy(policyFile)
 
         CameraMapper.__init__(self, policy, os.path.dirname(policyFile), **kwargs)
 
@@ -53,7 +92,7 @@ class MonocamMapper(CameraMapper):
                 'object': str,
                 'imageType': str,
                 }
-        for name in ("raw", "raw_amp",
+        for name in ("raw", "raw_amp", "raw_amps",
                      # processCcd outputs
                      "postISRCCD", "calexp", "postISRCCD", "src", "icSrc", "srcMatch",
                      ):
@@ -63,14 +102,7 @@ class MonocamMapper(CameraMapper):
         # intend to use.
         self.filterIdMap = {'u': 0, 'g': 1, 'r': 2, 'i': 3, 'z': 4, 'y': 5}
 
-        # The LSST Filters from L. Jones 04/07/10
-        afwImageUtils.defineFilter('u', 364.59)
-        afwImageUtils.defineFilter('g', 476.31, alias=["SDSSG"])
-        afwImageUtils.defineFilter('r', 619.42, alias=["SDSSR"])
-        afwImageUtils.defineFilter('i', 752.06, alias=["SDSSI"])
-        afwImageUtils.defineFilter('z', 866.85, alias=["SDSSZ"])
-        afwImageUtils.defineFilter('y', 971.68, alias=['y4'])  # official y filter
-        afwImageUtils.defineFilter('NONE', 0.0, alias=['no_filter', "OPEN"])
+        defineFilters()
 
     def _extractDetectorName(self, dataId):
         return "0"
@@ -95,6 +127,95 @@ class MonocamMapper(CameraMapper):
             dataId["visit"] = int(visit)
         return dataId
 
+    def map(self, datasetType, dataId, write=False):
+        """Map a data identifier to a location
+
+        For calibrations, the calibDate (and filter, if used) are resolved
+        from the calibration manifest where possible (see _resolveCalib),
+        so the mapping need not look them up in the registries.
+        """
+        calibType = datasetType.partition("_")[0]  # e.g., bias_filename --> bias
+        if not write and calibType in self.calibrations:
+            dataId = self._resolveCalib(calibType, dataId)
+        return CameraMapper.map(self, datasetType, dataId, write=write)
+
+    def _resolveCalib(self, calibType, dataId):
+        """Add the calibDate of a calibration to a data identifier
+
+        The calibDate is taken from the manifest of the calibrations to use
+        for each night (see lsst.obs.monocam.calibManifest), and the date and
+        filter of the visit from the raw registry; both are read once and
+        memoized.  If either is unavailable, the data identifier is returned
+        unchanged, for the usual lookup by validity range.
+
+        @param calibType  Calibration dataset type (e.g., "bias")
+        @param dataId  Data identifier
+        @return data identifier, with calibDate if it could be resolved
+        """
+        if "calibDate" in dataId:
+            return dataId
+        manifest = self._getCalibManifest()
+        if manifest is None:
+            return dataId
+        visitData = self._getVisitDateFilter(dataId)
+        if visitData is None:
+            return dataId
+        date, filterName = visitData
+        mapping = self.calibrations[calibType]
+        table = mapping.tables[0] if mapping.tables else calibType
+        ccd = int(dataId.get("ccd", 0))
+        if mapping.setFilter:
+            calibDate = manifest.get((table, date, filterName, ccd))
+        else:
+            calibDate = self._calibManifestAnyFilter.get((table, date, ccd))
+        if calibDate is None:
+            return dataId
+        resolved = dict(dataId, calibDate=calibDate)
+        if mapping.setFilter:
+            resolved.setdefault("filter", filterName)
+        return resolved
+
+    def _getCalibManifest(self):
+        """Return the manifest of calibrations, read on first use
+
+        @return dict of calibDate, indexed by table, date, filter and ccd;
+                or None if there is no manifest
+        """
+        if self._calibManifest is _UNREAD:
+            conn = getattr(self.calibRegistry, "conn", None)
+            self._calibManifest = readCalibManifest(conn) if conn is not None else None
+            self._calibManifestAnyFilter = {}
+            for (table, date, filterName, ccd), calibDate in (self._calibManifest or {}).items():
+                self._calibManifestAnyFilter.setdefault((table, date, ccd), calibDate)
+            if self._calibManifest is not None:
+                self.log.debug("Read calibration manifest with %d entries" % (len(self._calibManifest),))
+        return self._calibManifest
+
+    def _getVisitDateFilter(self, dataId):
+        """Return the date and filter of a visit
+
+        The dates and filters of all visits are read from the raw registry
+        on first use; visits ingested since are looked up individually.
+
+        @param dataId  Data identifier, with visit or with date and filter
+        @return tuple of date and filter, or None if unknown
+        """
+        if "date" in dataId and "filter" in dataId:
+            return dataId["date"], dataId["filter"]
+        visit = dataId.get("visit")
+        if visit is None:
+            return None
+        if self._visitDates is None:
+            self._visitDates = {}
+            for row in self.queryMetadata("raw", ["visit", "date", "filter"], {}):
+                self._visitDates[row[0]] = tuple(row[1:])
+        if visit not in self._visitDates:
+            rows = self.queryMetadata("raw", ["visit", "date", "filter"], dict(visit=visit))
+            if len(set(tuple(row[1:]) for row in rows)) != 1:
+                return None
+            self._visitDates[visit] = tuple(rows[0][1:])
+        return self._visitDates[visit]
+
     def _setCcdExposureId(self, propertyList, dataId):
         propertyList.set("Computed_ccdExposureId", self._computeCcdExposureId(dataId))
         return propertyList
@@ -102,27 +223,35 @@ class MonocamMapper(CameraMapper):
     def _makeCamera(self, policy, repositoryDir):
         """Make a camera (instance of lsst.afw.cameraGeom.Camera) describing
         the camera geometry
+
+        The camera is shared by all mappers in the process, and is read from
+        the repository if it has been persisted there (see
+        lsst.obs.monocam.monocam.writeCamera).
         """
-        return Monocam()
+        return getMonocamCamera(getattr(self, "root", None))
 
     def bypass_defects(self, datasetType, pythonType, location, dataId):
-        """ since we have no defects, return an empty list.  Fix this when
-        defects exist """
-        return [afwImage.DefectBase(geom.Box2I(geom.Point2I(x0, y0), geom.Point2I(x1, y1))) for
-                x0, y0, x1, y1 in (
-                    # These may be hot pixels, but we'll treat them as bad
-                    # until we can get more data
-                    (3801, 666, 3805, 669),
-                    (3934, 582, 3936, 589),
-        )]
+        """Return the defects for a detector, as a DefectMap
+
+        The defects file is read once, and the DefectMap (which memoizes its
+        pixel indices) is shared by all reads for the detector until the file
+        changes.
+        """
+        filename = location.getLocations()[0]
+        key = (filename, os.stat(filename).st_mtime)
+        defectMaps = self.defectCache.get(key)
+        if defectMaps is None:
+            defectMaps = readDefectMaps(filename)
+            self.defectCache.put(key, defectMaps)
+        return defectMaps.get(self._extractDetectorName(dataId), DefectMap([]))
 
     def _defectLookup(self, dataId):
-        """ This function needs to return a non-None value otherwise the
-        mapper gives up on trying to find the defects.  I wanted to be able to
-        return a list of defects constructed in code rather than reconstituted
-        from persisted files, so I return a dummy value.
+        """Return the name of the defects file
+
+        All the defects are in a single file in the defects directory named
+        by the policy, so no registry is needed.
         """
-        return "hack"
+        return os.path.join(self.defectPath, self.defectsFile)
 
     def bypass_raw(self, datasetType, pythonType, location, dataId):
         """Read raw image with hacked metadata"""
@@ -135,9 +264,47 @@ class MonocamMapper(CameraMapper):
     def bypass_raw_md(self, datasetType, pythonType, location, dataId):
         """Read metadata for raw image, adding fake Wcs"""
         filename = location.getLocations()[0]
-        md = readMetadata(filename, 1)  # 1 = PHU
+        return self._readRawMetadata(filename)
+
+    def _readRawMetadata(self, filename):
+        """Read the primary header of a raw file, using the header cache
+
+        The header is read with the lightweight scanner in fitsHeader (or,
+        if it fails, with afw), and cached by path (without any extension
+        specification, so all amps share an entry) and modification time.
+        A copy is returned, so the caller is free to modify it.  Any shutter
+        headers matched to the file are applied to the copy.
+
+        @param filename  Name of raw file, possibly with an extension
+                         specification
+        @return lsst.daf.base.PropertyList
+        """
+        path = stripExtension(filename)
+        key = (path, os.stat(path).st_mtime)
+        md = self.headerCache.get(key)
+        if md is None:
+            try:
+                md = readPrimaryHeader(path)
+            except (ValueError, OSError, EOFError) as exc:  # Unparseable, or corrupt/truncated gzip
+                self.log.warn("Falling back to afw to read header of %s: %s" % (path, exc))
+                md = readMetadata(path, 0)  # 0 = PHU (afw HDUs are 0-indexed)
+            self.headerCache.put(key, md)
+        md = md.deepCopy()
+        shutterDatabase = self._getShutterDatabase()
+        if shutterDatabase is not None:
+            shutterDatabase.apply(path, md)
         return md
 
+    def _getShutterDatabase(self):
+        """Return the database of shutter headers, or None if there is none"""
+        root = getattr(self, "root", None)
+        if self.shutterDatabaseName is None or root is None:
+            return None
+        filename = os.path.join(root, self.shutterDatabaseName)
+        if not os.path.exists(filename):
+            return None
+        return getShutterDatabase(filename)
+
 #    def bypass_raw_amp(self, datasetType, pythonType, location, dataId):
 #        """Read raw image with hacked metadata"""
 #        print(inspect.stack()[1:5])
@@ -153,20 +320,111 @@ class MonocamMapper(CameraMapper):
 #        md = afwImage.readMetadata(filename, 1)  # 1 = PHU
 #        return md
 #
+    def _getRawVisitData(self, filename, dataId):
+        """Return the metadata, Wcs and VisitInfo of a raw visit
+
+        These are computed from the primary header once per visit and
+        shared by all amplifiers, rather than for each amplifier.  The
+        computation strips the Wcs keywords and pops the keywords used for
+        the VisitInfo (see MakeMonocamRawVisitInfo.setArgDict), so it is
+        done on a private copy of the header; the returned metadata is what
+        remains.  The Wcs and VisitInfo are immutable, so may be shared
+        between exposures, but the metadata should be copied before
+        attaching it to an exposure.
+
+        @param filename  Name of raw file, possibly with an extension
+                         specification
+        @param dataId  The data identifier
+        @return tuple of metadata, Wcs and VisitInfo
+        """
+        exposureId = self._computeCcdExposureId(dataId)
+        path = stripExtension(filename)
+        key = (path, os.stat(path).st_mtime, exposureId)
+        visitData = self.visitCache.get(key)
+        if visitData is None:
+            md = self._readRawMetadata(path)
+            wcs = afwImage.makeWcs(md, True)
+            visitInfo = self.makeRawVisitInfo(md=md, exposureId=exposureId)
+            visitData = (md, wcs, visitInfo)
+            self.visitCache.put(key, visitData)
+        return visitData
+
+    def _makeRawAmpExposure(self, image, visitData):
+        """Make an amplifier exposure with the shared visit data attached
+
+        @param image  Amplifier image (lsst.afw.image.ImageU)
+        @param visitData  Metadata, Wcs and VisitInfo from _getRawVisitData
+        @return lsst.afw.image.Exposure
+        """
+        md, wcs, visitInfo = visitData
+        exposure = afwImage.makeExposure(afwImage.makeMaskedImage(image))
+        exposure.setWcs(wcs)
+        exposure.setMetadata(md.deepCopy())
+        exposure.getInfo().setVisitInfo(visitInfo)
+        return exposure
+
+    def bypass_raw_amp(self, datasetType, pythonType, location, dataId):
+        """Read a raw amplifier as an Exposure, with the Wcs and VisitInfo
+        of the visit attached"""
+        filename = location.getLocations()[0]
+        image = afwImage.ImageU(filename)
+        return self._makeRawAmpExposure(image, self._getRawVisitData(filename, dataId))
+
     def std_raw_amp(self, item, dataId):
         """Standardize a raw dataset by converting it to an Exposure instead
         of an Image"""
-        exposure = exposureFromImage(item)
-        exposureId = self._computeCcdExposureId(dataId)
-        md = exposure.getMetadata()
-        visitInfo = self.makeRawVisitInfo(md=md, exposureId=exposureId)
-        exposure.getInfo().setVisitInfo(visitInfo)
+        if hasattr(item, "getMaskedImage") and item.getInfo().hasVisitInfo():
+            # Already converted by bypass_raw_amp
+            exposure = item
+        else:
+            exposure = exposureFromImage(item)
+            exposureId = self._computeCcdExposureId(dataId)
+            md = exposure.getMetadata()
+            visitInfo = self.makeRawVisitInfo(md=md, exposureId=exposureId)
+            exposure.getInfo().setVisitInfo(visitInfo)
         return self._standardizeExposure(self.exposures['raw_amp'], exposure, dataId,
                                          trimmed=False)
 
-    bypass_raw_amp = bypass_raw
     bypass_raw_amp_md = bypass_raw_md
 
+    def bypass_raw_amps(self, datasetType, pythonType, location, dataId):
+        """Read all amplifiers of a raw image with a single open of the file
+
+        The metadata, Wcs and VisitInfo of the visit are computed once (see
+        _getRawVisitData) and attached to all of the amplifier exposures.
+
+        @return list of amplifier Exposures, in channel order
+        """
+        filename = location.getLocations()[0]
+        detector = self.camera[self._extractDetectorName(dataId)]
+        visitData = self._getRawVisitData(filename, dataId)
+        fitsFile = afwFits.Fits(filename, "r")
+        try:
+            images = []
+            for channel in range(1, len(detector) + 1):
+                fitsFile.setHdu(channel)
+                images.append(afwImage.ImageU(fitsFile))
+        finally:
+            fitsFile.closeFile()
+
+        ampExposures = []
+        for channel, image in enumerate(images, 1):
+            exposure = self._makeRawAmpExposure(image, visitData)
+            ampDataId = dict(dataId, channel=channel)
+            ampExposures.append(self._standardizeExposure(self.exposures['raw_amp'], exposure, ampDataId,
+                                                          trimmed=False))
+        return ampExposures
+
+    def std_raw_amps(self, item, dataId):
+        """Standardize the amplifiers of a raw image
+
+        The butler standardizes what bypass_raw_amps returns, but the
+        amplifiers have already been standardized there, so the list is
+        returned unchanged (rather than passed to the default
+        standardization, which expects a single exposure).
+        """
+        return item
+
     def standardizeCalib(self, dataset, item, dataId):
         """Standardize a calibration image read in by the butler
 
@@ -203,27 +461,73 @@ class MonocamMapper(CameraMapper):
             return getattr(parent, "std_" + dataset)(exp, dataId)
         return self._standardizeExposure(mapping, exp, dataId)
 
-    def bypass_bias(self, datasetType, pythonType, location, dataId):
+    def _getCalib(self, dataset, location, dataId):
+        """Return a standardized calibration, using the calibration cache
+
+        The cache is keyed by dataset type and the resolved calibration file,
+        so consecutive visits that use the same calibration don't read and
+        standardize it again.  The caller is free to modify the exposure
+        returned: if the calibration has a sidecar (see calibSidecar), its
+        pixels are a new copy-on-write mapping of the sidecar (see
+        _mapCalib); otherwise, it is a deep copy of the cached exposure.
+
+        @param dataset  Dataset type (e.g., "bias", "dark" or "flat")
+        @param location  Butler location of the calibration
+        @param dataId  The data identifier
+        @return standardized Exposure
+        """
         filename = location.getLocations()[0]
-        md = self.bypass_raw_md(datasetType, pythonType, location, dataId)
-        item = afwImage.DecoratedImageF(filename)
-        item.setMetadata(md)
-        return self.standardizeCalib("bias", item, dataId)
+        key = (dataset, filename)
+        exposure = self.calibCache.get(key)
+        if exposure is None:
+            exposure = self.standardizeCalib(dataset, readCalibImage(filename), dataId)
+            self.calibCache.put(key, exposure)
+        self.log.debug("Calibration cache: %d hits, %d misses" % (self.calibCache.hits,
+                                                                  self.calibCache.misses))
+        if hasSidecar(filename):
+            return self._mapCalib(exposure, filename)
+        return exposure.Factory(exposure, True)
+
+    @staticmethod
+    def _mapCalib(exposure, filename):
+        """Return a copy of a calibration exposure with its pixels mapped
+        from the calibration's sidecar
+
+        The image is a copy-on-write mapping of the sidecar, so its pages
+        are shared with every other mapping of it until modified.  The mask
+        and variance of a calibration read from an image are zero; they are
+        allocated with numpy.zeros, whose pages aren't committed until they
+        are written.
+
+        @param exposure  Standardized calibration exposure, as cached
+        @param filename  Name of calibration file
+        @return Exposure
+        """
+        image = mapArray(getSidecarNames(filename)["image"])
+        if image.shape != (exposure.getHeight(), exposure.getWidth()):
+            # Trimmed by standardization
+            return exposure.Factory(exposure, True)
+        xy0 = exposure.getXY0()
+        maskedImage = afwImage.makeMaskedImage(
+            afwImage.ImageF(image, deep=False, xy0=xy0),
+            afwImage.Mask(numpy.zeros(image.shape, dtype=numpy.int32), deep=False, xy0=xy0),
+            afwImage.ImageF(numpy.zeros(image.shape, dtype=numpy.float32), deep=False, xy0=xy0))
+        copy = exposure.Factory(exposure, False)
+        copy.setMaskedImage(maskedImage)
+        copy.setMetadata(exposure.getMetadata().deepCopy())
+        return copy
+
+    def bypass_bias(self, datasetType, pythonType, location, dataId):
+        return self._getCalib("bias", location, dataId)
 
 #    def std_bias(self, item, dataId):
 #        return self.standardizeCalib("bias", item, dataId)
 
-    def std_dark(self, item, dataId):
-        exp = self.standardizeCalib("dark", item, dataId)
-        return exp
+    def bypass_dark(self, datasetType, pythonType, location, dataId):
+        return self._getCalib("dark", location, dataId)
 
     def bypass_flat(self, datasetType, pythonType, location, dataId):
-        filename = location.getLocations()[0]
-        md = self.bypass_raw_md(datasetType, pythonType, location, dataId)
-        item = afwImage.DecoratedImageF(filename)
-        item.setMetadata(md)
-#        return item
-        return self.standardizeCalib("flat", item, dataId)
+        return self._getCalib("flat", location, dataId)
 
 #    def std_flat(self, item, dataId):
 #        return self.standardizeCalib("flat", item, dataId)
@@ -232,6 +536,30 @@ class MonocamMapper(CameraMapper):
         return self.standardizeCalib("flat", item, dataId)
 
 
+def defineFilters():
+    """Define the filters used by Monocam
+
+    The filters are only defined if they are not already, as they persist
+    for the life of the process (unless reset).
+    """
+    if set(_filters) <= set(afwImage.Filter.getNames()):
+        return
+    for name, (wavelength, alias) in _filters.items():
+        afwImageUtils.defineFilter(name, wavelength, alias=alias)
+
+
+# The LSST Filters from L. Jones 04/07/10: name: (wavelength, aliases)
+_filters = {
+    'u': (364.59, []),
+    'g': (476.31, ["SDSSG"]),
+    'r': (619.42, ["SDSSR"]),
+    'i': (752.06, ["SDSSI"]),
+    'z': (866.85, ["SDSSZ"]),
+    'y': (971.68, ['y4']),  # official y filter
+    'NONE': (0.0, ['no_filter', "OPEN"]),
+}
+
+
 def exposureFromImage(image):
     """Generate an Exposure from an image-like object
 
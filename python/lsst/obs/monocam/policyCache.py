@@ -0,0 +1,113 @@
+#
+# LSST Data Management System
+# Copyright 2016 LSST Corporation.
+#
+# This product includes software developed by the
+# LSST Project (http://www.lsst.org/).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the LSST License Statement and
+# the GNU General Public License along with this program.  If not,
+# see <http://www.lsstcorp.org/LegalNotices/>.
+#
+#
+"""
+Cache of parsed mapper policies
+
+Parsing the YAML mapper policy is a large part of the cost of constructing
+a mapper, which matters when many worker processes are started.  Parsed
+policies are kept in memory for the life of the process.  If
+$OBS_MONOCAM_CACHE_DIR is set they are also pickled there for other
+processes; nothing is written to disk otherwise, as unpickling runs
+arbitrary code and the directory must be one the user trusts.  Both caches
+are keyed by the SHA-1 of the policy file, so editing the policy invalidates
+them.
+"""
+import copy
+import hashlib
+import os
+import pickle
+import threading
+
+from lsst.daf.persistence import Policy
+
+__all__ = ["readPolicy", "getPolicyCacheDir"]
+
+_policies = {}  # Parsed policies, indexed by filename and digest
+_lock = threading.Lock()
+
+
+def getPolicyCacheDir():
+    """Return the directory for pickled policies
+
+    The on-disk cache is opt-in: this is $OBS_MONOCAM_CACHE_DIR, and the
+    cache is disabled if that is unset or empty.
+
+    @return name of directory, or None if disabled
+    """
+    return os.environ.get("OBS_MONOCAM_CACHE_DIR") or None
+
+
+def _readPickle(filename):
+    """Read a pickled policy, returning None if it can't be read"""
+    try:
+        with open(filename, "rb") as fd:
+            policy = pickle.load(fd)
+    except Exception:
+        return None
+    return policy if isinstance(policy, Policy) else None
+
+
+def _writePickle(filename, policy):
+    """Pickle a policy atomically; failures are ignored, as the cache is
+    only an optimization"""
+    temp = "%s.tmp%d" % (filename, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(temp, "wb") as fd:
+            pickle.dump(policy, fd, protocol=pickle.HIGHEST_PROTOCOL)
+        os.rename(temp, filename)
+    except Exception:
+        pass
+    finally:
+        if os.path.exists(temp):
+            os.unlink(temp)
+
+
+def readPolicy(policyFile, cacheDir=None):
+    """Read a policy file, using the cache of parsed policies
+
+    @param policyFile  Name of policy file
+    @param cacheDir  Directory for pickled policies; None to use the default
+                     (see getPolicyCacheDir), which keeps the policy in
+                     memory only unless $OBS_MONOCAM_CACHE_DIR is set
+    @return lsst.daf.persistence.Policy, which the caller is free to modify
+    """
+    with open(policyFile, "rb") as fd:
+        digest = hashlib.sha1(fd.read()).hexdigest()
+    key = (os.path.abspath(policyFile), digest)
+    with _lock:
+        policy = _policies.get(key)
+        if policy is None:
+            if cacheDir is None:
+                cacheDir = getPolicyCacheDir()
+            pickleFile = None
+            if cacheDir is not None:
+                name = os.path.splitext(os.path.basename(policyFile))[0]
+                pickleFile = os.path.join(cacheDir, "%s-%s.pickle" % (name, digest))
+                policy = _readPickle(pickleFile)
+            if policy is None:
+                policy = Policy(policyFile)
+                if pickleFile is not None:
+                    _writePickle(pickleFile, policy)
+            _policies[key] = policy
+    return copy.deepcopy(policy)
@@ -0,0 +1,144 @@
+#
+# LSST Data Management System
+# Copyright 2016 LSST Corporation.
+#
+# This product includes software developed by the
+# LSST Project (http://www.lsst.org/).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the LSST License Statement and
+# the GNU General Public License along with this program.  If not,
+# see <http://www.lsstcorp.org/LegalNotices/>.
+#
+import collections
+import threading
+
+__all__ = ["Prefetcher"]
+
+
+class Prefetcher:
+    """Iterate over the results of a function applied to a sequence of
+    inputs, computing the results ahead of time in a background thread
+
+    This allows I/O for the next inputs (reading raw data and calibrations)
+    to overlap with the processing of the current input.
+
+    The number of results held ahead of the consumer is bounded both by
+    count (``depth``) and by memory (``maxBytes``, as measured by
+    ``sizeFunc``).  A single result is always allowed, so that a result
+    larger than ``maxBytes`` does not stall the iteration.
+
+    Exceptions raised by ``func`` are re-raised in the consuming thread
+    when the corresponding result is reached.
+
+    Parameters
+    ----------
+    func : callable
+        Function to apply to each input.
+    inputs : iterable
+        Inputs to ``func``.
+    depth : `int`
+        Maximum number of results to compute ahead of the consumer.
+    maxBytes : `int` or `None`
+        Maximum size of the results computed ahead of the consumer, or
+        `None` for no limit.
+    sizeFunc : callable or `None`
+        Function returning the size in bytes of a result; required if
+        ``maxBytes`` is set.
+    """
+
+    def __init__(self, func, inputs, depth=1, maxBytes=None, sizeFunc=None):
+        if depth < 1:
+            raise ValueError("Prefetch depth must be at least 1: %d" % (depth,))
+        if maxBytes is not None and sizeFunc is None:
+            raise ValueError("A sizeFunc must be provided with maxBytes")
+        self.func = func
+        self.inputs = inputs
+        self.depth = depth
+        self.maxBytes = maxBytes
+        self.sizeFunc = sizeFunc
+
+    def __iter__(self):
+        """Iterate over ``(input, result)`` pairs, in input order"""
+        state = _PrefetchState()
+        thread = threading.Thread(target=self._produce, args=(state,), name="Prefetcher")
+        thread.daemon = True
+        thread.start()
+        try:
+            while True:
+                with state.condition:
+                    while not state.queue:
+                        state.condition.wait()
+                    item = state.queue.popleft()
+                    if item is _END:
+                        return
+                    data, result, error, size = item
+                    state.numBytes -= size
+                    state.condition.notify_all()
+                if error is not None:
+                    raise error
+                yield data, result
+        finally:
+            with state.condition:
+                state.stopped = True
+                state.condition.notify_all()
+
+    def _produce(self, state):
+        """Compute results and queue them for the consumer"""
+        try:
+            for data in self.inputs:
+                with state.condition:
+                    while not state.stopped and not self._hasRoom(state):
+                        state.condition.wait()
+                    if state.stopped:
+                        return
+                try:
+                    result = self.func(data)
+                    error = None
+                    size = self.sizeFunc(result) if self.sizeFunc is not None else 0
+                except Exception as exc:
+                    result = None
+                    error = exc
+                    size = 0
+                with state.condition:
+                    state.queue.append((data, result, error, size))
+                    state.numBytes += size
+                    state.condition.notify_all()
+        except Exception as exc:
+            # Failure iterating over the inputs
+            with state.condition:
+                state.queue.append((None, None, exc, 0))
+        finally:
+            with state.condition:
+                state.queue.append(_END)
+                state.condition.notify_all()
+
+    def _hasRoom(self, state):
+        """Is there room to compute another result ahead of the consumer?"""
+        if not state.queue:
+            return True
+        if len(state.queue) >= self.depth:
+            return False
+        return self.maxBytes is None or state.numBytes < self.maxBytes
+
+
+class _PrefetchState:
+    """State shared between the producing and consuming threads"""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.queue = collections.deque()
+        self.numBytes = 0
+        self.stopped = False
+
+
+_END = object()  # Sentinel marking the end of the inputs
@@ -0,0 +1,153 @@
+#
+# LSST Data Management System
+# Copyright 2016 LSST Corporation.
+#
+# This product includes software developed by the
+# LSST Project (http://www.lsst.org/).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the LSST License Statement and
+# the GNU General Public License along with this program.  If not,
+# see <http://www.lsstcorp.org/LegalNotices/>.
+#
+import hashlib
+import json
+import os
+
+import numpy
+
+import lsst.geom as geom
+import lsst.afw.image as afwImage
+
+__all__ = ["SharedCalibStore", "mapArray"]
+
+
+def mapArray(filename):
+    """Memory-map an array written with numpy.save
+
+    The mapping is copy-on-write: the pages are shared between all the
+    processes mapping the file, and any modification is private to the
+    process making it (and never written back to the file).  The array is
+    nevertheless writeable, as required to wrap it in an afw image without
+    copying.
+
+    @param filename  Name of .npy file
+    @return numpy array backed by the file
+    """
+    return numpy.load(filename, mmap_mode="c")
+
+
+class SharedCalibStore:
+    """Calibration exposures stored as memory-mapped arrays, for sharing
+    between processes
+
+    The calibrations are read and standardized once by the butler (in the
+    parent process), and written with ``put`` as uncompressed arrays.  Each
+    worker process then uses ``get`` to obtain an exposure whose pixels are
+    backed by a copy-on-write mapping of those arrays, so the pages are
+    shared between all the workers rather than each worker decompressing
+    its own copy.  Each ``get`` makes a new mapping, so the exposure is
+    private to the caller: modifying it (e.g., adding mask planes) doesn't
+    affect the calibration returned for later sensors.
+
+    Only the components of the exposure that are used by ISR are
+    preserved: the pixels and their origin, the detector, the filter, and
+    the exposure and dark times.
+
+    Calibrations are identified by dataset type and the filename resolved
+    by the butler for the data reference.
+
+    @param directory  Directory holding the arrays; a RAM-backed filesystem
+                      such as /dev/shm is a good choice
+    """
+    planes = ("image", "mask", "variance")
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._info = {}  # Components other than the pixels, read by this process, indexed by key
+
+    @staticmethod
+    def getKey(dataRef, datasetType):
+        """Return the key identifying a calibration
+
+        @param dataRef  Butler data reference of the science exposure
+        @param datasetType  Dataset type of calibration (e.g., "bias")
+        @return key (tuple of dataset type and filename)
+        """
+        return (datasetType, dataRef.get(datasetType + "_filename")[0])
+
+    def _getBasename(self, key):
+        """Return the base of the filenames for a calibration"""
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self.directory, "%s-%s" % (key[0], digest))
+
+    def has(self, key):
+        """Is the calibration with this key in the store?"""
+        return os.path.exists(self._getBasename(key) + ".json")
+
+    def put(self, key, exposure):
+        """Write a calibration exposure into the store
+
+        @param key  Key identifying the calibration, from getKey
+        @param exposure  Calibration exposure (lsst.afw.image.Exposure)
+        """
+        basename = self._getBasename(key)
+        maskedImage = exposure.getMaskedImage()
+        for name in self.planes:
+            plane = getattr(maskedImage, "get" + name.capitalize())()
+            numpy.save("%s.%s.npy" % (basename, name), plane.getArray())
+
+        visitInfo = exposure.getInfo().getVisitInfo()
+        detector = exposure.getDetector()
+        info = dict(
+            xy0=[maskedImage.getX0(), maskedImage.getY0()],
+            detector=detector.getName() if detector is not None else None,
+            filter=exposure.getFilter().getName(),
+            exposureTime=visitInfo.getExposureTime() if visitInfo is not None else None,
+            darkTime=visitInfo.getDarkTime() if visitInfo is not None else None,
+        )
+        # Written last, as its presence marks the calibration as available
+        with open(basename + ".json", "w") as fd:
+            json.dump(info, fd)
+
+    def get(self, key, camera):
+        """Read a calibration exposure from the store
+
+        The exposure's pixels are a new copy-on-write mapping of the stored
+        arrays, so the exposure may be modified freely.
+
+        @param key  Key identifying the calibration, from getKey
+        @param camera  Camera, for setting the detector
+        @return calibration exposure, or None if it is not in the store
+        """
+        basename = self._getBasename(key)
+        info = self._info.get(key)
+        if info is None:
+            if not self.has(key):
+                return None
+            with open(basename + ".json") as fd:
+                info = json.load(fd)
+            self._info[key] = info
+
+        xy0 = geom.Point2I(*info["xy0"])
+        image, mask, variance = [mapArray("%s.%s.npy" % (basename, name)) for name in self.planes]
+        maskedImage = afwImage.makeMaskedImage(afwImage.ImageF(image, deep=False, xy0=xy0),
+                                               afwImage.Mask(mask, deep=False, xy0=xy0),
+                                               afwImage.ImageF(variance, deep=False, xy0=xy0))
+        exposure = afwImage.makeExposure(maskedImage)
+        if info["detector"] is not None:
+            exposure.setDetector(camera[info["detector"]])
+        exposure.setFilter(afwImage.Filter(info["filter"]))
+        visitInfoArgs = {name: info[name] for name in ("exposureTime", "darkTime") if
+                         info[name] is not None}
+        exposure.getInfo().setVisitInfo(afwImage.VisitInfo(**visitInfoArgs))
+        return exposure
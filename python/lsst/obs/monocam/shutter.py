@@ -0,0 +1,136 @@
+#
+# LSST Data Management System
+# Copyright 2016 LSST Corporation.
+#
+# This product includes software developed by the
+# LSST Project (http://www.lsst.org/).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the LSST License Statement and
+# the GNU General Public License along with this program.  If not,
+# see <http://www.lsstcorp.org/LegalNotices/>.
+#
+#
+"""
+Shutter headers for the USNO observations
+
+At USNO, the camera headers lack the telescope information, which is in
+separate shutter files instead.  suckMetadata.py loads the headers of both
+into an sqlite database (monocam.sqlite, in the data repository) and
+matches camera files to shutter files; this module looks up the shutter
+values for a camera file so they can be applied to its header when it is
+read.
+"""
+import os
+import sqlite3
+import threading
+import urllib.parse
+
+from .cache import LruCache
+
+__all__ = ["ShutterDatabase", "getShutterDatabase"]
+
+# Header keyword, shutter table column, conversion
+HEADER_COLUMNS = (
+    ("DATE-OBS", "date", str),
+    ("OBJECT", "object", str),
+    ("FILTER", "filter", str),
+    ("RA", "ra", lambda ra: ra/15.0),  # Stored in degrees, header has hours
+    ("DEC", "decl", float),
+)
+
+LOOKUP_SQL = ("SELECT %s FROM camera JOIN match ON match.camera = camera.id "
+              "JOIN shutter ON shutter.id = match.shutter WHERE camera.filename = ?" %
+              ", ".join("shutter." + column for _, column, _ in HEADER_COLUMNS))
+
+_NO_MATCH = {}  # Cached result for files without a match
+
+
+class ShutterDatabase:
+    """Read-only access to the shutter values matched to camera files
+
+    A single connection is used for all lookups, which use the unique index
+    on camera filename.  Results are cached, as the database is not
+    expected to change during processing.
+
+    @param filename  Name of sqlite database
+    @param cacheSize  Number of lookups to cache
+    """
+
+    def __init__(self, filename, cacheSize=4096):
+        self.filename = filename
+        uri = "file:%s?mode=ro" % (urllib.parse.quote(os.path.abspath(filename)),)
+        self._conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.cache = LruCache(cacheSize)
+
+    def close(self):
+        self._conn.close()
+
+    def lookup(self, filename):
+        """Return the shutter header values for a camera file
+
+        The file is looked up by its real path (following symbolic links, as
+        ingest may link the files into the repository), then by its
+        absolute path.
+
+        @param filename  Name of camera file
+        @return dict of header values, indexed by keyword; empty if the file
+                has no matching shutter file
+        """
+        result = self.cache.get(filename)
+        if result is not None:
+            return result
+        result = _NO_MATCH
+        with self._lock:
+            for path in dict.fromkeys((os.path.realpath(filename), os.path.abspath(filename))):
+                row = self._conn.execute(LOOKUP_SQL, (path,)).fetchone()
+                if row is not None:
+                    result = {keyword: convert(value) for (keyword, _, convert), value in
+                              zip(HEADER_COLUMNS, row) if value is not None}
+                    break
+        self.cache.put(filename, result)
+        return result
+
+    def apply(self, filename, md):
+        """Apply the shutter header values for a camera file to its header
+
+        @param filename  Name of camera file
+        @param[in,out] md  Header of camera file (lsst.daf.base.PropertyList)
+        @return True if the file has a matching shutter file
+        """
+        values = self.lookup(filename)
+        for keyword, value in values.items():
+            md.set(keyword, value)
+        return bool(values)
+
+
+_databases = {}  # Databases open in this process, indexed by filename
+_databasesLock = threading.Lock()
+
+
+def getShutterDatabase(filename):
+    """Return the ShutterDatabase for a file, shared within the process
+
+    Connections are not shared with forked child processes, which open
+    their own.
+
+    @param filename  Name of sqlite database
+    @return ShutterDatabase
+    """
+    key = (os.path.abspath(filename), os.getpid())
+    with _databasesLock:
+        database = _databases.get(key)
+        if database is None:
+            database = ShutterDatabase(filename)
+            _databases[key] = database
+        return database
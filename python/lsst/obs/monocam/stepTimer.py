@@ -0,0 +1,211 @@
+#
+# LSST Data Management System
+# Copyright 2016 LSST Corporation.
+#
+# This product includes software developed by the
+# LSST Project (http://www.lsst.org/).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the LSST License Statement and
+# the GNU General Public License along with this program.  If not,
+# see <http://www.lsstcorp.org/LegalNotices/>.
+#
+#
+import collections
+import contextlib
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+__all__ = ["StepTimer"]
+
+
+class _MemoryTracer:
+    """Process-wide bookkeeping for tracing memory with tracemalloc
+
+    Tracing is started when the first StepTimer that traces memory is
+    created (unless it was already started by someone else), and stopped
+    when the last of them is closed, so it doesn't slow down the rest of
+    the process.  The peak of the traced memory is process-wide, so a step
+    is measured only if no other step ran at the same time.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.numUsers = 0  # Number of StepTimers tracing memory
+        self.started = False  # Did we start tracing?
+        self.numActive = 0  # Number of steps in progress
+        self.numStarted = 0  # Number of steps started
+
+    def acquire(self):
+        """Start tracing, if necessary"""
+        with self.lock:
+            if self.numUsers == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.started = True
+            self.numUsers += 1
+
+    def release(self):
+        """Stop tracing, if we started it and nobody else needs it"""
+        with self.lock:
+            self.numUsers -= 1
+            if self.numUsers == 0 and self.started:
+                tracemalloc.stop()
+                self.started = False
+
+    def startStep(self):
+        """Note the start of a step
+
+        @return state to pass to finishStep
+        """
+        with self.lock:
+            self.numActive += 1
+            self.numStarted += 1
+            if self.numActive > 1:
+                return None  # Running concurrently with another step
+            tracemalloc.reset_peak()
+            return (self.numStarted, tracemalloc.get_traced_memory()[0])
+
+    def finishStep(self, state):
+        """Note the end of a step
+
+        @param state  State returned by startStep
+        @return peak memory (bytes) allocated by the step, or None if
+                another step ran at the same time
+        """
+        with self.lock:
+            self.numActive -= 1
+            if state is None:
+                return None
+            numStarted, startMemory = state
+            if self.numStarted != numStarted:
+                return None  # Another step started during this one
+            return tracemalloc.get_traced_memory()[1] - startMemory
+
+
+_memoryTracer = _MemoryTracer()
+
+
+class StepTimer:
+    """Accumulate the wall time, CPU time and peak memory of named steps
+
+    A step may be timed repeatedly (e.g., once for each amplifier, possibly
+    in different threads): its times are summed, and its peak memory is the
+    maximum over the repetitions.  The CPU time is that of the thread doing
+    the step, so it excludes work done by other threads.
+
+    Peak memory is measured with tracemalloc, which is started if
+    necessary and stopped by close.  It covers allocations made through the
+    Python allocators, including numpy arrays, but not those made by C++
+    code (e.g., afw images).  It is the peak above the memory in use at the
+    start of the step; as it is measured for the whole process, it is only
+    recorded for repetitions of a step that don't overlap with any other
+    step (e.g., not for the amplifiers processed on a thread pool).
+
+    @param traceMemory  Measure the peak memory of each step?  This slows
+                        down everything that allocates memory, until the
+                        timer is closed.  Requires Python 3.9 or later.
+    """
+
+    def __init__(self, traceMemory=False):
+        self.traceMemory = traceMemory and hasattr(tracemalloc, "reset_peak")
+        self._steps = collections.OrderedDict()  # name: [count, wallTime, cpuTime, peakMemory]
+        self._lock = threading.Lock()
+        if self.traceMemory:
+            _memoryTracer.acquire()
+
+    def __len__(self):
+        return len(self._steps)
+
+    def __contains__(self, name):
+        return name in self._steps
+
+    def close(self):
+        """Stop tracing memory (if nothing else needs it)
+
+        No more steps may be timed; the measurements are still available.
+        """
+        if self.traceMemory:
+            self.traceMemory = False
+            _memoryTracer.release()
+
+    @contextlib.contextmanager
+    def step(self, name):
+        """Time a step
+
+        @param name  Name of the step
+        """
+        traceMemory = self.traceMemory
+        if traceMemory:
+            memoryState = _memoryTracer.startStep()
+        startWall = time.perf_counter()
+        startCpu = time.thread_time()
+        try:
+            yield
+        finally:
+            wallTime = time.perf_counter() - startWall
+            cpuTime = time.thread_time() - startCpu
+            peakMemory = _memoryTracer.finishStep(memoryState) if traceMemory else None
+            with self._lock:
+                values = self._steps.setdefault(name, [0, 0.0, 0.0, None])
+                values[0] += 1
+                values[1] += wallTime
+                values[2] += cpuTime
+                if peakMemory is not None:
+                    values[3] = peakMemory if values[3] is None else max(values[3], peakMemory)
+
+    def toDict(self):
+        """Return the measurements of each step
+
+        @return dict with, for each step (in the order they were first
+                timed), a dict with the number of times it was timed
+                ("count"), and the total "wallTime" and "cpuTime" (sec); and,
+                if memory was measured, the "peakMemory" (bytes)
+        """
+        steps = collections.OrderedDict()
+        with self._lock:
+            for name, (count, wallTime, cpuTime, peakMemory) in self._steps.items():
+                steps[name] = dict(count=count, wallTime=wallTime, cpuTime=cpuTime)
+                if peakMemory is not None:
+                    steps[name]["peakMemory"] = peakMemory
+        return steps
+
+    def record(self, metadata):
+        """Record the measurements in task metadata
+
+        The measurements of each step are added as <name>StepCount,
+        <name>StepWallTime, <name>StepCpuTime and (if memory was measured)
+        <name>StepPeakMemory, so measurements for successive sensors
+        accumulate as arrays.
+
+        @param metadata  Metadata (lsst.daf.base.PropertySet) to which to add
+                         the measurements
+        """
+        for name, values in self.toDict().items():
+            for key, value in values.items():
+                metadata.add("%sStep%s" % (name, key[0].upper() + key[1:]), value)
+
+    def writeJson(self, filename, dataId=None):
+        """Append the measurements to a file as a JSON record
+
+        Each record is written as a single line, with a single write, so
+        that several processes may append to the same file.
+
+        @param filename  Name of file to which to append
+        @param dataId  Data identifier of the sensor measured, or None
+        """
+        record = dict(dataId=dataId, pid=os.getpid(), time=time.time(), steps=self.toDict())
+        line = json.dumps(record, default=str) + "\n"
+        with open(filename, "a") as fd:
+            fd.write(line)
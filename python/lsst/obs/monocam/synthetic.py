@@ -0,0 +1,289 @@
+#
+# LSST Data Management System
+# Copyright 2016 LSST Corporation.
+#
+# This product includes software developed by the
+# LSST Project (http://www.lsst.org/).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the LSST License Statement and
+# the GNU General Public License along with this program.  If not,
+# see <http://www.lsstcorp.org/LegalNotices/>.
+#
+#
+"""
+Synthetic Monocam data, for benchmarks and tests
+
+Raw images have the full geometry of the camera (see
+Monocam._makeAmplifierCatalog): a primary header, followed by an extension
+for each of the 16 amplifiers holding the data, extended register and
+overscans (544x2048 pixels).  Calibrations are full assembled frames with
+the headers written by constructCalibs, ready for ingestCalibs.  Shutter
+header files, with the keywords read by suckMetadata, may also be written.
+"""
+import collections
+import datetime
+import gzip
+import os
+
+import numpy
+import astropy.io.fits
+
+from lsst.daf.persistence import Policy
+from .calibSidecar import materializeCalibs
+from .ingest import MonocamIngestCalibsTask, MonocamIngestTask
+from .monocam import getMonocamCamera
+from .policyCache import readPolicy
+
+__all__ = ["SyntheticData", "makeRawHeader", "writeRaw", "writeCalib", "writeShutterHeader",
+           "makeSyntheticData", "ingestSyntheticData"]
+
+CALIB_TYPES = ("bias", "dark", "flat")  # Types of calibration written
+
+BIAS_LEVEL = 1000.0  # Bias level in raw images (counts)
+SKY_RATE = 50.0  # Sky background (electrons/sec)
+DARK_RATE = 0.01  # Dark current (electrons/sec)
+READOUT_TIME = 10.0  # Time between exposures, in addition to the exposure time (sec)
+PIXEL_SCALE = 0.3  # Nominal pixel scale (arcsec)
+
+SyntheticData = collections.namedtuple("SyntheticData", ["raws", "calibs", "shutters"])
+SyntheticData.__doc__ = """Files written by makeSyntheticData
+
+Each field is a list of filenames; "shutters" is empty unless shutter
+header files were requested.
+"""
+
+
+def makeRawHeader(visit, date, filterName, objectName, expTime, ra=233.0, dec=1.0):
+    """Make the primary header of a raw image
+
+    @param visit  Visit number
+    @param date  Start of exposure, as a datetime.datetime (UTC)
+    @param filterName  Name of filter (e.g., "SDSSG")
+    @param objectName  Name of target
+    @param expTime  Exposure time (sec)
+    @param ra  Right ascension of boresight (degrees)
+    @param dec  Declination of boresight (degrees)
+    @return dict of header values, in order
+    """
+    return collections.OrderedDict([
+        ("VISIT", visit),
+        ("DATE-OBS", date.isoformat(timespec="milliseconds")),
+        ("OBJECT", objectName),
+        ("IMAGETYP", "object"),
+        ("FILTER", filterName),
+        ("EXPTIME", expTime),
+        ("DARKTIME", expTime),
+        ("AIRMASS", 1.2),
+        ("RA", _sexagesimal(ra/15.0)),
+        ("DEC", _sexagesimal(dec, sign=True)),
+        ("RADESYS", "ICRS"),
+        ("EQUINOX", 2000.0),
+        ("CTYPE1", "RA---TAN"),
+        ("CTYPE2", "DEC--TAN"),
+        ("CRVAL1", ra),
+        ("CRVAL2", dec),
+        ("CRPIX1", 2048.5),
+        ("CRPIX2", 2002.5),
+        ("CD1_1", -PIXEL_SCALE/3600.0),
+        ("CD1_2", 0.0),
+        ("CD2_1", 0.0),
+        ("CD2_2", PIXEL_SCALE/3600.0),
+    ])
+
+
+def _sexagesimal(value, sign=False):
+    """Format a value as sexagesimal, as in the Monocam headers"""
+    centiseconds = int(round(abs(value)*360000))
+    minutes, centiseconds = divmod(centiseconds, 6000)
+    degrees, minutes = divmod(minutes, 60)
+    text = "%02d:%02d:%05.2f" % (degrees, minutes, centiseconds/100.0)
+    if sign:
+        text = ("-" if value < 0 else "+") + text
+    return text
+
+
+def writeRaw(filename, header, seed=0, camera=None):
+    """Write a raw image
+
+    Each amplifier has a bias level and read noise in every pixel, plus sky
+    and dark current (with Poisson noise) in the data region.
+
+    @param filename  Name of file to write
+    @param header  Primary header values (e.g., from makeRawHeader)
+    @param seed  Seed for random number generator
+    @param camera  Camera (lsst.afw.cameraGeom.Camera); the Monocam camera
+                   if None
+    """
+    if camera is None:
+        camera = getMonocamCamera()
+    rng = numpy.random.RandomState(seed)
+    electrons = (SKY_RATE + DARK_RATE)*header["EXPTIME"]
+    hdus = [astropy.io.fits.PrimaryHDU(header=astropy.io.fits.Header(list(header.items())))]
+    for amp in camera[0]:
+        gain = amp.getGain()
+        dims = amp.getRawBBox().getDimensions()
+        pixels = rng.normal(BIAS_LEVEL, amp.getReadNoise()/gain, (dims.getY(), dims.getX()))
+        dataSlices = amp.getRawDataBBox().getSlices()
+        pixels[dataSlices] += rng.poisson(electrons, pixels[dataSlices].shape)/gain
+        pixels = numpy.clip(numpy.round(pixels), 0, amp.getSaturation()).astype(numpy.uint16)
+        hdus.append(astropy.io.fits.ImageHDU(pixels, name="SEGMENT" + amp.getName()))
+    astropy.io.fits.HDUList(hdus).writeto(filename, overwrite=True)
+
+
+def writeCalib(filename, calibType, calibDate, filterName="NONE", seed=0, camera=None):
+    """Write a calibration image, as constructCalibs does
+
+    @param filename  Name of file to write; compressed if it ends in ".gz"
+    @param calibType  Type of calibration: "bias", "dark" or "flat"
+    @param calibDate  Date of calibration (YYYY-MM-DD)
+    @param filterName  Name of filter
+    @param seed  Seed for random number generator
+    @param camera  Camera (lsst.afw.cameraGeom.Camera); the Monocam camera
+                   if None
+    """
+    if camera is None:
+        camera = getMonocamCamera()
+    rng = numpy.random.RandomState(seed)
+    dims = camera[0].getBBox().getDimensions()
+    shape = (dims.getY(), dims.getX())
+    if calibType == "bias":
+        pixels = rng.normal(0.0, 2.0, shape)
+    elif calibType == "dark":
+        pixels = rng.normal(DARK_RATE, 0.1*DARK_RATE, shape)
+    elif calibType == "flat":
+        gradient = 0.05*(numpy.arange(shape[1])/shape[1] - 0.5)
+        pixels = 1.0 + gradient[numpy.newaxis, :] + rng.normal(0.0, 0.01, shape)
+    else:
+        raise ValueError("Unrecognised calibration type: %s" % (calibType,))
+    header = astropy.io.fits.Header()
+    header["OBSTYPE"] = calibType
+    header["FILTER"] = filterName
+    header["DATE-OBS"] = calibDate + "T00:00:00.000"
+    # The dark time of the dark is used to scale it; it is only read if the
+    # OBJECT isn't DARK, FLAT or BIAS (see MakeMonocamRawVisitInfo)
+    header["EXPTIME"] = 0.0 if calibType == "bias" else 1.0
+    header["DARKTIME"] = header["EXPTIME"]
+    header["CALIB_ID"] = "calibDate=%s filter=%s ccd=0" % (calibDate, filterName)
+    dirname = os.path.dirname(filename)
+    if dirname:
+        os.makedirs(dirname, exist_ok=True)
+    hdu = astropy.io.fits.PrimaryHDU(pixels.astype(numpy.float32), header=header)
+    if filename.endswith(".gz"):
+        # Noise doesn't compress, so compressing harder only costs time
+        with gzip.open(filename, "wb", compresslevel=1) as fd:
+            hdu.writeto(fd)
+    else:
+        hdu.writeto(filename, overwrite=True)
+
+
+def writeShutterHeader(filename, header):
+    """Write the header recorded by the shutter for a raw image
+
+    The shutter records the date and time separately (DATE-OBS and UTC).
+
+    @param filename  Name of file to write
+    @param header  Primary header values of the raw image (e.g., from
+                   makeRawHeader)
+    """
+    date, _, time = header["DATE-OBS"].partition("T")
+    shutter = astropy.io.fits.Header()
+    shutter["DATE-OBS"] = date
+    shutter["UTC"] = time
+    for key in ("OBJECT", "IMAGETYP", "FILTER", "RA", "DEC", "EXPTIME"):
+        shutter[key] = header[key]
+    astropy.io.fits.PrimaryHDU(header=shutter).writeto(filename, overwrite=True)
+
+
+def makeSyntheticData(root, numVisits=4, filters=("SDSSG",), expTime=30.0,
+                      start=datetime.datetime(2016, 5, 4, 3, 0, 0), objectName="synthetic",
+                      shutter=False, seed=0):
+    """Write synthetic raw images and calibrations for a night
+
+    The root is set up as a data repository (with a _mapper file, and
+    calibrations in place, as for tests/data).  Raw images are written to
+    the "incoming" directory, ready to be ingested; shutter header files (if
+    requested) to the "shutter" directory.  The bias and dark, and a flat
+    for each filter, are dated the night of the first visit.
+
+    @param root  Root directory of repository to write
+    @param numVisits  Number of visits, cycling through the filters
+    @param filters  Names of filters
+    @param expTime  Exposure time of each visit (sec)
+    @param start  Start of the first exposure, as a datetime.datetime (UTC)
+    @param objectName  Name of target
+    @param shutter  Write shutter header files?
+    @param seed  Seed for random number generators
+    @return SyntheticData
+    """
+    camera = getMonocamCamera()
+    os.makedirs(os.path.join(root, "incoming"), exist_ok=True)
+    if shutter:
+        os.makedirs(os.path.join(root, "shutter"), exist_ok=True)
+    with open(os.path.join(root, "_mapper"), "w") as fd:
+        fd.write("lsst.obs.monocam.MonocamMapper\n")
+
+    raws, shutters = [], []
+    for index in range(numVisits):
+        visit = index + 1
+        date = start + datetime.timedelta(seconds=index*(expTime + READOUT_TIME))
+        header = makeRawHeader(visit, date, filters[index % len(filters)], objectName, expTime)
+        basename = "%s_%04d" % (date.strftime("%Y-%m-%d"), visit)
+        filename = os.path.join(root, "incoming", basename + ".fits")
+        writeRaw(filename, header, seed=seed + visit, camera=camera)
+        raws.append(filename)
+        if shutter:
+            filename = os.path.join(root, "shutter", basename + "_shutter.fits")
+            writeShutterHeader(filename, header)
+            shutters.append(filename)
+
+    policy = _readMapperPolicy()
+    calibDate = start.strftime("%Y-%m-%d")
+    calibs = []
+    for calibType, filterName in [("bias", "NONE"), ("dark", "NONE")] + [("flat", ff) for ff in filters]:
+        template = policy["calibrations"][calibType]["template"]
+        filename = os.path.join(root, template % dict(calibDate=calibDate, filter=filterName))
+        writeCalib(filename, calibType, calibDate, filterName, seed=seed + len(calibs), camera=camera)
+        calibs.append(filename)
+
+    return SyntheticData(raws, calibs, shutters)
+
+
+def ingestSyntheticData(root, data, sidecars=False):
+    """Ingest synthetic data into the repository written by makeSyntheticData
+
+    The raw images are linked into the repository, and the calibrations
+    registered where they are, valid for 30 days either side of their date.
+
+    @param root  Root directory of repository
+    @param data  SyntheticData returned by makeSyntheticData
+    @param sidecars  Also write the sidecars of the calibrations (see
+                     lsst.obs.monocam.calibSidecar)?
+    """
+    _runIngest(MonocamIngestTask, "ingest", [root] + data.raws + ["--mode", "link"])
+    _runIngest(MonocamIngestCalibsTask, "ingestCalibs",
+               [root, "--calib", root, "--mode", "skip", "--validity", "30"] + data.calibs)
+    if sidecars:
+        policy = _readMapperPolicy()
+        materializeCalibs(root, {name: policy["calibrations"][name]["template"] for name in CALIB_TYPES})
+
+
+def _runIngest(TaskClass, name, args):
+    """Run an ingest task with command-line arguments"""
+    parser = TaskClass.ArgumentParser(name=name)
+    args = parser.parse_args(TaskClass.ConfigClass(), args=args)
+    TaskClass(config=args.config).run(args)
+
+
+def _readMapperPolicy():
+    """Return the mapper policy, for the calibration filename templates"""
+    return readPolicy(Policy.defaultPolicyFile("obs_monocam", "monocamMapper.yaml", "policy"))
@@ -0,0 +1,165 @@
+#
+# LSST Data Management System
+# Copyright 2016 LSST Corporation.
+#
+# This product includes software developed by the
+# LSST Project (http://www.lsst.org/).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the LSST License Statement and
+# the GNU General Public License along with this program.  If not,
+# see <http://www.lsstcorp.org/LegalNotices/>.
+#
+
+
+import datetime
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import lsst.utils.tests
+import lsst.daf.persistence as dafPersist
+from lsst.obs.monocam import MonocamMapper
+from lsst.obs.monocam.calibManifest import (MANIFEST_TABLE, createCalibIndexes, writeCalibManifest,
+                                            readCalibManifest)
+from lsst.obs.monocam.synthetic import (SyntheticData, ingestSyntheticData, makeRawHeader,
+                                        makeSyntheticData, writeCalib, writeRaw)
+
+
+class CalibManifestTestCase(lsst.utils.tests.TestCase):
+    """Test the manifest of calibrations for each night"""
+
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+        for table in ("bias", "flat"):
+            self.conn.execute("CREATE TABLE %s (id INTEGER PRIMARY KEY AUTOINCREMENT, filter TEXT, ccd INT, "
+                              "calibDate TEXT, validStart TEXT, validEnd TEXT)" % (table,))
+            createCalibIndexes(self.conn, table)
+        rows = [("bias", "NONE", 0, "2016-05-05", "2016-05-03", "2016-05-06"),
+                ("bias", "NONE", 0, "2016-05-08", "2016-05-06", "2016-05-10"),
+                ("flat", "SDSSG", 0, "2016-05-05", "2016-05-04", "2016-05-05"),
+                ("flat", "SDSSR", 0, "2016-05-05", "2016-05-05", "2016-05-05")]
+        for table, filterName, ccd, calibDate, validStart, validEnd in rows:
+            self.conn.execute("INSERT INTO %s VALUES (NULL, ?, ?, ?, ?, ?)" % (table,),
+                              (filterName, ccd, calibDate, validStart, validEnd))
+
+    def tearDown(self):
+        self.conn.close()
+
+    def testManifest(self):
+        self.assertIsNone(readCalibManifest(self.conn))
+        writeCalibManifest(self.conn, ["bias", "flat"])
+        manifest = readCalibManifest(self.conn)
+        self.assertEqual(manifest[("bias", "2016-05-03", "NONE", 0)], "2016-05-05")
+        # Where validity ranges overlap, the nearest calibration is used
+        self.assertEqual(manifest[("bias", "2016-05-06", "NONE", 0)], "2016-05-05")
+        self.assertEqual(manifest[("bias", "2016-05-07", "NONE", 0)], "2016-05-08")
+        self.assertEqual(manifest[("flat", "2016-05-04", "SDSSG", 0)], "2016-05-05")
+        self.assertNotIn(("flat", "2016-05-04", "SDSSR", 0), manifest)
+        self.assertEqual(len(manifest), 8 + 2 + 1)
+
+        # Rebuilding replaces the manifest
+        self.conn.execute("DELETE FROM flat")
+        writeCalibManifest(self.conn, ["bias", "flat"])
+        self.assertEqual(len(readCalibManifest(self.conn)), 8)
+
+
+class MapperManifestTestCase(lsst.utils.tests.TestCase):
+    """Test resolving calibrations through the mapper with the manifest
+
+    The repository has a visit on each of 2016-05-04 and 2016-05-07, and a
+    bias dated each of those nights, with overlapping validity ranges.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.root = os.path.join(cls.directory, "repo")
+        data = makeSyntheticData(cls.root, numVisits=1)
+        raw = os.path.join(cls.root, "incoming", "2016-05-07_0002.fits")
+        writeRaw(raw, makeRawHeader(2, datetime.datetime(2016, 5, 7, 3, 0, 0), "SDSSG", "synthetic", 30.0),
+                 seed=2)
+        bias = os.path.join(cls.root, "bias", "2016-05-07", "bias-2016-05-07.fits.gz")
+        writeCalib(bias, "bias", "2016-05-07", seed=10)
+        ingestSyntheticData(cls.root, SyntheticData(data.raws + [raw], data.calibs + [bias], []))
+
+        # A copy of the repository without the manifest
+        cls.noManifest = os.path.join(cls.directory, "noManifest")
+        os.mkdir(cls.noManifest)
+        for name in os.listdir(cls.root):
+            if name == "calibRegistry.sqlite3":
+                continue
+            os.symlink(os.path.join(cls.root, name), os.path.join(cls.noManifest, name))
+        shutil.copyfile(os.path.join(cls.root, "calibRegistry.sqlite3"),
+                        os.path.join(cls.noManifest, "calibRegistry.sqlite3"))
+        conn = sqlite3.connect(os.path.join(cls.noManifest, "calibRegistry.sqlite3"))
+        conn.execute("DROP TABLE %s" % (MANIFEST_TABLE,))
+        conn.commit()
+        conn.close()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    def getFilename(self, root, datasetType, visit):
+        """Return the filename of a calibration, relative to the root"""
+        butler = dafPersist.Butler(root=root)
+        return os.path.relpath(butler.get(datasetType + "_filename", visit=visit)[0], root)
+
+    def queryBias(self, date):
+        """Return the calibDate of the bias for a night, by range query"""
+        conn = sqlite3.connect(os.path.join(self.root, "calibRegistry.sqlite3"))
+        try:
+            rows = conn.execute("SELECT calibDate FROM bias WHERE validStart <= ? AND validEnd >= ?",
+                                (date, date)).fetchall()
+        finally:
+            conn.close()
+        self.assertEqual(len(rows), 1)
+        return rows[0][0]
+
+    def testManifest(self):
+        """The manifest gives the same calibrations as the range query"""
+        mapper = MonocamMapper(root=self.root)
+        for visit, date in ((1, "2016-05-04"), (2, "2016-05-07")):
+            calibDate = self.queryBias(date)
+            self.assertEqual(calibDate, date)
+            self.assertEqual(mapper._resolveCalib("bias", dict(visit=visit))["calibDate"], calibDate)
+            self.assertEqual(self.getFilename(self.root, "bias", visit),
+                             os.path.join("bias", calibDate, "bias-%s.fits.gz" % (calibDate,)))
+            for datasetType in ("bias", "dark", "flat"):
+                self.assertEqual(self.getFilename(self.root, datasetType, visit),
+                                 self.getFilename(self.noManifest, datasetType, visit))
+
+    def testNoManifest(self):
+        """Without a manifest, calibrations are found by range query"""
+        mapper = MonocamMapper(root=self.noManifest)
+        self.assertIsNone(mapper._getCalibManifest())
+        self.assertEqual(mapper._resolveCalib("bias", dict(visit=2)), dict(visit=2))
+        self.assertEqual(self.getFilename(self.noManifest, "bias", 2),
+                         os.path.join("bias", "2016-05-07", "bias-2016-05-07.fits.gz"))
+        self.assertEqual(self.getFilename(self.noManifest, "flat", 2),
+                         os.path.join("flat", "SDSSG", "2016-05-04", "flat_SDSSG_2016-05-04.fits.gz"))
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
@@ -0,0 +1,141 @@
+#
+# LSST Data Management System
+# Copyright 2016 LSST Corporation.
+#
+# This product includes software developed by the
+# LSST Project (http://www.lsst.org/).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the LSST License Statement and
+# the GNU General Public License along with this program.  If not,
+# see <http://www.lsstcorp.org/LegalNotices/>.
+#
+#
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+import astropy.io.fits
+
+import lsst.utils.tests
+import lsst.daf.persistence as dafPersist
+from lsst.obs.monocam.calibSidecar import (getSidecarNames, hasSidecar, materializeCalibs, readCalibImage,
+                                           writeCalibSidecar)
+from lsst.obs.monocam.synthetic import ingestSyntheticData, makeSyntheticData, writeCalib
+
+
+class CalibSidecarTestCase(lsst.utils.tests.TestCase):
+    """Test writing and reading calibration sidecars"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.template = "dark/%(calibDate)s/dark-%(calibDate)s.fits.gz"
+        self.filename = os.path.join(self.directory, self.template % dict(calibDate="2016-05-05"))
+        writeCalib(self.filename, "dark", "2016-05-05", seed=1)
+        with astropy.io.fits.open(self.filename) as hduList:
+            self.pixels = hduList[0].data.astype(numpy.float32)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def assertCalib(self, item, pixels):
+        """Assert that a calibration read has the expected pixels and the
+        header of the image HDU"""
+        self.assertFloatsEqual(item.getImage().getArray(), pixels)
+        self.assertEqual(item.getMetadata().getScalar("CALIB_ID"), "calibDate=2016-05-05 filter=NONE ccd=0")
+        self.assertEqual(item.getMetadata().getScalar("DARKTIME"), 1.0)
+
+    def testFallback(self):
+        """Without a sidecar, the calibration file is read"""
+        self.assertFalse(hasSidecar(self.filename))
+        self.assertCalib(readCalibImage(self.filename), self.pixels)
+
+    def testRoundTrip(self):
+        """A calibration read from its sidecar matches the calibration"""
+        writeCalibSidecar(self.filename)
+        self.assertTrue(hasSidecar(self.filename))
+        self.assertTrue(os.path.exists(getSidecarNames(self.filename)["image"]))
+        self.assertCalib(readCalibImage(self.filename), self.pixels)
+
+    def testStale(self):
+        """A sidecar older than its calibration isn't used"""
+        writeCalibSidecar(self.filename)
+        writeCalib(self.filename, "dark", "2016-05-05", seed=2)
+        mtime = os.stat(getSidecarNames(self.filename)["metadata"]).st_mtime
+        os.utime(self.filename, (mtime + 10, mtime + 10))
+        self.assertFalse(hasSidecar(self.filename))
+        with astropy.io.fits.open(self.filename) as hduList:
+            pixels = hduList[0].data.astype(numpy.float32)
+        self.assertCalib(readCalibImage(self.filename), pixels)
+        self.assertCalib(readCalibImage(self.filename, useSidecar=False), pixels)
+
+    def testMaterialize(self):
+        """Only calibrations without up-to-date sidecars are materialized,
+        unless forced"""
+        templates = dict(dark=self.template)
+        self.assertEqual(materializeCalibs(self.directory, templates), 1)
+        self.assertTrue(hasSidecar(self.filename))
+        self.assertEqual(materializeCalibs(self.directory, templates), 0)
+        self.assertEqual(materializeCalibs(self.directory, templates, force=True), 1)
+
+
+class MapperSidecarTestCase(lsst.utils.tests.TestCase):
+    """Test reading calibrations with sidecars through the butler"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.mkdtemp()
+        cls.root = os.path.join(cls.directory, "repo")
+        ingestSyntheticData(cls.root, makeSyntheticData(cls.root, numVisits=1), sidecars=True)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory)
+
+    def setUp(self):
+        self.butler = dafPersist.Butler(root=self.root)
+
+    def tearDown(self):
+        del self.butler
+
+    def testCalibs(self):
+        """Calibrations come from the sidecars, and are private copies"""
+        for datasetType in ("bias", "dark", "flat"):
+            filename = self.butler.get(datasetType + "_filename", visit=1)[0]
+            self.assertTrue(hasSidecar(filename))
+            expected = readCalibImage(filename, useSidecar=False).getImage().getArray()
+            exposure = self.butler.get(datasetType, visit=1)
+            self.assertFloatsEqual(exposure.getMaskedImage().getImage().getArray(), expected)
+            exposure.getMaskedImage().getImage().getArray()[:] = 0.0
+            exposure = self.butler.get(datasetType, visit=1)
+            self.assertFloatsEqual(exposure.getMaskedImage().getImage().getArray(), expected)
+            self.assertEqual(exposure.getDetector().getName(), "0")
+
+    def testDarkTime(self):
+        """The dark time comes from the header of the calibration image"""
+        dark = self.butler.get("dark", visit=1)
+        self.assertEqual(dark.getInfo().getVisitInfo().getDarkTime(), 1.0)
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
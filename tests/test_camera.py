@@ -20,10 +20,13 @@
 # see <http://www.lsstcorp.org/LegalNotices/>.
 #
 
+import os
+import shutil
+import tempfile
 import unittest
 
 import lsst.afw.cameraGeom
-from lsst.obs.monocam.monocam import Monocam
+from lsst.obs.monocam.monocam import Monocam, getMonocamCamera, getCameraFilename, writeCamera
 
 
 class ButlerTestCase(unittest.TestCase):
@@ -34,6 +37,27 @@ class ButlerTestCase(unittest.TestCase):
         self.assertIsInstance(camera, lsst.afw.cameraGeom.Camera)
         self.assertEqual(camera.getName(), "monocam")
 
+    def testCameraCache(self):
+        camera = getMonocamCamera()
+        self.assertIs(getMonocamCamera(), camera)
+        self.assertEqual(camera.getName(), "monocam")
+
+    def testPersistedCamera(self):
+        root = tempfile.mkdtemp()
+        try:
+            # Nothing persisted: use the constructed camera
+            self.assertIs(getMonocamCamera(root), getMonocamCamera())
+            filename = writeCamera(root)
+            self.assertEqual(filename, getCameraFilename(root))
+            self.assertTrue(os.path.exists(filename))
+            camera = getMonocamCamera(root)
+            self.assertIsNot(camera, getMonocamCamera())
+            self.assertIs(getMonocamCamera(root), camera)
+            self.assertEqual(camera.getName(), "monocam")
+            self.assertEqual(len(camera["0"]), 16)
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+
 
 if __name__ == "__main__":
     unittest.main()
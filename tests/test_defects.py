@@ -0,0 +1,114 @@
+#
+# LSST Data Management System
+# Copyright 2016 LSST Corporation.
+#
+# This product includes software developed by the
+# LSST Project (http://www.lsst.org/).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the LSST License Statement and
+# the GNU General Public License along with this program.  If not,
+# see <http://www.lsstcorp.org/LegalNotices/>.
+#
+
+
+import os
+import tempfile
+import unittest
+
+import lsst.utils.tests
+import lsst.geom as geom
+import lsst.afw.image as afwImage
+from lsst.obs.monocam.defects import DefectMap, readDefectMaps, writeDefectMaps
+
+
+class DefectMapTestCase(lsst.utils.tests.TestCase):
+    """Test the run-length index of defects"""
+
+    def setUp(self):
+        self.boxes = [geom.Box2I(geom.Point2I(3, 4), geom.Point2I(5, 6)),
+                      geom.Box2I(geom.Point2I(8, 1), geom.Point2I(12, 1))]
+        self.defects = DefectMap.fromBoxes(self.boxes)
+
+    def testMaskPixels(self):
+        """Masking matches masking each defect box separately"""
+        mask = afwImage.Mask(geom.Extent2I(10, 8))
+        self.defects.maskPixels(mask, "BAD")
+        expected = afwImage.Mask(geom.Extent2I(10, 8))
+        bad = expected.getPlaneBitMask("BAD")
+        for box in self.boxes:
+            box = geom.Box2I(box)
+            box.clip(expected.getBBox())
+            expected.getArray()[box.getMinY():box.getMaxY() + 1, box.getMinX():box.getMaxX() + 1] |= bad
+        self.assertImagesEqual(mask, expected)
+
+    def testXY0(self):
+        """Masking respects the origin of the mask"""
+        mask = afwImage.Mask(geom.Box2I(geom.Point2I(3, 4), geom.Extent2I(2, 2)))
+        self.defects.maskPixels(mask, "BAD")
+        self.assertTrue((mask.getArray() == mask.getPlaneBitMask("BAD")).all())
+
+    def testSubimage(self):
+        """Masking a subimage sets the pixels of its parent"""
+        parent = afwImage.Mask(geom.Extent2I(20, 16))
+        bbox = geom.Box2I(geom.Point2I(2, 1), geom.Extent2I(10, 8))
+        subimage = parent.Factory(parent, bbox, afwImage.PARENT, False)
+        self.assertFalse(subimage.getArray().flags.c_contiguous)
+        self.defects.maskPixels(subimage, "BAD")
+
+        expected = afwImage.Mask(bbox)
+        self.defects.maskPixels(expected, "BAD")
+        self.assertGreater(expected.getArray().sum(), 0)
+        array = parent.getArray()
+        self.assertFloatsEqual(array[bbox.getSlices()], expected.getArray())
+        array[bbox.getSlices()] = 0
+        self.assertFalse(array.any())
+
+    def testIteration(self):
+        """The map is a list of single-row defects"""
+        self.assertEqual(len(self.defects), 4)
+        bboxes = [defect.getBBox() for defect in self.defects]
+        self.assertEqual(bboxes[0], geom.Box2I(geom.Point2I(3, 4), geom.Point2I(5, 4)))
+        self.assertEqual(bboxes[-1], geom.Box2I(geom.Point2I(8, 1), geom.Point2I(12, 1)))
+
+    def testPersistence(self):
+        """Defects survive a round trip through a defects file"""
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "defects.txt")
+            writeDefectMaps(filename, {"0": self.defects})
+            defectMaps = readDefectMaps(filename)
+            self.assertEqual(list(defectMaps), ["0"])
+            self.assertFloatsEqual(defectMaps["0"].runs, self.defects.runs)
+
+            with open(filename, "w") as fd:
+                fd.write("# version: 999\n")
+            with self.assertRaises(RuntimeError):
+                readDefectMaps(filename)
+
+    def testPolicyDefects(self):
+        """The defects shipped with the package can be read"""
+        filename = os.path.join(os.path.dirname(__file__), os.pardir, "policy", "defects", "defects.txt")
+        defects = readDefectMaps(filename)["0"]
+        self.assertEqual(len(defects), 12)
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
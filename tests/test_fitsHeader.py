@@ -0,0 +1,176 @@
+#
+# LSST Data Management System
+# Copyright 2016 LSST Corporation.
+#
+# This product includes software developed by the
+# LSST Project (http://www.lsst.org/).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the LSST License Statement and
+# the GNU General Public License along with this program.  If not,
+# see <http://www.lsstcorp.org/LegalNotices/>.
+#
+
+
+import datetime
+import gzip
+import os
+import tempfile
+import unittest
+import unittest.mock
+
+import lsst.utils.tests
+import lsst.daf.base as dafBase
+import lsst.afw.fits as afwFits
+from lsst.afw.fits import readMetadata
+import lsst.obs.monocam.monocamMapper
+from lsst.obs.monocam.fitsHeader import readPrimaryHeader, stripExtension
+from lsst.obs.monocam.synthetic import makeRawHeader, writeRaw
+
+dataDir = os.path.join(os.path.dirname(__file__), "data")
+rawFilename = os.path.join(dataDir, "raw", "lsst1532+1", "SDSSG",
+                           "2016-05-04lsst1532+13_scienceII_01.fits")
+
+
+def makeHeader(cards):
+    """Format cards into FITS header blocks"""
+    text = "".join(card.ljust(80) for card in cards + ["END"])
+    text += " "*(-len(text) % 2880)
+    return text.encode("ascii")
+
+
+class FitsHeaderTestCase(lsst.utils.tests.TestCase):
+    """Test the lightweight FITS primary header reader"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        for name in os.listdir(self.directory):
+            os.unlink(os.path.join(self.directory, name))
+        os.rmdir(self.directory)
+
+    def testCards(self):
+        """Values of all types are parsed"""
+        header = makeHeader([
+            "SIMPLE  =                    T / conforms to FITS standard",
+            "BITPIX  =                    8",
+            "NAXIS   =                    0",
+            "OBJECT  = 'lsst1532+1'         / target",
+            "QUOTED  = 'it''s  '",
+            "EXPTIME =                 30.5 / exposure time",
+            "BIGFLT  =               1.5D10",
+            "UNDEF   =",
+            "LONG    = 'abc&'",
+            "CONTINUE  'def'",
+            "HIERARCH ESO TEL ALT = 45.0",
+            "COMMENT first comment",
+            "COMMENT second comment",
+        ])
+        filename = os.path.join(self.directory, "test.fits")
+        with open(filename, "wb") as fd:
+            fd.write(header + b"\0"*2880)
+
+        md = readPrimaryHeader(filename + "[3]")
+        self.assertIs(md.getScalar("SIMPLE"), True)
+        self.assertEqual(md.getScalar("NAXIS"), 0)
+        self.assertEqual(md.getScalar("OBJECT"), "lsst1532+1")
+        self.assertEqual(md.getComment("OBJECT"), "target")
+        self.assertEqual(md.getScalar("QUOTED"), "it's")
+        self.assertEqual(md.getScalar("EXPTIME"), 30.5)
+        self.assertEqual(md.getScalar("BIGFLT"), 1.5e10)
+        self.assertFalse(md.exists("UNDEF"))
+        self.assertEqual(md.getScalar("LONG"), "abcdef")
+        self.assertEqual(md.getScalar("ESO TEL ALT"), 45.0)
+        self.assertEqual(md.getArray("COMMENT"), ["first comment", "second comment"])
+
+        gzipped = filename + ".gz"
+        with gzip.open(gzipped, "wb") as fd:
+            fd.write(header)
+        self.assertEqual(readPrimaryHeader(gzipped).getScalar("OBJECT"), "lsst1532+1")
+
+        with open(filename, "wb") as fd:
+            fd.write(header[:2880 - 80])
+        with self.assertRaises(ValueError):
+            readPrimaryHeader(filename)
+
+    def testAfw(self):
+        """Results match reading the header with afw"""
+        md = dafBase.PropertyList()
+        md.set("OBJECT", "lsst1532+1")
+        md.set("EXPTIME", 15.0)
+        md.set("NUMBER", 12345)
+        md.set("FLAG", False)
+        md.set("DATE-OBS", "2016-05-05T01:02:03.456")
+        filename = os.path.join(self.directory, "afw.fits")
+        fitsFile = afwFits.Fits(filename, "w")
+        try:
+            fitsFile.createEmpty()
+            fitsFile.writeMetadata(md)
+        finally:
+            fitsFile.closeFile()
+
+        expected = readMetadata(filename, 0)
+        md = readPrimaryHeader(filename)
+        for name in ("OBJECT", "EXPTIME", "NUMBER", "FLAG", "DATE-OBS"):
+            self.assertEqual(md.getScalar(name), expected.getScalar(name))
+
+    def testRaw(self):
+        """Results match reading the PHU of multi-extension raws with afw"""
+        synthetic = os.path.join(self.directory, "synthetic.fits")
+        writeRaw(synthetic, makeRawHeader(12, datetime.datetime(2016, 5, 4, 3, 0, 0), "SDSSG", "field", 30.0))
+        for filename in (synthetic, rawFilename):
+            expected = readMetadata(filename, 0)
+            self.assertTrue(expected.exists("DATE-OBS"))
+            md = readPrimaryHeader(filename + "[1]")
+            for name in expected.names():
+                if name in ("COMMENT", "HISTORY"):
+                    continue
+                self.assertEqual(md.getScalar(name), expected.getScalar(name), msg=name)
+
+    def testTruncated(self):
+        """The mapper falls back to afw for a truncated gzipped raw"""
+        synthetic = os.path.join(self.directory, "synthetic.fits")
+        writeRaw(synthetic, makeRawHeader(12, datetime.datetime(2016, 5, 4, 3, 0, 0), "SDSSG", "field", 30.0))
+        with open(synthetic, "rb") as fd:
+            data = gzip.compress(fd.read())
+        truncated = os.path.join(self.directory, "truncated.fits.gz")
+        with open(truncated, "wb") as fd:
+            fd.write(data[:30])  # Within the primary header
+        with self.assertRaises((OSError, EOFError)):
+            readPrimaryHeader(truncated)
+
+        mapper = lsst.obs.monocam.monocamMapper.MonocamMapper(root=dataDir)
+        fallback = dafBase.PropertyList()
+        fallback.set("OBJECT", "fallback")
+        with unittest.mock.patch.object(lsst.obs.monocam.monocamMapper, "readMetadata",
+                                        return_value=fallback) as mock:
+            md = mapper._readRawMetadata(truncated + "[1]")
+        mock.assert_called_once_with(truncated, 0)
+        self.assertEqual(md.getScalar("OBJECT"), "fallback")
+
+    def testStripExtension(self):
+        self.assertEqual(stripExtension("raw/a.fits[3]"), "raw/a.fits")
+        self.assertEqual(stripExtension("raw/a.fits"), "raw/a.fits")
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
@@ -0,0 +1,66 @@
+#
+# LSST Data Management System
+# Copyright 2016 LSST Corporation.
+#
+# This product includes software developed by the
+# LSST Project (http://www.lsst.org/).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the LSST License Statement and
+# the GNU General Public License along with this program.  If not,
+# see <http://www.lsstcorp.org/LegalNotices/>.
+#
+
+
+import subprocess
+import sys
+import unittest
+
+import lsst.utils.tests
+import lsst.obs.monocam
+
+
+class LazyImportTestCase(lsst.utils.tests.TestCase):
+    """Test the lazy import of the mapper and ISR task"""
+
+    def testNotEager(self):
+        """Importing the package does not import the mapper or ISR task"""
+        code = ("import sys, lsst.obs.monocam; "
+                "sys.exit(any(name in sys.modules for name in "
+                "('lsst.obs.monocam.monocamMapper', 'lsst.obs.monocam.monocamIsrTask')))")
+        self.assertEqual(subprocess.call([sys.executable, "-c", code]), 0)
+
+    def testAttributes(self):
+        """The public API is unchanged"""
+        from lsst.obs.monocam.monocamMapper import MonocamMapper
+        from lsst.obs.monocam.monocamIsrTask import MonocamIsrConfig, MonocamIsrTask
+        self.assertIs(lsst.obs.monocam.MonocamMapper, MonocamMapper)
+        self.assertIs(lsst.obs.monocam.MonocamIsrConfig, MonocamIsrConfig)
+        self.assertIs(lsst.obs.monocam.MonocamIsrTask, MonocamIsrTask)
+        for name in ("MonocamMapper", "MonocamIsrConfig", "MonocamIsrTask"):
+            self.assertIn(name, dir(lsst.obs.monocam))
+            self.assertIn(name, lsst.obs.monocam.__all__)
+        with self.assertRaises(AttributeError):
+            lsst.obs.monocam.NoSuchAttribute
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
@@ -0,0 +1,165 @@
+#
+# LSST Data Management System
+# Copyright 2016 LSST Corporation.
+#
+# This product includes software developed by the
+# LSST Project (http://www.lsst.org/).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the LSST License Statement and
+# the GNU General Public License along with this program.  If not,
+# see <http://www.lsstcorp.org/LegalNotices/>.
+#
+
+
+import collections
+import os
+import shutil
+import tempfile
+import unittest
+import unittest.mock
+
+import lsst.utils.tests
+import lsst.daf.base as dafBase
+import lsst.geom as geom
+import lsst.afw.image as afwImage
+import lsst.pipe.tasks.ingest
+import lsst.pipe.tasks.ingestCalibs
+import lsst.obs.monocam.ingest
+from lsst.utils import getPackageDir
+from lsst.obs.monocam.ingest import (MonocamCalibsParseTask, MonocamIngestCalibsTask, MonocamParseTask,
+                                     findCalibFiles, parseCalibId)
+from lsst.obs.monocam.synthetic import writeCalib
+
+
+class ParallelParseTestCase(lsst.utils.tests.TestCase):
+    """Test parsing headers with a pool of processes"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filenames = []
+        for visit in range(5):
+            md = dafBase.PropertyList()
+            md.set("VISIT", visit)
+            md.set("OBJECT", "field%d" % (visit,))
+            filename = os.path.join(self.directory, "image%d.fits.gz" % (visit,))
+            afwImage.ImageF(geom.Extent2I(2, 2)).writeFits(filename, md)
+            self.filenames.append(filename)
+        self.config = MonocamParseTask.ConfigClass()
+        self.config.translation = {"visit": "VISIT", "object": "OBJECT"}
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testPrefetch(self):
+        """Prefetched results match parsing serially"""
+        expected = [MonocamParseTask(config=self.config).getInfo(filename) for filename in self.filenames]
+        self.assertEqual(expected[3][0]["visit"], 3)
+        self.assertEqual(expected[3][0]["basename"], "image3")
+
+        task = MonocamParseTask(config=self.config)
+        missing = os.path.join(self.directory, "missing.fits")
+        task.prefetchInfo(self.filenames + [missing], 2)
+        self.assertEqual([task.getInfo(filename) for filename in self.filenames], expected)
+        with self.assertRaises(RuntimeError):
+            task.getInfo(missing)
+
+
+class CalibIngestTestCase(lsst.utils.tests.TestCase):
+    """Test support for bulk ingest of calibrations"""
+
+    def testParseCalibId(self):
+        values = parseCalibId("calibDate=2016-05-05 filter=SDSSG ccd=0")
+        self.assertEqual(values, {"calibDate": "2016-05-05", "filter": "SDSSG", "ccd": "0"})
+        self.assertIs(parseCalibId("calibDate=2016-05-05 filter=SDSSG ccd=0"), values)
+
+    def testFindCalibFiles(self):
+        directory = tempfile.mkdtemp()
+        try:
+            expected = []
+            for path in ("bias/2016-05-05/bias.fits.gz", "flat/SDSSG/2016-05-05/flat.fits",
+                         "flat/SDSSR/2016-05-05/flat.fits", "calibRegistry.sqlite3"):
+                filename = os.path.join(directory, path)
+                os.makedirs(os.path.dirname(filename), exist_ok=True)
+                open(filename, "w").close()
+                if path.endswith(("fits", "gz")):
+                    expected.append(filename)
+            self.assertEqual(findCalibFiles(directory), expected)
+        finally:
+            shutil.rmtree(directory)
+
+
+class CalibParseTestCase(lsst.utils.tests.TestCase):
+    """Test parsing the headers of calibrations"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filenames = {}
+        for calibType in ("bias", "flat"):
+            filename = os.path.join(self.directory, calibType + ".fits")
+            writeCalib(filename, calibType, "2016-05-05", filterName="SDSSG")
+            self.filenames[calibType] = filename
+        config = MonocamIngestCalibsTask.ConfigClass()
+        config.load(os.path.join(getPackageDir("obs_monocam"), "config", "ingestCalibs.py"))
+        self.config = config.parse
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def countReads(self):
+        """Count the header reads of each file, for the rest of the test
+
+        @return Counter of the reads, indexed by filename
+        """
+        reads = collections.Counter()
+        realReadMetadata = lsst.obs.monocam.ingest.readMetadata
+
+        def readMetadata(filename, *args, **kwargs):
+            reads[filename] += 1
+            return realReadMetadata(filename, *args, **kwargs)
+
+        for module in (lsst.obs.monocam.ingest, lsst.pipe.tasks.ingest, lsst.pipe.tasks.ingestCalibs):
+            if hasattr(module, "readMetadata"):
+                patch = unittest.mock.patch.object(module, "readMetadata", readMetadata)
+                patch.start()
+                self.addCleanup(patch.stop)
+        return reads
+
+    def testSingleRead(self):
+        """The header of each file is read once, for getInfo and
+        getCalibType"""
+        reads = self.countReads()
+        task = MonocamCalibsParseTask(config=self.config)
+        for calibType, filename in self.filenames.items():
+            phuInfo, infoList = task.getInfo(filename)
+            self.assertEqual(task.getCalibType(filename), calibType)
+            self.assertEqual(phuInfo["calibDate"], "2016-05-05")
+            self.assertEqual(phuInfo["filter"], "SDSSG")
+            self.assertEqual(infoList, [phuInfo])
+        self.assertEqual(reads, {filename: 1 for filename in self.filenames.values()})
+
+        # Without getInfo, getCalibType reads the header itself
+        self.assertEqual(task.getCalibType(self.filenames["bias"]), "bias")
+        self.assertEqual(reads[self.filenames["bias"]], 2)
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
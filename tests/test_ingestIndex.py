@@ -0,0 +1,81 @@
+#
+# LSST Data Management System
+# Copyright 2016 LSST Corporation.
+#
+# This product includes software developed by the
+# LSST Project (http://www.lsst.org/).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the LSST License Statement and
+# the GNU General Public License along with this program.  If not,
+# see <http://www.lsstcorp.org/LegalNotices/>.
+#
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import lsst.utils.tests
+from lsst.obs.monocam.ingestIndex import IngestIndex, getFileStat
+
+
+class IngestIndexTestCase(lsst.utils.tests.TestCase):
+    """Test the index of ingested files"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filenames = [self.writeFile("file%d.fits" % (ii,), "data") for ii in range(3)]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def writeFile(self, name, contents):
+        filename = os.path.join(self.directory, name)
+        with open(filename, "w") as fd:
+            fd.write(contents)
+        return filename
+
+    def testDiff(self):
+        indexFile = os.path.join(self.directory, "index.sqlite3")
+        with IngestIndex(indexFile) as index:
+            diff = index.diff(self.filenames)
+            self.assertEqual(diff.new, self.filenames)
+            self.assertEqual(diff.changed + diff.unchanged + diff.missing, [])
+            index.update({filename: getFileStat(filename) for filename in self.filenames})
+
+        # Add a file, change a file and remove a file
+        added = self.writeFile("file3.fits", "data")
+        self.writeFile("file1.fits", "more data")
+        os.unlink(self.filenames[2])
+        filenames = [self.filenames[0], self.filenames[1], added]
+
+        with IngestIndex(indexFile) as index:
+            diff = index.diff(filenames)
+        self.assertEqual(diff.new, [added])
+        self.assertEqual(diff.changed, [self.filenames[1]])
+        self.assertEqual(diff.unchanged, [self.filenames[0]])
+        self.assertEqual(diff.missing, [self.filenames[2]])
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
@@ -0,0 +1,167 @@
+#
+# LSST Data Management System
+# Copyright 2016 LSST Corporation.
+#
+# This product includes software developed by the
+# LSST Project (http://www.lsst.org/).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the LSST License Statement and
+# the GNU General Public License along with this program.  If not,
+# see <http://www.lsstcorp.org/LegalNotices/>.
+#
+
+
+import unittest
+
+import numpy
+
+import lsst.utils.tests
+from lsst.obs.monocam.isrFunctions import (fusedBiasDarkCorrection, fusedFlatCorrection, applyVarianceFloor,
+                                           percentileStdev, subsampleStdev, histogramStdev,
+                                           QuartileHistogram, getAmpBandRows)
+
+
+def makeArrays(rng, shape, mean, sigma):
+    """Make image, mask and variance arrays"""
+    image = rng.normal(mean, sigma, shape).astype(numpy.float32)
+    mask = rng.randint(0, 4, shape).astype(numpy.int32)
+    variance = rng.uniform(-1.0, 10.0, shape).astype(numpy.float32)
+    return image, mask, variance
+
+
+class FusedCorrectionTestCase(lsst.utils.tests.TestCase):
+    """Test the fused corrections against separate full-frame passes"""
+
+    def setUp(self):
+        self.rng = numpy.random.RandomState(12345)
+        self.shape = (301, 97)  # Not a multiple of the chunk size
+        self.science = makeArrays(self.rng, self.shape, 1000.0, 30.0)
+        self.bias = makeArrays(self.rng, self.shape, 100.0, 5.0)
+        self.dark = makeArrays(self.rng, self.shape, 2.0, 0.5)
+        self.flat = makeArrays(self.rng, self.shape, 1.0, 0.05)
+
+    def copy(self, arrays):
+        return tuple(array.copy() for array in arrays)
+
+    def testBiasDark(self):
+        darkScale = 3.5
+        image, mask, variance = self.copy(self.science)
+        fusedBiasDarkCorrection(image, mask, variance, bias=self.bias, dark=self.dark, darkScale=darkScale,
+                                rowsPerChunk=16)
+
+        expectImage = self.science[0] - self.bias[0] - darkScale*self.dark[0]
+        expectMask = self.science[1] | self.bias[1] | self.dark[1]
+        expectVariance = self.science[2] + self.bias[2] + darkScale**2*self.dark[2]
+        self.assertFloatsAlmostEqual(image, expectImage, rtol=1.0e-6)
+        self.assertTrue(numpy.all(mask == expectMask))
+        self.assertFloatsAlmostEqual(variance, expectVariance, rtol=1.0e-5, atol=1.0e-5)
+
+    def testFlat(self):
+        flatScale = 1.3
+        floor = 7.0
+        image, mask, variance = self.copy(self.science)
+        fusedFlatCorrection(image, mask, variance, flat=self.flat, flatScale=flatScale, varianceFloor=floor,
+                            rowsPerChunk=16)
+
+        flooredVariance = numpy.where(self.science[2] > 0, self.science[2], floor)
+        divisor = self.flat[0]/flatScale
+        expectImage = self.science[0]/divisor
+        expectVariance = (flooredVariance + expectImage**2*self.flat[2]/flatScale**2)/divisor**2
+        self.assertFloatsAlmostEqual(image, expectImage, rtol=1.0e-6)
+        self.assertTrue(numpy.all(mask == (self.science[1] | self.flat[1])))
+        self.assertFloatsAlmostEqual(variance, expectVariance, rtol=1.0e-5)
+
+    def testNoCalibs(self):
+        image, mask, variance = self.copy(self.science)
+        fusedBiasDarkCorrection(image, mask, variance)
+        self.assertTrue(numpy.all(image == self.science[0]))
+
+
+class VarianceFloorTestCase(lsst.utils.tests.TestCase):
+    """Test the estimators of the variance floor"""
+
+    def setUp(self):
+        rng = numpy.random.RandomState(12345)
+        self.sigma = 10.0
+        # Integer-like data, as for bias-subtracted ADUs
+        self.image = numpy.round(rng.normal(1000.0, self.sigma, (1000, 500))).astype(numpy.float32)
+        self.image[100:110, 200:210] = 60000.0  # A bright source
+
+    def testEstimators(self):
+        for estimate in (percentileStdev(self.image),
+                         subsampleStdev(self.image, stride=4),
+                         histogramStdev(self.image, binWidth=1.0)):
+            self.assertFloatsAlmostEqual(estimate, self.sigma, rtol=0.05)
+
+    def testHistogramContinuous(self):
+        rng = numpy.random.RandomState(54321)
+        image = rng.normal(1000.0, self.sigma, (1000, 500)).astype(numpy.float32)
+        self.assertFloatsAlmostEqual(histogramStdev(image, binWidth=1.0), percentileStdev(image), rtol=0.01)
+
+    def testHistogramAccumulation(self):
+        """Accumulating bands gives the same result as the whole image"""
+        whole = QuartileHistogram(900.0, 1100.0)
+        whole.add(self.image)
+        bands = QuartileHistogram(900.0, 1100.0)
+        for start in range(0, self.image.shape[0], 300):
+            bands.add(self.image[start:start + 300])
+        self.assertEqual(whole.getStdev(), bands.getStdev())
+
+    def testHistogramOutOfRange(self):
+        histogram = QuartileHistogram(2000.0, 3000.0)
+        histogram.add(self.image)
+        self.assertIsNone(histogram.getStdev())
+
+    def testApplyFloor(self):
+        variance = numpy.array([[1.0, -1.0], [0.0, numpy.nan]], dtype=numpy.float32)
+        expect = numpy.where(variance > 0, variance, 5.0)
+        applyVarianceFloor(variance, 5.0)
+        self.assertFloatsEqual(variance, expect)
+
+
+class AmpBandRowsTestCase(lsst.utils.tests.TestCase):
+    """Test assembling a CCD a band of rows at a time"""
+
+    def testAssembly(self):
+        rng = numpy.random.RandomState(12345)
+        dataStart, numRows = 3, 50  # Rows before the data in the raw amp, and rows of data
+        raws = [rng.uniform(size=(numRows + 10, 4)) for _ in range(2)]
+        # Bottom amp as read; top amp flipped in y, as for Monocam
+        amps = [(0, numRows, False), (numRows, 2*numRows, True)]
+        expected = numpy.concatenate([raws[0][dataStart:dataStart + numRows],
+                                      raws[1][dataStart:dataStart + numRows][::-1]])
+        for bandRows in (1, 7, 50, 64, 200):
+            ccd = numpy.full(expected.shape, numpy.nan)
+            for start in range(0, ccd.shape[0], bandRows):
+                band = slice(start, min(start + bandRows, ccd.shape[0]))
+                for raw, (ampStart, ampStop, flip) in zip(raws, amps):
+                    rows = getAmpBandRows(band, ampStart, ampStop, dataStart, flip)
+                    if rows is None:
+                        self.assertTrue(band.stop <= ampStart or band.start >= ampStop)
+                        continue
+                    ccdRows, rawRows = rows
+                    ccd[ccdRows] = raw[rawRows][::-1] if flip else raw[rawRows]
+            self.assertFloatsEqual(ccd, expected)
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
@@ -0,0 +1,146 @@
+#
+# LSST Data Management System
+# Copyright 2016 LSST Corporation.
+#
+# This product includes software developed by the
+# LSST Project (http://www.lsst.org/).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the LSST License Statement and
+# the GNU General Public License along with this program.  If not,
+# see <http://www.lsstcorp.org/LegalNotices/>.
+#
+
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import unittest.mock
+
+import lsst.utils.tests
+import lsst.daf.persistence as dafPersist
+from lsst.utils import getPackageDir
+from lsst.obs.monocam.liveIngest import DirectoryWatcher, LiveIngestTask
+from lsst.obs.monocam.synthetic import makeSyntheticData
+
+
+class DirectoryWatcherTestCase(lsst.utils.tests.TestCase):
+    """Test polling a directory tree for new files"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.directory, "night1"))
+        self.existing = self.writeFile("night1/existing.fits")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def writeFile(self, name, age=10.0):
+        """Write a file, with a modification time age seconds ago"""
+        filename = os.path.join(self.directory, name)
+        with open(filename, "w") as fd:
+            fd.write("data")
+        mtime = time.time() - age
+        os.utime(filename, (mtime, mtime))
+        return filename
+
+    def testPoll(self):
+        watcher = DirectoryWatcher(self.directory, pattern="*.fits", settleTime=1.0)
+        self.assertEqual(watcher.poll(), [])
+
+        new = self.writeFile("night1/new.fits")
+        self.writeFile("night1/ignored.txt")
+        os.mkdir(os.path.join(self.directory, "night2"))
+        other = self.writeFile("night2/other.fits", age=5.0)
+        unsettled = self.writeFile("night2/unsettled.fits", age=0.0)
+        self.assertEqual(watcher.poll(), [new, other])
+        self.assertEqual(watcher.poll(), [])
+
+        # Once settled, the file is returned
+        mtime = time.time() - 2.0
+        os.utime(unsettled, (mtime, mtime))
+        self.assertEqual(watcher.poll(), [unsettled])
+        self.assertEqual(watcher.poll(), [])
+
+    def testExisting(self):
+        watcher = DirectoryWatcher(self.directory, pattern="*.fits", existing=True)
+        self.assertEqual(watcher.poll(), [self.existing])
+
+
+class LiveIngestTestCase(lsst.utils.tests.TestCase):
+    """Test ingesting raw files as they arrive"""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.data = makeSyntheticData(self.root, numVisits=3)
+        config = LiveIngestTask.ConfigClass()
+        config.load(os.path.join(getPackageDir("obs_monocam"), "config", "ingest.py"))
+        config.settleTime = 0.0
+        config.pollInterval = 0.0
+        config.batchSize = 2
+        config.ingestExisting = True
+        self.task = LiveIngestTask(config=config)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def getVisits(self):
+        """Return the visits in the registry, as seen by a new Butler"""
+        butler = dafPersist.Butler(root=self.root)
+        return sorted(butler.queryMetadata("raw", "visit"))
+
+    def testWatch(self):
+        incoming = os.path.dirname(self.data.raws[0])
+        dataIds = []
+        self.task.watch(self.root, incoming, create=True, onVisit=dataIds.append, maxPolls=1)
+        self.assertEqual(dataIds, [dict(visit=1), dict(visit=2), dict(visit=3)])
+        self.assertEqual(self.getVisits(), [1, 2, 3])
+        butler = dafPersist.Butler(root=self.root)
+        self.assertTrue(butler.datasetExists("raw", visit=3))
+
+    def testIngestBatch(self):
+        butler = dafPersist.Butler(root=self.root)
+        registry = self.task.openRegistry(self.root, create=True)
+        try:
+            # Each batch is visible as soon as it is committed
+            self.assertEqual(self.task.ingestBatch(self.data.raws[:2], registry, butler, "link"),
+                             [dict(visit=1), dict(visit=2)])
+            self.assertEqual(self.getVisits(), [1, 2])
+
+            # An interrupted batch leaves the registry as it was
+            with unittest.mock.patch.object(self.task, "ingest", side_effect=KeyboardInterrupt):
+                with self.assertRaises(KeyboardInterrupt):
+                    self.task.ingestBatch(self.data.raws[2:], registry, butler, "link")
+            self.assertEqual(self.getVisits(), [1, 2])
+
+            # Files already registered are skipped
+            self.assertEqual(self.task.ingestBatch(self.data.raws, registry, butler, "link"),
+                             [dict(visit=3)])
+            self.assertEqual(self.getVisits(), [1, 2, 3])
+        finally:
+            registry.close()
+        self.assertEqual(self.getVisits(), [1, 2, 3])
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
@@ -0,0 +1,384 @@
+#
+# LSST Data Management System
+# Copyright 2016 LSST Corporation.
+#
+# This product includes software developed by the
+# LSST Project (http://www.lsst.org/).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the LSST License Statement and
+# the GNU General Public License along with this program.  If not,
+# see <http://www.lsstcorp.org/LegalNotices/>.
+#
+#
+import json
+import os
+import shutil
+import tempfile
+import tracemalloc
+import unittest
+
+import lsst.utils.tests
+import lsst.afw.image as afwImage
+import lsst.daf.persistence as dafPersist
+import lsst.geom as geom
+from lsst.utils import getPackageDir
+from lsst.obs.monocam.calibSidecar import hasSidecar
+from lsst.obs.monocam.defects import DefectMap
+from lsst.obs.monocam.monocamIsrTask import MonocamIsrTask
+from lsst.obs.monocam.synthetic import ingestSyntheticData, makeSyntheticData
+
+datadir = os.path.join(os.path.dirname(__file__), "data")
+VISIT = 33  # Visit of the raw image in the test data
+NUM_SYNTHETIC_VISITS = 3
+
+_syntheticDir = None  # Directory holding the synthetic repositories, once written
+
+
+def getSyntheticRepo(sidecars=False):
+    """Return the root of a repository of synthetic data, with bias, dark
+    and flat, written and ingested on first use
+
+    @param sidecars  Return a repository whose calibrations have sidecars?
+    """
+    global _syntheticDir
+    if _syntheticDir is None:
+        _syntheticDir = tempfile.mkdtemp()
+    root = os.path.join(_syntheticDir, "sidecars" if sidecars else "repo")
+    if not os.path.exists(root):
+        ingestSyntheticData(root, makeSyntheticData(root, numVisits=NUM_SYNTHETIC_VISITS), sidecars=sidecars)
+    return root
+
+
+def makeIsrConfig(**kwargs):
+    """Return an ISR configuration with the Monocam overrides and the given
+    values, not writing the results"""
+    config = MonocamIsrTask.ConfigClass()
+    config.load(os.path.join(getPackageDir("obs_monocam"), "config", "isr.py"))
+    config.doWrite = False
+    for name, value in kwargs.items():
+        setattr(config, name, value)
+    return config
+
+
+class RawAmpsTestCase(lsst.utils.tests.TestCase):
+    """Test ISR reading all the amplifiers of the raw data at once"""
+
+    def setUp(self):
+        self.butler = dafPersist.Butler(root=datadir)
+        self.dataRef = self.butler.dataRef("raw", visit=VISIT)
+        # There are no calibrations in the test data
+        self.config = makeIsrConfig(doBias=False, doDark=False, doFlat=False)
+
+    def tearDown(self):
+        del self.butler
+        del self.dataRef
+
+    def testButler(self):
+        """The butler returns the standardized amplifiers"""
+        ampExposures = self.butler.get("raw_amps", visit=VISIT)
+        detector = self.butler.get("camera")[0]
+        self.assertEqual(len(ampExposures), len(detector))
+        for channel, exposure in enumerate(ampExposures, 1):
+            self.assertEqual(exposure.getDetector().getName(), detector.getName())
+            self.assertTrue(exposure.getInfo().hasVisitInfo())
+            ampExposure = self.butler.get("raw_amp", visit=VISIT, channel=channel)
+            self.assertImagesEqual(exposure.getMaskedImage().getImage(),
+                                   ampExposure.getMaskedImage().getImage())
+
+    def testRunDataRef(self):
+        """runDataRef matches processing the amplifiers read one at a time"""
+        task = MonocamIsrTask(config=self.config)
+        result = task.runDataRef(self.dataRef)
+        ampExposures = [self.butler.get("raw_amp", visit=VISIT, channel=channel) for
+                        channel in range(1, len(result.exposure.getDetector()) + 1)]
+        isrData = task.readIsrData(self.dataRef, ampExposures[0])
+        expected = task.run(task.assembleAmps(ampExposures), **isrData.getDict())
+        self.assertEqual(result.exposure.getBBox(), result.exposure.getDetector().getBBox())
+        self.assertMaskedImagesEqual(result.exposure.getMaskedImage(), expected.exposure.getMaskedImage())
+
+    def testThreads(self):
+        """Processing the amplifiers on a thread pool matches processing
+        them serially"""
+        serial = MonocamIsrTask(config=self.config)
+        self.config.numThreads = 4
+        threaded = MonocamIsrTask(config=self.config)
+        expected = serial.assembleAmps(self.butler.get("raw_amps", visit=VISIT))
+        ccdExposure = threaded.assembleAmps(self.butler.get("raw_amps", visit=VISIT))
+        self.assertEqual(ccdExposure.getBBox(), expected.getBBox())
+        self.assertMaskedImagesEqual(ccdExposure.getMaskedImage(), expected.getMaskedImage())
+
+
+class DefectTestCase(lsst.utils.tests.TestCase):
+    """Test masking and interpolating over a DefectMap"""
+
+    def testInterpolation(self):
+        """Only the defects are interpolated over, not other BAD pixels"""
+        exposure = afwImage.ExposureF(geom.Extent2I(40, 30))
+        maskedImage = exposure.getMaskedImage()
+        image = maskedImage.getImage().getArray()
+        mask = maskedImage.getMask()
+        image[:] = 10.0
+        maskedImage.getVariance().getArray()[:] = 1.0
+        defectBox = geom.Box2I(geom.Point2I(10, 12), geom.Extent2I(3, 2))
+        image[defectBox.getSlices()] = 1.0e4
+        image[5, 30] = 500.0
+        mask.getArray()[5, 30] = mask.getPlaneBitMask("BAD")
+
+        planes = mask.getMaskPlaneDict()
+        task = MonocamIsrTask(config=makeIsrConfig())
+        task.maskAndInterpDefect(exposure, DefectMap.fromBoxes([defectBox]))
+        self.assertFloatsAlmostEqual(image[defectBox.getSlices()], 10.0, rtol=1.0e-3)
+        self.assertEqual(image[5, 30], 500.0)
+        bad = mask.getPlaneBitMask("BAD")
+        self.assertTrue((mask.getArray()[defectBox.getSlices()] & bad).all())
+        intrp = mask.getPlaneBitMask("INTRP")
+        self.assertTrue((mask.getArray()[defectBox.getSlices()] & intrp).all())
+        self.assertEqual(mask.getArray()[5, 30] & intrp, 0)
+        # The mask planes, which are shared by all masks, are unchanged
+        self.assertEqual(mask.getMaskPlaneDict(), planes)
+        self.assertEqual(afwImage.Mask(geom.Extent2I(1, 1)).getMaskPlaneDict(), planes)
+
+
+class SyntheticTestCase(lsst.utils.tests.TestCase):
+    """Base class for tests of ISR on the synthetic data, with calibrations"""
+
+    def setUp(self):
+        self.root = getSyntheticRepo()
+        self.butler = dafPersist.Butler(root=self.root)
+        self.visits = list(range(1, NUM_SYNTHETIC_VISITS + 1))
+        self.dataRefs = [self.butler.dataRef("raw", visit=visit) for visit in self.visits]
+
+    def tearDown(self):
+        del self.butler
+        del self.dataRefs
+
+    def assertResultsEqual(self, result, expected):
+        """Assert that two results of ISR are the same"""
+        self.assertEqual(result.exposure.getBBox(), expected.exposure.getBBox())
+        self.assertMaskedImagesEqual(result.exposure.getMaskedImage(), expected.exposure.getMaskedImage())
+
+
+class StreamTestCase(SyntheticTestCase):
+    """Test processing a sequence of sensors, reading ahead"""
+
+    def testStream(self):
+        """Results are in order, and match runDataRef, whatever the limits
+        on reading ahead"""
+        expected = [MonocamIsrTask(config=makeIsrConfig()).runDataRef(dataRef) for dataRef in self.dataRefs]
+        for depth, maxMegabytes in ((1, 2048.0), (2, 2048.0), (2, 1.0)):
+            config = makeIsrConfig(prefetchDepth=depth, prefetchMaxMegabytes=maxMegabytes)
+            results = list(MonocamIsrTask(config=config).runDataRefStream(self.dataRefs))
+            self.assertEqual(len(results), len(self.visits))
+            for visit, result, exp in zip(self.visits, results, expected):
+                self.assertEqual(result.exposure.getInfo().getVisitInfo().getExposureId(), visit)
+                self.assertResultsEqual(result, exp)
+
+    def testDataSize(self):
+        """The size of the data read ahead includes the raw amplifiers and
+        the calibrations"""
+        task = MonocamIsrTask(config=makeIsrConfig())
+        data = task.readDataRef(self.dataRefs[0])
+        self.assertEqual(len(data.ampExposures), len(data.ampExposures[0].getDetector()))
+        exposures = list(data.ampExposures) + [data.isrData.bias, data.isrData.dark, data.isrData.flat]
+        maskedImages = [exposure.getMaskedImage() for exposure in exposures]
+        expected = sum(plane.getArray().nbytes for maskedImage in maskedImages for plane in
+                       (maskedImage.getImage(), maskedImage.getMask(), maskedImage.getVariance()))
+        self.assertEqual(task._getDataSize(data), expected)
+
+
+class FusedTestCase(SyntheticTestCase):
+    """Test the fused corrections against the separate afw corrections"""
+
+    def runIsr(self, **kwargs):
+        """Run ISR on the first visit, timing the steps
+
+        @param **kwargs  Configuration overrides
+        @return tuple of the result and the names of the steps run
+        """
+        task = MonocamIsrTask(config=makeIsrConfig(doStepTiming=True, **kwargs))
+        result = task.runDataRef(self.dataRefs[0])
+        steps = set(name[:-len("StepCount")] for name in task.metadata.names() if name.endswith("StepCount"))
+        return result, steps
+
+    def assertResultsAlmostEqual(self, result, expected):
+        """Assert that two results of ISR are equal within tolerance"""
+        self.assertEqual(result.exposure.getBBox(), expected.exposure.getBBox())
+        self.assertMaskedImagesAlmostEqual(result.exposure.getMaskedImage(),
+                                           expected.exposure.getMaskedImage(), rtol=1.0e-5, atol=1.0e-3)
+
+    def testFused(self):
+        """The fused corrections match the separate corrections"""
+        expected, steps = self.runIsr(doFusedCorrection=False)
+        self.assertTrue({"bias", "dark", "flat"} <= steps)
+        result, steps = self.runIsr(doFusedCorrection=True)
+        self.assertTrue({"fusedBiasDark", "fusedFlat"} <= steps)
+        self.assertFalse({"bias", "dark", "flat"} & steps)
+        self.assertResultsAlmostEqual(result, expected)
+
+    def testNoFlat(self):
+        """Without a flat, only the bias and dark are fused"""
+        expected, _ = self.runIsr(doFusedCorrection=False, doFlat=False)
+        result, steps = self.runIsr(doFusedCorrection=True, doFlat=False)
+        self.assertIn("fusedBiasDark", steps)
+        self.assertFalse({"fusedFlat", "flat"} & steps)
+        self.assertResultsAlmostEqual(result, expected)
+
+    def testFlatScaling(self):
+        """A flat scaling other than USER falls back to the afw flat
+        correction"""
+        expected, _ = self.runIsr(doFusedCorrection=False, flatScalingType="MEAN")
+        result, steps = self.runIsr(doFusedCorrection=True, flatScalingType="MEAN")
+        self.assertTrue({"fusedBiasDark", "flat"} <= steps)
+        self.assertNotIn("fusedFlat", steps)
+        self.assertResultsAlmostEqual(result, expected)
+
+
+class StepTimingTestCase(SyntheticTestCase):
+    """Test timing the steps of ISR"""
+
+    # Steps timed for every sensor with the default configuration
+    steps = ("readRaw", "readCalibs", "convertIntToFloat", "saturationDetection", "overscan", "assembly",
+             "variance", "varianceFloor", "defects", "saturationInterpolation", "nanInterpolation")
+
+    def checkSteps(self, metadata, numSensors, numAmps, peakMemory=False):
+        """Check the step timings recorded in the task metadata"""
+        for name in self.steps:
+            counts = metadata.getArray(name + "StepCount")
+            self.assertEqual(len(counts), numSensors)
+            if name in ("convertIntToFloat", "saturationDetection", "overscan"):
+                self.assertEqual(set(counts), {numAmps})
+            else:
+                self.assertGreaterEqual(min(counts), 1)
+            for key in ("WallTime", "CpuTime"):
+                values = metadata.getArray(name + "Step" + key)
+                self.assertEqual(len(values), numSensors)
+                self.assertTrue(all(value >= 0.0 for value in values))
+            self.assertEqual(metadata.exists(name + "StepPeakMemory"), peakMemory)
+
+    def testRunDataRef(self):
+        """runDataRef records the timings of each step"""
+        task = MonocamIsrTask(config=makeIsrConfig(doStepTiming=True))
+        result = task.runDataRef(self.dataRefs[0])
+        self.checkSteps(task.metadata, 1, len(result.exposure.getDetector()))
+        self.assertIsNone(task._stepTimer)
+
+        wasTracing = tracemalloc.is_tracing()
+        task = MonocamIsrTask(config=makeIsrConfig(doStepTiming=True, doStepMemory=True))
+        task.runDataRef(self.dataRefs[0])
+        self.checkSteps(task.metadata, 1, len(result.exposure.getDetector()), peakMemory=True)
+        self.assertEqual(tracemalloc.is_tracing(), wasTracing)
+
+    def testRun(self):
+        """run alone doesn't time steps; readDataRef times its reads"""
+        task = MonocamIsrTask(config=makeIsrConfig(doStepTiming=True))
+        data = task.readDataRef(self.dataRefs[0])
+        self.assertEqual(list(data.stepTimer.toDict()), ["readRaw", "readCalibs"])
+        task.run(task.assembleAmps(data.ampExposures), **data.isrData.getDict())
+        self.assertFalse(any("Step" in name for name in task.metadata.names()))
+
+    def testStream(self):
+        """runDataRefStream records the timings of each sensor, including
+        the reads done ahead"""
+        with tempfile.NamedTemporaryFile(suffix=".json") as temp:
+            config = makeIsrConfig(doStepTiming=True, prefetchDepth=2, stepTimingFile=temp.name)
+            task = MonocamIsrTask(config=config)
+            results = list(task.runDataRefStream(self.dataRefs))
+            with open(temp.name) as fd:
+                records = [json.loads(line) for line in fd]
+        self.checkSteps(task.metadata, len(self.visits), len(results[0].exposure.getDetector()))
+        self.assertEqual([record["dataId"]["visit"] for record in records], self.visits)
+        for record in records:
+            self.assertEqual(record["steps"]["readRaw"]["count"], 1)
+            self.assertEqual(record["steps"]["assembly"]["count"], 1)
+
+
+class BandedTestCase(SyntheticTestCase):
+    """Test processing a sensor a band of rows at a time"""
+
+    def checkBanded(self, root, bandRows):
+        """Check that banded processing matches processing the whole frame
+
+        @param root  Root of repository
+        @param bandRows  Number of rows in each band
+        """
+        butler = dafPersist.Butler(root=root)
+        dataRef = butler.dataRef("raw", visit=self.visits[0])
+        # Configurations supported by banded processing
+        kwargs = dict(overscanFitType="MEDIAN", varianceFloorEstimator="HISTOGRAM", flatScalingType="USER")
+        expected = MonocamIsrTask(config=makeIsrConfig(**kwargs)).runDataRef(dataRef)
+        result = MonocamIsrTask(config=makeIsrConfig(bandRows=bandRows, **kwargs)).runDataRef(dataRef)
+        self.assertEqual(result.exposure.getBBox(), expected.exposure.getBBox())
+        self.assertMaskedImagesAlmostEqual(result.exposure.getMaskedImage(),
+                                           expected.exposure.getMaskedImage(), rtol=1.0e-5, atol=1.0e-3)
+
+    def testNoSidecar(self):
+        """Calibrations without sidecars are read in full"""
+        filename = self.butler.get("bias_filename", visit=self.visits[0])[0]
+        self.assertFalse(hasSidecar(filename))
+        # The amplifiers are 2002 rows high: the bands straddle their
+        # boundaries, and the last band is short
+        self.checkBanded(self.root, 300)
+
+    def testSidecar(self):
+        """Calibrations with sidecars are memory-mapped"""
+        root = getSyntheticRepo(sidecars=True)
+        filename = dafPersist.Butler(root=root).get("bias_filename", visit=self.visits[0])[0]
+        self.assertTrue(hasSidecar(filename))
+        for bandRows in (777, 2002):
+            self.checkBanded(root, bandRows)
+
+
+class BatchTestCase(SyntheticTestCase):
+    """Test processing sensors with a pool of processes"""
+
+    def setUp(self):
+        SyntheticTestCase.setUp(self)
+        # Write the results to a repository of our own, leaving the shared
+        # synthetic repository untouched
+        self.output = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output, ignore_errors=True)
+        outputButler = dafPersist.Butler(inputs=self.root, outputs=self.output)
+        self.outputRefs = [outputButler.dataRef("raw", visit=visit) for visit in self.visits]
+
+    def tearDown(self):
+        SyntheticTestCase.tearDown(self)
+        del self.outputRefs
+
+    def testRunBatch(self):
+        """The results persisted by runBatch match runDataRef"""
+        task = MonocamIsrTask(config=makeIsrConfig(doWrite=True))
+        self.assertEqual(task.runBatch(self.outputRefs, 2), [])
+        self.assertFalse(self.butler.datasetExists("postISRCCD", visit=self.visits[0]))
+        expected = MonocamIsrTask(config=makeIsrConfig())
+        for visit, dataRef in zip(self.visits, self.dataRefs):
+            exposure = dafPersist.Butler(root=self.output).get("postISRCCD", visit=visit)
+            self.assertMaskedImagesEqual(exposure.getMaskedImage(),
+                                         expected.runDataRef(dataRef).exposure.getMaskedImage())
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+def teardown_module(module):
+    if _syntheticDir is not None:
+        shutil.rmtree(_syntheticDir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
@@ -0,0 +1,104 @@
+#
+# LSST Data Management System
+# Copyright 2016 LSST Corporation.
+#
+# This product includes software developed by the
+# LSST Project (http://www.lsst.org/).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the LSST License Statement and
+# the GNU General Public License along with this program.  If not,
+# see <http://www.lsstcorp.org/LegalNotices/>.
+#
+
+
+import os
+import shutil
+import tempfile
+import unittest
+import unittest.mock
+
+import lsst.utils.tests
+from lsst.obs.monocam.policyCache import readPolicy
+
+
+class PolicyCacheTestCase(lsst.utils.tests.TestCase):
+    """Test the cache of parsed policies"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cacheDir = os.path.join(self.directory, "cache")
+        self.policyFile = os.path.join(self.directory, "testMapper.yaml")
+        self.writePolicy(1)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def writePolicy(self, value):
+        with open(self.policyFile, "w") as fd:
+            fd.write("camera: \"camera\"\nvalue: %d\n" % (value,))
+
+    def testCache(self):
+        policy = readPolicy(self.policyFile, cacheDir=self.cacheDir)
+        self.assertEqual(policy["value"], 1)
+        self.assertEqual(len(os.listdir(self.cacheDir)), 1)
+
+        # Returned policies are copies
+        policy["value"] = 3
+        self.assertEqual(readPolicy(self.policyFile, cacheDir=self.cacheDir)["value"], 1)
+
+        # Changing the file invalidates the cache
+        self.writePolicy(2)
+        self.assertEqual(readPolicy(self.policyFile, cacheDir=self.cacheDir)["value"], 2)
+        self.assertEqual(len(os.listdir(self.cacheDir)), 2)
+
+    def testUnwritable(self):
+        """An unusable cache directory is not an error"""
+        notDirectory = os.path.join(self.directory, "file")
+        with open(notDirectory, "w"):
+            pass
+        policy = readPolicy(self.policyFile, cacheDir=notDirectory)
+        self.assertEqual(policy["value"], 1)
+
+    def testOptIn(self):
+        """Nothing is written to disk unless $OBS_MONOCAM_CACHE_DIR is set"""
+        home = os.path.join(self.directory, "home")
+        os.mkdir(home)
+        environ = {"HOME": home, "XDG_CACHE_HOME": os.path.join(home, ".cache")}
+        with unittest.mock.patch.dict(os.environ, environ):
+            os.environ.pop("OBS_MONOCAM_CACHE_DIR", None)
+            self.assertEqual(readPolicy(self.policyFile)["value"], 1)
+            self.assertEqual(os.listdir(home), [])
+            self.assertFalse(os.path.exists(self.cacheDir))
+
+            # The in-memory cache still sees changes to the file
+            self.writePolicy(2)
+            self.assertEqual(readPolicy(self.policyFile)["value"], 2)
+
+            os.environ["OBS_MONOCAM_CACHE_DIR"] = self.cacheDir
+            self.writePolicy(3)
+            self.assertEqual(readPolicy(self.policyFile)["value"], 3)
+            self.assertEqual(len(os.listdir(self.cacheDir)), 1)
+            self.assertEqual(os.listdir(home), [])
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
@@ -0,0 +1,84 @@
+#
+# LSST Data Management System
+# Copyright 2016 LSST Corporation.
+#
+# This product includes software developed by the
+# LSST Project (http://www.lsst.org/).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the LSST License Statement and
+# the GNU General Public License along with this program.  If not,
+# see <http://www.lsstcorp.org/LegalNotices/>.
+#
+
+
+import threading
+import unittest
+
+import lsst.utils.tests
+from lsst.obs.monocam.prefetch import Prefetcher
+
+
+class PrefetcherTestCase(lsst.utils.tests.TestCase):
+    """Test reading ahead in a background thread"""
+
+    def testOrder(self):
+        results = list(Prefetcher(lambda x: 2*x, range(10), depth=3))
+        self.assertEqual(results, [(x, 2*x) for x in range(10)])
+
+    def testError(self):
+        def func(x):
+            if x == 3:
+                raise RuntimeError("Failed on %d" % x)
+            return x
+
+        seen = []
+        with self.assertRaises(RuntimeError):
+            for data, result in Prefetcher(func, range(10)):
+                seen.append(result)
+        self.assertEqual(seen, [0, 1, 2])
+
+    def testBounds(self):
+        """The producer should not get more than depth results ahead"""
+        depth = 2
+        started = []
+        lock = threading.Lock()
+
+        def func(x):
+            with lock:
+                started.append(x)
+            return x
+
+        for data, result in Prefetcher(func, range(10), depth=depth, maxBytes=1000,
+                                       sizeFunc=lambda result: 1):
+            with lock:
+                # The current item, up to depth queued, and one in flight
+                self.assertLessEqual(len(started), data + depth + 2)
+
+    def testMaxBytes(self):
+        """A single oversized result should not stall the iteration"""
+        results = list(Prefetcher(lambda x: x, range(5), depth=3, maxBytes=1,
+                                  sizeFunc=lambda result: 100))
+        self.assertEqual(len(results), 5)
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
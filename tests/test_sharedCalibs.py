@@ -0,0 +1,109 @@
+#
+# LSST Data Management System
+# Copyright 2016 LSST Corporation.
+#
+# This product includes software developed by the
+# LSST Project (http://www.lsst.org/).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the LSST License Statement and
+# the GNU General Public License along with this program.  If not,
+# see <http://www.lsstcorp.org/LegalNotices/>.
+#
+#
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+import lsst.utils.tests
+import lsst.geom as geom
+import lsst.afw.image as afwImage
+from lsst.obs.monocam.monocam import getMonocamCamera
+from lsst.obs.monocam.monocamMapper import defineFilters
+from lsst.obs.monocam.sharedCalibs import SharedCalibStore, mapArray
+
+
+class SharedCalibStoreTestCase(lsst.utils.tests.TestCase):
+    """Test sharing calibrations through memory-mapped arrays"""
+
+    def setUp(self):
+        defineFilters()
+        self.directory = tempfile.mkdtemp()
+        self.camera = getMonocamCamera()
+        self.key = ("bias", "/path/to/bias-2016-05-05.fits.gz")
+        bbox = geom.Box2I(geom.Point2I(2, 3), geom.Extent2I(10, 8))
+        self.exposure = afwImage.ExposureF(bbox)
+        rng = numpy.random.RandomState(12345)
+        maskedImage = self.exposure.getMaskedImage()
+        maskedImage.getImage().getArray()[:] = rng.normal(1000.0, 5.0, size=(8, 10))
+        maskedImage.getMask().getArray()[:] = rng.randint(0, 4, size=(8, 10))
+        maskedImage.getVariance().getArray()[:] = rng.uniform(1.0, 2.0, size=(8, 10))
+        self.exposure.setDetector(self.camera[0])
+        self.exposure.setFilter(afwImage.Filter("NONE"))
+        self.exposure.getInfo().setVisitInfo(afwImage.VisitInfo(exposureTime=30.0, darkTime=31.0))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testRoundTrip(self):
+        """A calibration read from the store matches what was put"""
+        store = SharedCalibStore(self.directory)
+        self.assertFalse(store.has(self.key))
+        self.assertIsNone(store.get(self.key, self.camera))
+        store.put(self.key, self.exposure)
+        self.assertTrue(store.has(self.key))
+
+        # As in another process
+        exposure = SharedCalibStore(self.directory).get(self.key, self.camera)
+        self.assertEqual(exposure.getBBox(), self.exposure.getBBox())
+        self.assertMaskedImagesEqual(exposure.getMaskedImage(), self.exposure.getMaskedImage())
+        self.assertEqual(exposure.getDetector().getName(), self.camera[0].getName())
+        self.assertEqual(exposure.getFilter().getName(), "NONE")
+        visitInfo = exposure.getInfo().getVisitInfo()
+        self.assertEqual(visitInfo.getExposureTime(), 30.0)
+        self.assertEqual(visitInfo.getDarkTime(), 31.0)
+
+    def testCopyOnWrite(self):
+        """Modifying a calibration read from the store doesn't modify the
+        stored arrays"""
+        store = SharedCalibStore(self.directory)
+        store.put(self.key, self.exposure)
+        exposure = store.get(self.key, self.camera)
+        exposure.getMaskedImage().getImage().getArray()[:] = 0.0
+        exposure.getMaskedImage().getMask().getArray()[:] |= 0x10
+        exposure.getInfo().setVisitInfo(afwImage.VisitInfo(exposureTime=1.0))
+        other = SharedCalibStore(self.directory).get(self.key, self.camera)
+        self.assertMaskedImagesEqual(other.getMaskedImage(), self.exposure.getMaskedImage())
+
+        # Later reads in the same process are not affected either
+        again = store.get(self.key, self.camera)
+        self.assertIsNot(again, exposure)
+        self.assertMaskedImagesEqual(again.getMaskedImage(), self.exposure.getMaskedImage())
+        self.assertEqual(again.getInfo().getVisitInfo().getExposureTime(), 30.0)
+        basename = store._getBasename(self.key)
+        self.assertFloatsEqual(mapArray(basename + ".image.npy"),
+                               self.exposure.getMaskedImage().getImage().getArray())
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
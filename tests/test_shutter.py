@@ -0,0 +1,103 @@
+#
+# LSST Data Management System
+# Copyright 2016 LSST Corporation.
+#
+# This product includes software developed by the
+# LSST Project (http://www.lsst.org/).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the LSST License Statement and
+# the GNU General Public License along with this program.  If not,
+# see <http://www.lsstcorp.org/LegalNotices/>.
+#
+
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import lsst.utils.tests
+import lsst.daf.base as dafBase
+from lsst.obs.monocam.shutter import ShutterDatabase
+
+
+class ShutterDatabaseTestCase(lsst.utils.tests.TestCase):
+    """Test applying matched shutter headers"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.camera = os.path.join(self.directory, "camera.fits")
+        self.unmatched = os.path.join(self.directory, "unmatched.fits")
+        for filename in (self.camera, self.unmatched):
+            with open(filename, "w"):
+                pass
+        self.link = os.path.join(self.directory, "link.fits")
+        os.symlink(self.camera, self.link)
+
+        # Schema as written by suckMetadata.py
+        self.dbFile = os.path.join(self.directory, "monocam.sqlite")
+        conn = sqlite3.connect(self.dbFile)
+        conn.execute("CREATE TABLE shutter (id INTEGER PRIMARY KEY AUTOINCREMENT, filename TEXT, "
+                     "date TEXT, object TEXT, type TEXT, filter TEXT, ra DOUBLE, decl DOUBLE, "
+                     "expTime DOUBLE)")
+        conn.execute("CREATE TABLE camera (id INTEGER PRIMARY KEY AUTOINCREMENT, filename TEXT, "
+                     "date TEXT, expTime DOUBLE)")
+        conn.execute("CREATE UNIQUE INDEX camera_filename ON camera (filename)")
+        conn.execute("CREATE TABLE match (camera INTEGER PRIMARY KEY, shutter INTEGER UNIQUE, "
+                     "dt DOUBLE, expTimeDiff DOUBLE)")
+        conn.execute("INSERT INTO shutter VALUES (7, 'shutter.fits', '2016-05-05T03:17:08.93', 'M67', "
+                     "'object', 'g', 132.75, 11.8, 30.0)")
+        conn.execute("INSERT INTO camera VALUES (3, ?, '2016-05-05T03:17:09.5', 30.0)", (self.camera,))
+        conn.execute("INSERT INTO camera VALUES (4, ?, '2016-05-05T04:00:00.0', 30.0)", (self.unmatched,))
+        conn.execute("INSERT INTO match VALUES (3, 7, 0.57, 0.0)")
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testApply(self):
+        database = ShutterDatabase(self.dbFile)
+        md = dafBase.PropertyList()
+        md.set("OBJECT", "UNKNOWN")
+        md.set("EXPTIME", 30.5)
+        self.assertTrue(database.apply(self.link, md))
+        self.assertEqual(md.getScalar("OBJECT"), "M67")
+        self.assertEqual(md.getScalar("FILTER"), "g")
+        self.assertEqual(md.getScalar("DATE-OBS"), "2016-05-05T03:17:08.93")
+        self.assertAlmostEqual(md.getScalar("RA"), 8.85)
+        self.assertAlmostEqual(md.getScalar("DEC"), 11.8)
+        self.assertEqual(md.getScalar("EXPTIME"), 30.5)
+
+        md = dafBase.PropertyList()
+        self.assertFalse(database.apply(self.unmatched, md))
+        self.assertEqual(md.names(), [])
+
+        # Lookups are cached
+        database.lookup(self.link)
+        self.assertGreater(database.cache.hits, 0)
+        database.close()
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
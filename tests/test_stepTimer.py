@@ -0,0 +1,152 @@
+#
+# LSST Data Management System
+# Copyright 2016 LSST Corporation.
+#
+# This product includes software developed by the
+# LSST Project (http://www.lsst.org/).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the LSST License Statement and
+# the GNU General Public License along with this program.  If not,
+# see <http://www.lsstcorp.org/LegalNotices/>.
+#
+
+
+import json
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy
+
+import lsst.utils.tests
+import lsst.daf.base as dafBase
+from lsst.obs.monocam.stepTimer import StepTimer
+
+
+class StepTimerTestCase(lsst.utils.tests.TestCase):
+    """Test the timing of steps"""
+
+    def testAccumulate(self):
+        """Repeated steps are summed, including from several threads"""
+        timer = StepTimer()
+        with timer.step("sleep"):
+            time.sleep(0.02)
+
+        def work(index):
+            with timer.step("work"):
+                time.sleep(0.01)
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(work, range(8)))
+        with self.assertRaises(RuntimeError):
+            with timer.step("sleep"):
+                raise RuntimeError("Steps that fail are still timed")
+
+        steps = timer.toDict()
+        self.assertEqual(list(steps), ["sleep", "work"])
+        self.assertEqual(steps["sleep"]["count"], 2)
+        self.assertEqual(steps["work"]["count"], 8)
+        self.assertGreaterEqual(steps["sleep"]["wallTime"], 0.02)
+        self.assertGreaterEqual(steps["work"]["wallTime"], 0.08)
+        # Sleeping doesn't use the CPU
+        self.assertLess(steps["work"]["cpuTime"], steps["work"]["wallTime"])
+        self.assertNotIn("peakMemory", steps["sleep"])
+
+    def testMemory(self):
+        timer = StepTimer(traceMemory=True)
+        with timer.step("allocate"):
+            array = numpy.ones(1000000)
+            del array
+        with timer.step("nothing"):
+            pass
+        timer.close()
+        steps = timer.toDict()
+        self.assertGreaterEqual(steps["allocate"]["peakMemory"], 8000000)
+        self.assertLess(steps["nothing"]["peakMemory"], 100000)
+
+    def testStopTracing(self):
+        """Tracing started by the timers stops when the last is closed"""
+        if tracemalloc.is_tracing():
+            self.skipTest("Memory was already being traced")
+        first = StepTimer(traceMemory=True)
+        second = StepTimer(traceMemory=True)
+        self.assertTrue(tracemalloc.is_tracing())
+        first.close()
+        self.assertTrue(tracemalloc.is_tracing())
+        second.close()
+        second.close()  # Closing twice is harmless
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def testConcurrentMemory(self):
+        """Steps that overlap with another step don't record the peak memory,
+        which is process-wide"""
+        timer = StepTimer(traceMemory=True)
+        barrier = threading.Barrier(2)
+
+        def work(index):
+            with timer.step("work"):
+                barrier.wait()
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            list(executor.map(work, range(2)))
+        with timer.step("alone"):
+            pass
+        timer.close()
+        steps = timer.toDict()
+        self.assertEqual(steps["work"]["count"], 2)
+        self.assertNotIn("peakMemory", steps["work"])
+        self.assertIn("peakMemory", steps["alone"])
+
+    def testRecord(self):
+        metadata = dafBase.PropertyList()
+        for _ in range(2):
+            timer = StepTimer()
+            with timer.step("bias"):
+                pass
+            timer.record(metadata)
+        self.assertEqual(metadata.getArray("biasStepCount"), [1, 1])
+        self.assertEqual(len(metadata.getArray("biasStepWallTime")), 2)
+        self.assertTrue(metadata.exists("biasStepCpuTime"))
+        self.assertFalse(metadata.exists("biasStepPeakMemory"))
+
+    def testJson(self):
+        timer = StepTimer()
+        with timer.step("flat"):
+            pass
+        with tempfile.NamedTemporaryFile(suffix=".json") as temp:
+            timer.writeJson(temp.name, dataId=dict(visit=12, ccd=0))
+            timer.writeJson(temp.name)
+            with open(temp.name) as fd:
+                records = [json.loads(line) for line in fd]
+        self.assertEqual(len(records), 2)
+        self.assertEqual(records[0]["dataId"], dict(visit=12, ccd=0))
+        self.assertIsNone(records[1]["dataId"])
+        self.assertEqual(records[0]["pid"], os.getpid())
+        self.assertEqual(records[0]["steps"]["flat"]["count"], 1)
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
@@ -0,0 +1,237 @@
+#
+# LSST Data Management System
+# Copyright 2016 LSST Corporation.
+#
+# This product includes software developed by the
+# LSST Project (http://www.lsst.org/).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the LSST License Statement and
+# the GNU General Public License along with this program.  If not,
+# see <http://www.lsstcorp.org/LegalNotices/>.
+#
+#
+import datetime
+import importlib.util
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import unittest.mock
+
+import astropy.io.fits
+
+import lsst.utils.tests
+
+
+def loadScript(name):
+    """Import a script from bin.src as a module"""
+    filename = os.path.join(os.path.dirname(__file__), os.pardir, "bin.src", name + ".py")
+    spec = importlib.util.spec_from_file_location(name, filename)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+suckMetadata = loadScript("suckMetadata")
+
+
+class SuckMetadataTestCase(lsst.utils.tests.TestCase):
+    """Test reading camera headers into the database"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        suckMetadata.createDatabase(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def writeCamera(self, name, date, expTime=30.0):
+        """Write the header of a camera file"""
+        header = astropy.io.fits.Header()
+        header["DATE-OBS"] = date
+        if expTime is not None:
+            header["EXPTIME"] = expTime
+        filename = os.path.join(self.directory, name + ".fits")
+        astropy.io.fits.PrimaryHDU(header=header).writeto(filename, overwrite=True)
+        return filename
+
+    def suck(self, filenames, **kwargs):
+        suckMetadata.suckMetadata(self.directory, "camera", suckMetadata.CAMERA, filenames, **kwargs)
+
+    def readTable(self, table="camera"):
+        """Return the rows of a table, indexed by filename"""
+        conn = sqlite3.connect(os.path.join(self.directory, "monocam.sqlite"))
+        conn.row_factory = sqlite3.Row
+        try:
+            return {row["filename"]: tuple(row) for row in conn.execute("SELECT * FROM %s" % (table,))}
+        finally:
+            conn.close()
+
+    def testResume(self):
+        """Files already in the database are skipped unless forced"""
+        first = self.writeCamera("first", "2016-05-05T03:17:09.5")
+        self.suck([first])
+        rows = self.readTable()
+        self.assertEqual(rows[first][2:], ("2016-05-05T03:17:09.5", 30.0))
+
+        # A repeated run reads only the new file
+        second = self.writeCamera("second", "2016-05-05T03:18:00.0")
+        self.writeCamera("first", "2016-05-05T03:17:10.0", expTime=60.0)
+        self.suck([first, second])
+        rows = self.readTable()
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[first][2:], ("2016-05-05T03:17:09.5", 30.0))
+        self.assertEqual(rows[second][2:], ("2016-05-05T03:18:00.0", 30.0))
+
+        # Forcing updates the rows in place
+        self.suck([first, second], force=True)
+        updated = self.readTable()
+        self.assertEqual(len(updated), 2)
+        self.assertEqual(updated[first], (rows[first][0], first, "2016-05-05T03:17:10.0", 60.0))
+        self.assertEqual(updated[second], rows[second])
+
+    def testBatches(self):
+        """Rows and errors are written in batches"""
+        filenames = [self.writeCamera("file%d" % ii, "2016-05-05T03:%02d:00.0" % ii) for ii in range(4)]
+        bad = self.writeCamera("bad", "2016-05-05T04:00:00.0", expTime=None)
+        filenames.append(bad)
+        with unittest.mock.patch.object(suckMetadata, "writeRows", wraps=suckMetadata.writeRows) as mock:
+            self.suck(filenames, batchSize=2)
+        self.assertEqual([len(call[0][3]) + len(call[0][4]) for call in mock.call_args_list], [2, 2, 1])
+        self.assertEqual(set(self.readTable()), set(filenames[:-1]))
+        errors = self.readTable("errors")
+        self.assertEqual(list(errors), [bad])
+        self.assertEqual(errors[bad][1], "camera")
+
+        # Reading the file successfully clears the error
+        self.writeCamera("bad", "2016-05-05T04:00:00.0")
+        self.suck([bad], force=True)
+        self.assertEqual(set(self.readTable()), set(filenames))
+        self.assertEqual(self.readTable("errors"), {})
+
+    def testDuplicates(self):
+        """Duplicate rows in an old database are removed, keeping the latest"""
+        filename = os.path.join(self.directory, "old.sqlite")
+        conn = sqlite3.connect(filename)
+        conn.execute("CREATE TABLE camera (id INTEGER PRIMARY KEY AUTOINCREMENT, filename TEXT, "
+                     "date TEXT, expTime DOUBLE)")
+        conn.executemany("INSERT INTO camera VALUES (?, ?, ?, ?)",
+                         [(1, "a.fits", "2016-05-05T03:00:00.0", 30.0),
+                          (2, "b.fits", "2016-05-05T03:01:00.0", 30.0),
+                          (3, "a.fits", "2016-05-05T03:02:00.0", 60.0)])
+        conn.commit()
+        suckMetadata.createTable(conn, "camera", suckMetadata.CAMERA)
+        self.assertEqual(list(conn.execute("SELECT id, filename, expTime FROM camera ORDER BY id")),
+                         [(2, "b.fits", 30.0), (3, "a.fits", 60.0)])
+        with self.assertRaises(sqlite3.IntegrityError):
+            conn.execute("INSERT INTO camera (filename) VALUES ('b.fits')")
+        conn.close()
+
+    def testSqliteVersion(self):
+        """An SQLite without upserts is reported clearly"""
+        filename = self.writeCamera("file", "2016-05-05T03:17:09.5")
+        with unittest.mock.patch.object(sqlite3, "sqlite_version_info", (3, 22, 0)):
+            with self.assertRaises(RuntimeError):
+                self.suck([filename])
+        self.assertEqual(self.readTable(), {})
+
+
+class MatchTestCase(lsst.utils.tests.TestCase):
+    """Test matching camera files to shutter files"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        suckMetadata.createDatabase(self.directory)
+        self.start = datetime.datetime(2016, 5, 5, 3, 0, 0)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def date(self, seconds):
+        """Return the ISO date for a number of seconds after the start"""
+        return (self.start + datetime.timedelta(seconds=seconds)).isoformat()
+
+    def match(self, camera, shutter, **kwargs):
+        """Match camera files to shutter files
+
+        @param camera  List of (time, exposure time) for camera files
+        @param shutter  List of (time, exposure time) for shutter files
+        @param **kwargs  Arguments for matchCameraShutter
+        @return dict of shutter index for each matched camera index
+        """
+        conn = suckMetadata.getDatabase(self.directory)
+        with conn:
+            for table, rows in (("camera", camera), ("shutter", shutter)):
+                conn.execute("DELETE FROM %s" % (table,))
+                conn.executemany("INSERT INTO %s (id, filename, date, expTime) VALUES (?, ?, ?, ?)" %
+                                 (table,), [(ii, "%s%d.fits" % (table, ii), self.date(time), expTime) for
+                                            ii, (time, expTime) in enumerate(rows)])
+        suckMetadata.matchCameraShutter(self.directory, **kwargs)
+        result = {camera: shutter for camera, shutter in conn.execute("SELECT camera, shutter FROM match")}
+        conn.close()
+        return result
+
+    def testParseDate(self):
+        parseDate = suckMetadata.parseDate
+        self.assertAlmostEqual(parseDate("2016-05-05T03:17:08.93") - parseDate("2016-05-05"),
+                               3*3600 + 17*60 + 8.93, places=6)
+        self.assertEqual(parseDate("2016-05-05T00:00:01") - parseDate("2016-05-04T23:59:59"), 2.0)
+        self.assertEqual(parseDate("2016-05-05T03:17:08.5Z"), parseDate("2016-05-05T03:17:08.5"))
+        with self.assertRaises(ValueError):
+            parseDate("not a date")
+
+    def testNearest(self):
+        """Each camera file is matched to the nearest shutter file"""
+        shutter = [(0.0, 30.0), (40.0, 30.0), (80.0, 30.0)]
+        self.assertEqual(self.match([(41.0, 30.0), (3.0, 30.0), (200.0, 30.0)], shutter), {0: 1, 1: 0})
+        self.assertEqual(self.match([(44.0, 30.0)], shutter, offset=4.0), {0: 1})
+        self.assertEqual(self.match([(44.0, 30.0)], shutter, tolerance=3.0), {})
+
+    def testExpTime(self):
+        """Exposure times must agree, where known"""
+        shutter = [(0.0, 30.0), (40.0, None)]
+        self.assertEqual(self.match([(1.0, 15.0)], shutter), {})
+        self.assertEqual(self.match([(1.0, 30.2)], shutter), {0: 0})
+        self.assertEqual(self.match([(39.0, 15.0)], shutter), {0: 1})
+        self.assertEqual(self.match([(1.0, 15.0)], shutter, expTimeTolerance=20.0), {0: 0})
+
+    def testDuplicates(self):
+        """Matches are one-to-one, and the loser tries the next shutter file"""
+        shutter = [(0.0, 30.0), (4.0, 30.0)]
+        # Both are nearest shutter file 0; camera 1 falls back to shutter 1
+        self.assertEqual(self.match([(1.0, 30.0), (1.5, 30.0)], shutter), {0: 0, 1: 1})
+        # ... unless that is beyond the tolerance
+        self.assertEqual(self.match([(1.0, 30.0), (1.5, 30.0)], shutter, tolerance=2.0), {0: 0})
+        # ... or taken by a closer camera file
+        self.assertEqual(self.match([(1.0, 30.0), (1.5, 30.0), (4.5, 30.0)], shutter), {0: 0, 2: 1})
+
+    def testTies(self):
+        """Ties go to the earlier file"""
+        self.assertEqual(self.match([(9.0, 30.0), (11.0, 30.0)], [(10.0, 30.0)]), {0: 0})
+        self.assertEqual(self.match([(5.0, 30.0)], [(4.0, 30.0), (6.0, 30.0)]), {0: 0})
+        self.assertEqual(self.match([(5.0, 30.0), (5.0, 30.0)], [(4.0, 30.0), (6.0, 30.0)]),
+                         {0: 0, 1: 1})
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
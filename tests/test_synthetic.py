@@ -0,0 +1,91 @@
+#
+# LSST Data Management System
+# Copyright 2016 LSST Corporation.
+#
+# This product includes software developed by the
+# LSST Project (http://www.lsst.org/).
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the LSST License Statement and
+# the GNU General Public License along with this program.  If not,
+# see <http://www.lsstcorp.org/LegalNotices/>.
+#
+
+
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+import astropy.io.fits
+
+import lsst.utils.tests
+from lsst.obs.monocam.ingest import parseCalibId
+from lsst.obs.monocam.monocam import getMonocamCamera
+from lsst.obs.monocam.synthetic import BIAS_LEVEL, makeRawHeader, writeRaw, writeCalib
+
+
+class SyntheticTestCase(lsst.utils.tests.TestCase):
+    """Test the geometry and headers of the synthetic data"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.detector = getMonocamCamera()[0]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def testRaw(self):
+        filename = os.path.join(self.directory, "raw.fits")
+        header = makeRawHeader(12, datetime.datetime(2016, 5, 4, 3, 0, 0), "SDSSG", "field", 30.0)
+        writeRaw(filename, header)
+        with astropy.io.fits.open(filename) as hduList:
+            self.assertEqual(len(hduList), 1 + len(self.detector))
+            self.assertEqual(hduList[0].header["VISIT"], 12)
+            self.assertEqual(hduList[0].header["DATE-OBS"], "2016-05-04T03:00:00.000")
+            self.assertEqual(hduList[0].header["RA"], "15:32:00.00")
+            for amp, hdu in zip(self.detector, hduList[1:]):
+                dims = amp.getRawBBox().getDimensions()
+                self.assertEqual(hdu.data.shape, (dims.getY(), dims.getX()))
+                self.assertEqual(hdu.data.dtype, numpy.uint16)
+                overscan = hdu.data[amp.getRawHorizontalOverscanBBox().getSlices()]
+                data = hdu.data[amp.getRawDataBBox().getSlices()]
+                self.assertFloatsAlmostEqual(overscan.mean(), BIAS_LEVEL, atol=1.0)
+                self.assertGreater(data.mean(), BIAS_LEVEL + 100)
+
+    def testCalib(self):
+        filename = os.path.join(self.directory, "flat", "flat.fits.gz")
+        writeCalib(filename, "flat", "2016-05-05", "SDSSR")
+        dims = self.detector.getBBox().getDimensions()
+        with astropy.io.fits.open(filename) as hduList:
+            self.assertEqual(hduList[0].data.shape, (dims.getY(), dims.getX()))
+            self.assertFloatsAlmostEqual(hduList[0].data.mean(), 1.0, atol=1.0e-3)
+            self.assertEqual(hduList[0].header["OBSTYPE"], "flat")
+            self.assertEqual(parseCalibId(hduList[0].header["CALIB_ID"]),
+                             {"calibDate": "2016-05-05", "filter": "SDSSR", "ccd": "0"})
+        with self.assertRaises(ValueError):
+            writeCalib(filename, "fringe", "2016-05-05")
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
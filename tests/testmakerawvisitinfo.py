@@ -109,6 +109,32 @@ class GetRawTestCase(lsst.utils.tests.TestCase):
         self.assertAnglesNearlyEqual(observatory.getLatitude(), raw_visit_info['obs_latitude'])
         self.assertAlmostEqual(observatory.getElevation(), raw_visit_info['obs_elevation'])
 
+    def testRawAmps(self):
+        """Test retrieval of all amps of a raw image in a single read"""
+        ampExposures = self.butler.get("raw_amps", visit=fitsvisit[0])
+        self.assertEqual(len(ampExposures), 16)
+        visitInfo = ampExposures[0].getInfo().getVisitInfo()
+        for channel, exp in enumerate(ampExposures, 1):
+            ampExp = self.butler.get("raw_amp", visit=fitsvisit[0], channel=channel)
+            self.assertImagesEqual(exp.getImage(), ampExp.getImage())
+            self.assertEqual(exp.getDetector().getId(), self.dataId["ccdnum"])
+            self.assertEqual(exp.getInfo().getVisitInfo(), visitInfo)
+        self.assertEqual(visitInfo.getExposureTime(), raw_visit_info['exposureTime'])
+        self.assertEqual(visitInfo.getDarkTime(), raw_visit_info['darkTime'])
+
+    def testRawAmpVisitData(self):
+        """Test that amps of a visit share the visit data, but not metadata"""
+        ampExp1 = self.butler.get("raw_amp", visit=fitsvisit[0], channel=1)
+        ampExp2 = self.butler.get("raw_amp", visit=fitsvisit[0], channel=2)
+        self.assertEqual(ampExp1.getInfo().getVisitInfo(), ampExp2.getInfo().getVisitInfo())
+        self.assertEqual(ampExp1.getInfo().getVisitInfo().getExposureTime(), raw_visit_info['exposureTime'])
+        self.assertEqual(ampExp1.getWcs(), ampExp2.getWcs())
+        # Keywords consumed by the VisitInfo have been removed from the
+        # metadata
+        self.assertFalse(ampExp1.getMetadata().exists("EXPTIME"))
+        ampExp1.getMetadata().set("TESTKEY", 1)
+        self.assertFalse(ampExp2.getMetadata().exists("TESTKEY"))
+
 #     def testRawMetadata(self):
 #         """Test retrieval of metadata"""
 #         md = self.butler.get("calibs")